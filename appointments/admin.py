@@ -1,5 +1,14 @@
-from django.contrib import admin
-from .models import CustomUser, BarberService, Scheduling
+from django.contrib import admin, messages
+from .forms.scheduling_forms import RecurrenceRuleForm
+from .models import (
+    CustomUser, BarberService, Scheduling, CalendarSyncTask, RecurrenceRule,
+    WorkingHours
+)
+from .services.calendar_sync_service import (
+    build_scheduling_event, get_pending_inserts
+)
+from .services.google_calendar_service import sync_calendar_batch
+from .services.scheduling_services import transition_schedules
 
 
 @admin.register(CustomUser)
@@ -14,4 +23,107 @@ class BarberServiceAdmin(admin.ModelAdmin):
 
 @admin.register(Scheduling)
 class SchedulingAdmin(admin.ModelAdmin):
-    pass
+    actions = ['mark_completed', 'cancel_and_remove_from_calendar',
+               'sync_with_calendar']
+
+    def report_calendar_results(self, request, results):
+        """
+        Tells the user how many calendar operations failed, if any.
+        """
+        errors = [result['error'] for result in results if not result['ok']]
+        if errors:
+            self.message_user(
+                request,
+                f'{len(errors)} de {len(results)} operações na agenda '
+                f'falharam: {errors[0]}',
+                messages.WARNING)
+
+    @admin.action(description='Marcar como concluídos')
+    def mark_completed(self, request, queryset):
+        """
+        Completes the selected active schedules with a single UPDATE.
+        """
+        changed = transition_schedules(
+            queryset.values_list('pk', flat=True), 'completed')
+        self.message_user(
+            request, f'{len(changed)} agendamentos concluídos.')
+
+    @admin.action(description='Cancelar e remover da agenda')
+    def cancel_and_remove_from_calendar(self, request, queryset):
+        """
+        Cancels the selected active schedules with a single UPDATE. The
+        removal of their calendar events is queued in the outbox, see
+        `transition_schedules`. The schedules that are no longer active are
+        left alone.
+        """
+        ids = list(queryset.values_list('pk', flat=True))
+        changed = transition_schedules(ids, 'canceled')
+
+        self.message_user(
+            request, f'{len(changed)} agendamentos cancelados.')
+        skipped = len(ids) - len(changed)
+        if skipped:
+            self.message_user(
+                request,
+                f'{skipped} agendamentos ignorados: apenas agendamentos '
+                'ativos podem ser cancelados.',
+                messages.WARNING)
+
+    @admin.action(description='Sincronizar com a agenda')
+    def sync_with_calendar(self, request, queryset):
+        """
+        Writes the current state of the selected active schedules to their
+        calendar events in batch requests, creating the missing ones.
+
+        Schedules whose insert is still queued are left to the calendar
+        worker, so that their event isn't created twice.
+        """
+        schedules = list(
+            queryset.filter(status='active').select_related('service'))
+        pending = get_pending_inserts(schedules)
+        schedules = [
+            schedule for schedule in schedules if schedule.pk not in pending]
+        results = sync_calendar_batch([
+            {'action': 'patch', 'event_id': schedule.calendar_event_id,
+             'event': build_scheduling_event(schedule)}
+            if schedule.calendar_event_id else
+            {'action': 'insert', 'event': build_scheduling_event(schedule)}
+            for schedule in schedules
+        ])
+
+        for schedule, result in zip(schedules, results):
+            if result['ok'] and not schedule.calendar_event_id:
+                Scheduling.objects.filter(pk=schedule.pk).update(
+                    calendar_event_id=result['event']['id'])
+
+        self.message_user(
+            request, f'{len(schedules)} agendamentos sincronizados.')
+        if pending:
+            self.message_user(
+                request,
+                f'{len(pending)} agendamentos ignorados: a criação do evento '
+                'ainda está na fila.',
+                messages.WARNING)
+        self.report_calendar_results(request, results)
+
+
+@admin.register(WorkingHours)
+class WorkingHoursAdmin(admin.ModelAdmin):
+    list_display = ['staff', 'weekday', 'start_time', 'end_time']
+    list_filter = ['weekday', 'staff']
+
+
+@admin.register(RecurrenceRule)
+class RecurrenceRuleAdmin(admin.ModelAdmin):
+    form = RecurrenceRuleForm
+    list_display = ['client', 'service', 'staff', 'first_occurrence',
+                    'interval_weeks', 'until', 'is_active',
+                    'materialized_until']
+    list_filter = ['is_active', 'staff']
+
+
+@admin.register(CalendarSyncTask)
+class CalendarSyncTaskAdmin(admin.ModelAdmin):
+    list_display = ['pk', 'action', 'scheduling', 'status', 'attempts',
+                    'next_attempt_at']
+    list_filter = ['status', 'action']
@@ -1,9 +1,65 @@
 from django import forms
 from django.core.exceptions import ValidationError
-from ..models import Scheduling, BarberService
-from datetime import time, timedelta
+from ..models import RecurrenceRule, Scheduling, BarberService
+from ..services.barber_services import get_active_services
+from ..services.recurrence_service import find_rule_conflicts
+from ..services.staff_service import (
+    find_available_staff, get_shifts, has_service_conflict,
+    has_staff_schedule, is_working
+)
+from ..utils.metrics import BOOKING_CONFLICTS, SCHEDULE_FORM_CLEAN_SECONDS
+from datetime import timedelta
 from django.utils import timezone
 
+SCHEDULE_CONFLICT_MESSAGE = (
+    'O horário solicitado conflita com outro agendamento ativo para este '
+    'serviço.'
+)
+NO_STAFF_MESSAGE = 'Nenhum profissional está disponível neste horário.'
+# How far ahead the occurrences of a new recurrence rule are checked.
+RECURRENCE_CHECK_WEEKS = 26
+
+
+def validate_booking_time(date_time):
+    """
+    Checks that a booking starts in the future, during business hours and
+    with the minimum notice.
+
+    Args:
+        date_time (datetime | None): The start of the booking.
+
+    Returns:
+        datetime | None: The start, made aware if it was naive.
+
+    Raises:
+        ValidationError: If the start is not allowed.
+    """
+
+    if date_time:
+        if timezone.is_naive(date_time):
+            date_time = timezone.make_aware(date_time)
+
+        if date_time < timezone.now():
+            raise ValidationError(
+                'A data e hora do agendamento não podem ser no passado.'
+            )
+
+        local_time = timezone.localtime(date_time).time()
+        if not (Scheduling.OPENING_TIME <= local_time
+                <= Scheduling.CLOSING_TIME):
+            raise ValidationError(
+                'O agendamento deve ser feito durante o horário comercial '
+                '(07:00 - 17:00).'
+            )
+
+        if date_time < timezone.now() + Scheduling.MINIMUM_NOTICE:
+            raise ValidationError(
+                'O agendamento deve ser feito com pelo menos 30 minutos '
+                'de antecedência.'
+            )
+
+    return date_time
+
 
 class ScheduleForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
@@ -11,9 +67,13 @@ class ScheduleForm(forms.ModelForm):
             'instance' in kwargs) and (kwargs['instance']) else None
 
         super().__init__(*args, **kwargs)
-        self.fields[
-            'service'].queryset = BarberService.objects.filter(  # type: ignore
+        service_field = self.fields['service']
+        service_field.queryset = BarberService.objects.filter(  # type: ignore
             is_active=True)
+        # Render the options from the cached catalog instead of querying.
+        service_field.choices = [('', service_field.empty_label)] + [
+            (service.pk, str(service)) for service in get_active_services()
+        ]
 
     class Meta:
         model = Scheduling
@@ -23,54 +83,101 @@ class ScheduleForm(forms.ModelForm):
         }
 
     def clean_date_time(self):
-        date_time = self.cleaned_data.get('date_time')
+        return validate_booking_time(self.cleaned_data.get('date_time'))
+
+    def clean(self):
+        with SCHEDULE_FORM_CLEAN_SECONDS.time():
+            return self.check_availability(super().clean())
+
+    def check_availability(self, cleaned_data):
+        """
+        Checks that the chosen time is free, assigning an employee when the
+        shop has working hours.
+        """
+        service = cleaned_data.get('service')
+        date_time = cleaned_data.get('date_time')
 
-        if date_time:
-            if timezone.is_naive(date_time):
-                date_time = timezone.make_aware(date_time)
+        if service and date_time:
+            end_time = date_time + timedelta(minutes=service.duration)
 
-            if date_time < timezone.now():
-                raise ValidationError(
-                    'A data e hora do agendamento não podem ser no passado.'
-                )
+            # Bookings without an employee hold the service, even once the
+            # shop has working hours. The occupancy bitmaps rule out most
+            # free ranges without a query.
+            if has_service_conflict(service.pk, date_time, end_time,
+                                    exclude_pk=self.instance_pk):
+                BOOKING_CONFLICTS.inc(reason='conflict')
+                raise ValidationError(SCHEDULE_CONFLICT_MESSAGE)
+
+            if has_staff_schedule():
+                # Conflicts are per employee: assign one who is free.
+                staff_id = find_available_staff(
+                    date_time, end_time, exclude_pk=self.instance_pk,
+                    preferred=self.instance.staff_id)
+                if staff_id is None:
+                    BOOKING_CONFLICTS.inc(reason='no_staff')
+                    raise ValidationError(NO_STAFF_MESSAGE)
+
+                self.instance.staff_id = staff_id
+            else:
+                self.instance.staff_id = None
 
-            if not (time(7, 0) <= date_time.time() <= time(17, 0)):
-                raise ValidationError(
-                    'O agendamento deve ser feito durante o horário comercial '
-                    '(07:00 - 17:00).'
-                )
+        return cleaned_data
 
-            if date_time < timezone.now() + timedelta(minutes=30):
-                raise ValidationError(
-                    'O agendamento deve ser feito com pelo menos 30 minutos '
-                    'de antecedência.'
-                )
 
-        return date_time
+class RecurrenceRuleForm(forms.ModelForm):
+    class Meta:
+        model = RecurrenceRule
+        fields = ['client', 'service', 'staff', 'first_occurrence',
+                  'interval_weeks', 'until', 'notes', 'is_active']
+        widgets = {
+            'first_occurrence': forms.DateTimeInput(
+                attrs={'type': 'datetime-local'}),
+            'until': forms.DateInput(attrs={'type': 'date'}),
+        }
+
+    def clean_first_occurrence(self):
+        first_occurrence = self.cleaned_data.get('first_occurrence')
+        if self.instance.pk and (
+                first_occurrence == self.instance.first_occurrence):
+            # Rules already running may start in the past.
+            return first_occurrence
+        return validate_booking_time(first_occurrence)
 
     def clean(self):
         cleaned_data = super().clean()
         service = cleaned_data.get('service')
-        date_time = cleaned_data.get('date_time')
-
-        if service and date_time:
-            end_time = date_time + timedelta(minutes=service.duration)
+        staff = cleaned_data.get('staff')
+        first_occurrence = cleaned_data.get('first_occurrence')
 
-            conflicting_scheduling = Scheduling.objects.filter(
-                service=service,
-                date_time__lt=end_time,
-                date_time__gt=date_time,
-                status='active'
-            )
+        if not (service and first_occurrence and cleaned_data.get(
+                'interval_weeks') and cleaned_data.get('is_active')):
+            return cleaned_data
 
-            if self.instance_pk:
-                conflicting_scheduling = conflicting_scheduling.exclude(
-                    pk=self.instance_pk)
+        end_time = first_occurrence + timedelta(minutes=service.duration)
+        if has_staff_schedule():
+            if staff is None:
+                raise ValidationError(
+                    'Escolha o profissional da recorrência.')
 
-            if conflicting_scheduling.exists():
+            weekday = timezone.localtime(first_occurrence).weekday()
+            if not is_working(get_shifts([weekday]).get(staff.pk, {}),
+                              first_occurrence, end_time):
                 raise ValidationError(
-                    'O horário solicitado conflita com outro agendamento ativo'
-                    ' para este serviço.'
-                )
+                    'O profissional não trabalha neste horário.')
+
+        # Checks every occurrence of the next months in a single sweep.
+        rule = self.instance
+        for field in ('service', 'staff', 'first_occurrence',
+                      'interval_weeks', 'until'):
+            setattr(rule, field, cleaned_data.get(field))
+        start = max(first_occurrence, timezone.now())
+        conflicts = find_rule_conflicts(
+            rule, start, start + timedelta(weeks=RECURRENCE_CHECK_WEEKS))
+        if conflicts:
+            raise ValidationError(
+                'A recorrência conflita com outros agendamentos em: '
+                + ', '.join(timezone.localtime(date_time).strftime(
+                    '%d/%m/%Y - %H:%M') for date_time in conflicts[:5])
+                + ('.' if len(conflicts) <= 5 else '...'))
 
         return cleaned_data
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from appointments.services.import_service import (
+    IMPORT_CHUNK_SIZE, import_schedules, read_rows
+)
+
+
+class Command(BaseCommand):
+    """
+    Imports schedules from a CSV or JSON file, e.g. when migrating from a
+    paper book or another system.
+
+    The file is read as a stream and written in chunks. Rows with errors
+    are reported and skipped, the others are imported.
+    """
+
+    help = 'Imports schedules from a CSV or JSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The file to import.')
+        parser.add_argument(
+            '--format', choices=['csv', 'json'],
+            help='The file format. Guessed from the extension by default.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+            help='How many rows are validated and written at once.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only validate the file, importing nothing.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or (
+            'json' if path.endswith(('.json', '.ndjson', '.jsonl'))
+            else 'csv')
+
+        try:
+            # Spreadsheets often save CSV files with a byte order mark.
+            with open(path, newline='', encoding='utf-8-sig') as stream:
+                summary = import_schedules(
+                    read_rows(stream, file_format),
+                    chunk_size=options['chunk_size'],
+                    dry_run=options['dry_run'])
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+
+        for line, error in summary['errors']:
+            self.stderr.write(f'Line {line}: {error}')
+
+        self.stdout.write(
+            f"{summary['created']} created, "
+            f"{len(summary['errors'])} errors.")
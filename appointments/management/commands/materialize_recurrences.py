@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from appointments.services.recurrence_service import (
+    MATERIALIZE_WEEKS, materialize_recurrences
+)
+
+
+class Command(BaseCommand):
+    """
+    Creates the bookings of the recurrence rules for the next few weeks.
+
+    Meant to run periodically, e.g. daily from cron. Each run only creates
+    the bookings that entered the window since the previous one.
+    """
+
+    help = 'Creates the bookings of the recurrence rules ahead of time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--weeks', type=int, default=MATERIALIZE_WEEKS,
+            help='How many weeks ahead bookings are created.')
+
+    def handle(self, *args, **options):
+        summary = materialize_recurrences(weeks=options['weeks'])
+        self.stdout.write(
+            f"{summary['created']} created, {summary['skipped']} skipped.")
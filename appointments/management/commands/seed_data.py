@@ -0,0 +1,156 @@
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from appointments.models import BarberService, CustomUser, Scheduling
+from appointments.services.barber_services import bump_catalog_version
+from appointments.services.occupancy_service import bump_occupancy_version
+from appointments.utils.changes import bump_change_marker
+
+SEED_PREFIX = 'seed-'
+SERVICE_NAMES = ('Corte', 'Barba', 'Corte e barba', 'Sobrancelha',
+                 'Pigmentação', 'Hidratação', 'Luzes', 'Relaxamento')
+NOTES = ('', '', '', 'Sem máquina', 'Cliente novo', 'Trazer foto')
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    """
+    Fills the database with synthetic clients, employees, services and a
+    booking history, for benchmarks and local development.
+
+    Bookings are spread over the past and the next days, during business
+    hours and without overlaps per service. Past ones are mostly
+    completed, some canceled, and future ones active. The same `--seed`
+    always generates the same data.
+    """
+
+    help = 'Generates synthetic users, services and schedules.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--employees', type=int, default=5)
+        parser.add_argument('--services', type=int, default=6)
+        parser.add_argument(
+            '--schedules', type=int, default=5000,
+            help='How many schedules to create, at most.')
+        parser.add_argument(
+            '--days', type=int, default=180,
+            help='How many days the schedules are spread over.')
+        parser.add_argument(
+            '--days-ahead', type=int, default=14,
+            help='How many of those days lie in the future.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--flush', action='store_true',
+            help='Delete the data of a previous run first.')
+
+    def handle(self, *args, **options):
+        seeded = CustomUser.objects.filter(username__startswith=SEED_PREFIX)
+        if seeded.exists() and not options['flush']:
+            raise CommandError(
+                'The database already has seeded data, use --flush.')
+        if options['services'] > len(SERVICE_NAMES):
+            raise CommandError(
+                f'At most {len(SERVICE_NAMES)} services can be generated.')
+
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            if options['flush']:
+                seeded.delete()
+                BarberService.objects.filter(
+                    description__startswith=SEED_PREFIX).delete()
+
+            clients = self.create_users(options['clients'], 'client')
+            self.create_users(options['employees'], 'employee')
+            services = self.create_services(options['services'], rng)
+            created = self.create_schedules(clients, services, rng, options)
+
+        # Bulk inserts send no signals.
+        bump_catalog_version()
+        bump_occupancy_version()
+        bump_change_marker(BarberService)
+        bump_change_marker(Scheduling)
+        self.stdout.write(
+            f'{len(clients)} clients, {options["employees"]} employees, '
+            f'{len(services)} services and {created} schedules created.')
+
+    def create_users(self, count: int, user_type: str) -> list:
+        # Hashing is slow on purpose, so every user shares one password.
+        password = make_password('seed')
+        return CustomUser.objects.bulk_create(
+            CustomUser(
+                username=f'{SEED_PREFIX}{user_type}-{number}',
+                email=f'{SEED_PREFIX}{user_type}-{number}@example.com',
+                first_name=user_type.capitalize(), last_name=str(number),
+                user_type=user_type, password=password)
+            for number in range(count)
+        )
+
+    def create_services(self, count: int, rng) -> list:
+        return BarberService.objects.bulk_create(
+            BarberService(
+                service_name=name,
+                description=f'{SEED_PREFIX}{name}',
+                price=Decimal(rng.randrange(20, 120, 5)),
+                duration=rng.choice((15, 30, 30, 45, 60)))
+            for name in SERVICE_NAMES[:count]
+        )
+
+    def create_schedules(self, clients, services, rng, options) -> int:
+        """
+        Books random slots of each service day by day, over `--days` days
+        ending `--days-ahead` days from now, with a probability that
+        spreads `--schedules` bookings over the whole range.
+        """
+        today = timezone.localdate()
+        first_day = today - timedelta(
+            days=options['days'] - options['days_ahead'])
+        step = timedelta(minutes=15)
+        opening = datetime.combine(today, Scheduling.OPENING_TIME)
+        closing = datetime.combine(today, Scheduling.CLOSING_TIME)
+        # Each service tries every 15 minutes of every day, at most.
+        capacity = (options['days'] * len(services)
+                    * ((closing - opening) // step + 1))
+        probability = min(1, options['schedules'] / max(capacity, 1))
+
+        remaining = options['schedules'] if clients else 0
+        created = 0
+        batch = []
+        for offset in range(options['days']):
+            day = first_day + timedelta(days=offset)
+            for service in services:
+                duration = timedelta(minutes=service.duration)
+                start = timezone.make_aware(
+                    datetime.combine(day, Scheduling.OPENING_TIME))
+                end = timezone.make_aware(
+                    datetime.combine(day, Scheduling.CLOSING_TIME))
+
+                while start <= end and len(batch) < remaining:
+                    if rng.random() >= probability:
+                        start += step
+                        continue
+
+                    client = rng.choice(clients)
+                    batch.append(Scheduling(
+                        client=client, client_name=client.get_full_name(),
+                        service=service, date_time=start,
+                        end_time=start + duration,
+                        status=self.pick_status(day, today, rng),
+                        notes=rng.choice(NOTES)))
+                    start += duration
+
+            if len(batch) >= BATCH_SIZE or offset == options['days'] - 1:
+                created += len(Scheduling.objects.bulk_create(batch))
+                remaining -= len(batch)
+                batch = []
+        return created
+
+    @staticmethod
+    def pick_status(day, today, rng) -> str:
+        if day >= today:
+            return 'active' if rng.random() < 0.95 else 'canceled'
+        return 'completed' if rng.random() < 0.85 else 'canceled'
@@ -0,0 +1,41 @@
+import time
+from django.core.management.base import BaseCommand
+from appointments.services.calendar_sync_service import process_pending_tasks
+
+
+class Command(BaseCommand):
+    """
+    Drains the calendar outbox, replicating booking changes to the calendar.
+
+    By default the command keeps running, polling the outbox every
+    `--interval` seconds. Use `--once` to process the due tasks and exit.
+    """
+
+    help = 'Replicates pending booking changes to the calendar.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Process the due tasks once and exit.')
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help='Maximum number of tasks processed per round.')
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Seconds to wait when there is nothing to process.')
+
+    def handle(self, *args, **options):
+        while True:
+            summary = process_pending_tasks(limit=options['batch_size'])
+            processed = sum(summary.values())
+
+            if processed:
+                self.stdout.write(
+                    f"{summary['done']} done, {summary['retried']} to retry, "
+                    f"{summary['failed']} failed.")
+
+            if options['once']:
+                return
+
+            if processed < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,84 @@
+import logging
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from .utils.timing import record_query, start_timing, stop_timing
+
+logger = logging.getLogger('appointments.timing')
+
+# The timings reported, with their Server-Timing descriptions.
+TIMING_METRICS = (
+    ('db', 'Database'),
+    ('http', 'Outbound HTTP'),
+    ('template', 'Templates'),
+)
+
+
+class RequestTimingMiddleware:
+    """
+    Measures where the time of each request goes: the whole request, the
+    database queries, the outbound HTTP calls and the template rendering.
+
+    The timings are sent back in a `Server-Timing` header, which browsers
+    show in their developer tools, and logged to `appointments.timing` as
+    one `key=value` line per request.
+
+    Enabled by the `REQUEST_TIMING` setting. When it is off, Django drops
+    the middleware when it starts, so it costs nothing.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_TIMING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token, timings = start_timing()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(record_query))
+                response = self.get_response(request)
+        finally:
+            stop_timing(token)
+        total = time.perf_counter() - start
+
+        response['Server-Timing'] = self.format_header(total, timings)
+        self.log(request, response, total, timings)
+        return response
+
+    def format_header(self, total, timings) -> str:
+        """
+        Builds the `Server-Timing` header, with durations in milliseconds.
+        """
+        metrics = [f'total;dur={total * 1000:.1f}']
+        for name, description in TIMING_METRICS:
+            duration, count = timings.get(name, (0.0, 0))
+            metrics.append(
+                f'{name};dur={duration * 1000:.1f};'
+                f'desc="{description} ({count})"')
+        return ', '.join(metrics)
+
+    def log(self, request, response, total, timings):
+        """
+        Logs the timings of a request as `key=value` pairs, also passed as
+        the `timing` attribute of the log record for structured handlers.
+        """
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+        }
+        for name, _ in TIMING_METRICS:
+            duration, count = timings.get(name, (0.0, 0))
+            fields[f'{name}_ms'] = round(duration * 1000, 1)
+            fields[f'{name}_count'] = count
+
+        logger.info(
+            ' '.join(f'{key}={value}' for key, value in fields.items()),
+            extra={'timing': fields})
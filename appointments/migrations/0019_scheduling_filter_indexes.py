@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0018_remove_scheduling_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scheduling',
+            index=models.Index(fields=['client', 'date_time'], name='scheduling_client_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scheduling',
+            index=models.Index(fields=['status', 'date_time'], name='scheduling_status_date_idx'),
+        ),
+    ]
@@ -0,0 +1,113 @@
+import appointments.models
+import django.contrib.postgres.constraints
+import django.contrib.postgres.fields.ranges
+from datetime import timedelta
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations, models
+
+
+class AddConstraintOnPostgres(migrations.AddConstraint):
+    """
+    Adds a constraint only when the database is PostgreSQL, so that local
+    SQLite databases can still be migrated.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(
+                app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(
+                app_label, schema_editor, from_state, to_state)
+
+
+def fill_end_time(apps, schema_editor):
+    Scheduling = apps.get_model('appointments', 'Scheduling')
+    schedules = Scheduling.objects.select_related('service').only(
+        'date_time', 'service__duration')
+
+    batch = []
+    for schedule in schedules.iterator(chunk_size=1000):
+        schedule.end_time = schedule.date_time + timedelta(
+            minutes=schedule.service.duration)
+        batch.append(schedule)
+
+        if len(batch) == 1000:
+            Scheduling.objects.bulk_update(batch, ['end_time'])
+            batch = []
+
+    Scheduling.objects.bulk_update(batch, ['end_time'])
+
+
+def check_overlapping_schedules(apps, schema_editor):
+    """
+    Stops the migration when active schedules overlap an earlier active
+    schedule of the same service, which the previous check let through and
+    which the exclusion constraint would reject.
+
+    The schedules are not changed here: their IDs are listed so that the
+    staff resolve the conflicts, e.g. canceling them through the admin,
+    which also removes their calendar events, before migrating again.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        # The constraint is only added on PostgreSQL.
+        return
+
+    Scheduling = apps.get_model('appointments', 'Scheduling')
+    schedules = Scheduling.objects.filter(status='active').order_by(
+        'service', 'date_time', 'pk').values_list(
+            'pk', 'service', 'date_time', 'end_time')
+
+    overlapping = []
+    service = busy_until = None
+    for pk, service_id, date_time, end_time in schedules.iterator(
+            chunk_size=1000):
+        if service_id != service:
+            service, busy_until = service_id, end_time
+            continue
+        if date_time < busy_until:
+            overlapping.append(pk)
+        busy_until = max(busy_until, end_time)
+
+    if overlapping:
+        raise RuntimeError(
+            f'{len(overlapping)} active schedules overlap an earlier active '
+            f'schedule of the same service: '
+            f'{", ".join(map(str, overlapping))}. Cancel or move them, then '
+            f'run the migration again.')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0019_scheduling_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduling',
+            name='end_time',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Término do agendamento'),
+        ),
+        migrations.RunPython(fill_end_time, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='scheduling',
+            name='end_time',
+            field=models.DateTimeField(editable=False, verbose_name='Término do agendamento'),
+        ),
+        migrations.AddIndex(
+            model_name='scheduling',
+            index=models.Index(fields=['service', 'status', 'date_time'], name='scheduling_service_status_idx'),
+        ),
+        migrations.RunPython(
+            check_overlapping_schedules, migrations.RunPython.noop),
+        BtreeGistExtension(),
+        AddConstraintOnPostgres(
+            model_name='scheduling',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(condition=models.Q(('status', 'active')), expressions=[(appointments.models.TsTzRange('date_time', 'end_time', django.contrib.postgres.fields.ranges.RangeBoundary()), '&&'), ('service', '=')], name='scheduling_no_overlap', violation_error_message='O horário solicitado conflita com outro agendamento ativo para este serviço.'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0021_calendarsynctask'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scheduling',
+            index=models.Index(fields=['date_time', 'id'], name='scheduling_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:34
+
+import appointments.models
+import django.contrib.postgres.fields.ranges
+from django.db import migrations, models
+
+
+def build_overlap_constraint(constraint_class):
+    return constraint_class(
+        condition=models.Q(('status', 'active')),
+        expressions=[
+            (appointments.models.TsTzRange(
+                'date_time', 'end_time',
+                django.contrib.postgres.fields.ranges.RangeBoundary()), '&&'),
+            ('service', '='),
+        ],
+        name='scheduling_no_overlap',
+        violation_error_message=(
+            'O horário solicitado conflita com outro agendamento ativo para '
+            'este serviço.'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0022_scheduling_keyset_index'),
+    ]
+
+    operations = [
+        # Same constraint, declared with a class that SQLite skips, so that
+        # later migrations can rebuild the table. The database is left
+        # untouched.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveConstraint(
+                    model_name='scheduling',
+                    name='scheduling_no_overlap',
+                ),
+                migrations.AddConstraint(
+                    model_name='scheduling',
+                    constraint=build_overlap_constraint(
+                        appointments.models.PostgresExclusionConstraint),
+                ),
+            ],
+        ),
+    ]
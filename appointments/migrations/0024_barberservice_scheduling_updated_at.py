@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0023_scheduling_no_overlap_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='barberservice',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='scheduling',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:40
+
+import appointments.models
+import django.contrib.postgres.fields.ranges
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0024_barberservice_scheduling_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkingHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Segunda-feira'), (1, 'Terça-feira'), (2, 'Quarta-feira'), (3, 'Quinta-feira'), (4, 'Sexta-feira'), (5, 'Sábado'), (6, 'Domingo')], verbose_name='Dia da semana')),
+                ('start_time', models.TimeField(verbose_name='Início')),
+                ('end_time', models.TimeField(verbose_name='Fim')),
+            ],
+            options={
+                'verbose_name': 'Horário de trabalho',
+                'verbose_name_plural': 'Horários de trabalho',
+                'ordering': ['staff', 'weekday', 'start_time'],
+            },
+        ),
+        migrations.RemoveConstraint(
+            model_name='scheduling',
+            name='scheduling_no_overlap',
+        ),
+        migrations.AddField(
+            model_name='scheduling',
+            name='staff',
+            field=models.ForeignKey(blank=True, limit_choices_to={'user_type': 'employee'}, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='staff_schedules', to=settings.AUTH_USER_MODEL, verbose_name='Profissional'),
+        ),
+        migrations.AddIndex(
+            model_name='scheduling',
+            index=models.Index(fields=['staff', 'date_time'], name='scheduling_staff_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='scheduling',
+            constraint=appointments.models.PostgresExclusionConstraint(condition=models.Q(('staff__isnull', True), ('status', 'active')), expressions=[(appointments.models.TsTzRange('date_time', 'end_time', django.contrib.postgres.fields.ranges.RangeBoundary()), '&&'), ('service', '=')], name='scheduling_no_overlap', violation_error_message='O horário solicitado conflita com outro agendamento ativo para este serviço.'),
+        ),
+        migrations.AddConstraint(
+            model_name='scheduling',
+            constraint=appointments.models.PostgresExclusionConstraint(condition=models.Q(('staff__isnull', False), ('status', 'active')), expressions=[(appointments.models.TsTzRange('date_time', 'end_time', django.contrib.postgres.fields.ranges.RangeBoundary()), '&&'), ('staff', '=')], name='scheduling_staff_no_overlap', violation_error_message='O profissional já tem outro agendamento ativo neste horário.'),
+        ),
+        migrations.AddField(
+            model_name='workinghours',
+            name='staff',
+            field=models.ForeignKey(limit_choices_to={'user_type': 'employee'}, on_delete=django.db.models.deletion.CASCADE, related_name='working_hours', to=settings.AUTH_USER_MODEL, verbose_name='Profissional'),
+        ),
+        migrations.AddIndex(
+            model_name='workinghours',
+            index=models.Index(fields=['weekday', 'staff'], name='working_hours_weekday_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='workinghours',
+            constraint=models.CheckConstraint(condition=models.Q(('end_time__gt', models.F('start_time'))), name='working_hours_end_after_start', violation_error_message='O fim do turno deve ser depois do início.'),
+        ),
+    ]
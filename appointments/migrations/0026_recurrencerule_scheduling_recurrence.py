@@ -0,0 +1,45 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:43
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0025_scheduling_staff_workinghours'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurrenceRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_occurrence', models.DateTimeField(verbose_name='Primeiro agendamento')),
+                ('interval_weeks', models.PositiveSmallIntegerField(default=2, validators=[django.core.validators.MinValueValidator(1)], verbose_name='Repetir a cada (semanas)')),
+                ('until', models.DateField(blank=True, null=True, verbose_name='Até')),
+                ('notes', models.TextField(blank=True, null=True, verbose_name='Notas')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Ativa')),
+                ('materialized_until', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurrence_rules', to=settings.AUTH_USER_MODEL, verbose_name='Cliente')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='appointments.barberservice', verbose_name='Serviço')),
+                ('staff', models.ForeignKey(blank=True, limit_choices_to={'user_type': 'employee'}, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='staff_recurrence_rules', to=settings.AUTH_USER_MODEL, verbose_name='Profissional')),
+            ],
+            options={
+                'verbose_name': 'Recorrência',
+                'verbose_name_plural': 'Recorrências',
+            },
+        ),
+        migrations.AddField(
+            model_name='scheduling',
+            name='recurrence',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='appointments.recurrencerule', verbose_name='Recorrência'),
+        ),
+        migrations.AddConstraint(
+            model_name='scheduling',
+            constraint=models.UniqueConstraint(fields=('recurrence', 'date_time'), name='scheduling_recurrence_occurrence_uniq'),
+        ),
+    ]
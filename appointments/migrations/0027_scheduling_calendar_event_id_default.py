@@ -0,0 +1,33 @@
+import os
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def clear_placeholder_event_ids(apps, schema_editor):
+    """
+    Nulls the calendar ID that unsynchronized schedules got as a default.
+    Event IDs never contain `@`, while calendar IDs always do.
+    """
+    Scheduling = apps.get_model('appointments', 'Scheduling')
+    placeholder = Q(calendar_event_id__contains='@')
+    calendar_id = os.getenv('CALENDAR_ID')
+    if calendar_id:
+        placeholder |= Q(calendar_event_id=calendar_id)
+    Scheduling.objects.filter(placeholder).update(calendar_event_id=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0026_recurrencerule_scheduling_recurrence'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='scheduling',
+            name='calendar_event_id',
+            field=models.CharField(blank=True, default=None, max_length=255, null=True),
+        ),
+        migrations.RunPython(
+            clear_placeholder_event_ids, migrations.RunPython.noop),
+    ]
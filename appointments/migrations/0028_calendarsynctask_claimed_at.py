@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0027_scheduling_calendar_event_id_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendarsynctask',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
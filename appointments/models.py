@@ -1,16 +1,15 @@
-import os
-from datetime import timedelta
+from datetime import datetime, time, timedelta
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.core.validators import FileExtensionValidator
-from django.db import models
-from .utils.others import get_env
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import (
+    DateTimeRangeField, RangeBoundary, RangeOperators)
+from django.core.validators import FileExtensionValidator, MinValueValidator
+from django.db import DEFAULT_DB_ALIAS, connections, models
+from django.db.models import Func, Q
+from django.utils import timezone
 from .utils.validations import validate_positive_price
 
-get_env()
-
-calendar_id = os.getenv('CALENDAR_ID')
-
 
 class CustomUser (AbstractUser):
     """
@@ -159,6 +158,11 @@ class BarberService(models.Model):
     duration : PositiveIntegerField
         The duration of the service in minutes.
 
+    updated_at : DateTimeField
+        When the service was last changed. The conditional requests of the
+        API read it when the cache is private to each process, see
+        `get_change_marker`.
+
     Methods
     -------
     __str__()
@@ -203,6 +207,8 @@ class BarberService(models.Model):
     duration = models.PositiveIntegerField(
         verbose_name='Duração (minutos)')
 
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
         """
         Returns a string representation of the service, including its name and
@@ -216,15 +222,72 @@ class BarberService(models.Model):
         return f'{self.service_name} - R$ {self.price}'
 
 
+class TsTzRange(Func):
+    """
+    Builds a PostgreSQL `tstzrange` out of two datetime expressions.
+    """
+    function = 'TSTZRANGE'
+    output_field = DateTimeRangeField()
+
+
+class PostgresExclusionConstraint(ExclusionConstraint):
+    """
+    Exclusion constraint that only exists on PostgreSQL.
+
+    On other databases it produces no SQL and validates nothing, so that
+    local SQLite databases can still rebuild the table when a migration
+    changes it.
+    """
+
+    def constraint_sql(self, model, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return None
+        return super().constraint_sql(model, schema_editor)
+
+    def create_sql(self, model, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return None
+        return super().create_sql(model, schema_editor)
+
+    def remove_sql(self, model, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return None
+        return super().remove_sql(model, schema_editor)
+
+    def validate(self, model, instance, exclude=None, using=DEFAULT_DB_ALIAS):
+        if connections[using].vendor != 'postgresql':
+            return
+        super().validate(model, instance, exclude=exclude, using=using)
+
+
 class Scheduling(models.Model):
     STATUS_CHOICES = [
         ('active', 'Ativo'),
         ('canceled', 'Cancelado'),
         ('completed', 'Concluído'),
     ]
+    # The statuses each status may be reached from when schedules are
+    # changed in bulk, e.g. when closing out the day.
+    STATUS_TRANSITIONS = {
+        'completed': ('active',),
+        'canceled': ('active',),
+    }
+
+    # Business hours in which an appointment may start, and how far in
+    # advance it must be booked.
+    OPENING_TIME = time(7, 0)
+    CLOSING_TIME = time(17, 0)
+    MINIMUM_NOTICE = timedelta(minutes=30)
 
     client = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # The employee doing the service. Left empty while the shop has no
+    # working hours configured, see `WorkingHours`.
+    staff = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True,
+        blank=True, related_name='staff_schedules',
+        limit_choices_to={'user_type': 'employee'},
+        verbose_name='Profissional')
     client_name = models.CharField(max_length=255, blank=True)
     service = models.ForeignKey(
         'BarberService', on_delete=models.CASCADE, verbose_name='Serviço')
@@ -233,6 +296,8 @@ class Scheduling(models.Model):
         help_text=('O agendamento deve ser feito durante o horário comercial'
                    ' (07: 00 - 17: 00)')
     )
+    end_time = models.DateTimeField(
+        editable=False, verbose_name='Término do agendamento')
     status = models.CharField(
         max_length=10, choices=STATUS_CHOICES, default='active')
 
@@ -240,21 +305,340 @@ class Scheduling(models.Model):
                              verbose_name='Notas',
                              help_text='Observações sobre o agendamento')
 
+    # Set once the calendar worker has created the event.
     calendar_event_id = models.CharField(
-        max_length=255, blank=True, null=True,
-        default=calendar_id)
+        max_length=255, blank=True, null=True, default=None)
+
+    # The rule this booking was materialized from, if any.
+    recurrence = models.ForeignKey(
+        'RecurrenceRule', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='occurrences', verbose_name='Recorrência')
+
+    # Set on every save. Queryset updates of fields shown by the API must
+    # set it explicitly, since they skip `save()`.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['client', 'date_time'],
+                         name='scheduling_client_date_idx'),
+            models.Index(fields=['status', 'date_time'],
+                         name='scheduling_status_date_idx'),
+            models.Index(fields=['service', 'status', 'date_time'],
+                         name='scheduling_service_status_idx'),
+            models.Index(fields=['date_time', 'id'],
+                         name='scheduling_date_id_idx'),
+            models.Index(fields=['staff', 'date_time'],
+                         name='scheduling_staff_date_idx'),
+        ]
+        constraints = [
+            # Each occurrence of a rule is materialized at most once.
+            models.UniqueConstraint(
+                fields=['recurrence', 'date_time'],
+                name='scheduling_recurrence_occurrence_uniq'),
+            # Bookings without staff can't overlap within a service...
+            PostgresExclusionConstraint(
+                name='scheduling_no_overlap',
+                expressions=[
+                    (TsTzRange('date_time', 'end_time', RangeBoundary()),
+                     RangeOperators.OVERLAPS),
+                    ('service', RangeOperators.EQUAL),
+                ],
+                condition=Q(status='active', staff__isnull=True),
+                violation_error_message=(
+                    'O horário solicitado conflita com outro agendamento '
+                    'ativo para este serviço.'),
+            ),
+            # ...and bookings with staff can't overlap for the same person.
+            PostgresExclusionConstraint(
+                name='scheduling_staff_no_overlap',
+                expressions=[
+                    (TsTzRange('date_time', 'end_time', RangeBoundary()),
+                     RangeOperators.OVERLAPS),
+                    ('staff', RangeOperators.EQUAL),
+                ],
+                condition=Q(status='active', staff__isnull=False),
+                violation_error_message=(
+                    'O profissional já tem outro agendamento ativo neste '
+                    'horário.'),
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.client_name:
             self.client_name = self.client.get_full_name()
+        self.end_time = self.compute_end_time()
         super(Scheduling, self).save(*args, **kwargs)
 
+    def compute_end_time(self):
+        """
+        Computes the moment the appointment ends from the service duration.
+        """
+        return self.date_time + timedelta(minutes=self.service.duration)
+
     def __str__(self):
         return f'{self.client} - {self.service} em {self.date_time}'
 
     def get_formatted_date(self):
-        return (
-            self.date_time - timedelta(hours=3)).strftime('%d/%m/%Y - %H:%M')
+        return self.format_date(self.date_time)
+
+    @staticmethod
+    def format_date(date_time):
+        return (date_time - timedelta(hours=3)).strftime('%d/%m/%Y - %H:%M')
 
     def get_status_choices(self):
         return self.STATUS_CHOICES
+
+
+class RecurrenceRule(models.Model):
+    """
+    RecurrenceRule describes a booking that repeats every few weeks at the
+    same local time, e.g. a haircut every two weeks.
+
+    Occurrences are expanded on demand for the requested window, and only
+    the next few weeks are materialized as `Scheduling` rows by the
+    `materialize_recurrences` command.
+
+    Attributes
+    ----------
+    client : ForeignKey
+        The client of the bookings.
+
+    service : ForeignKey
+        The service booked.
+
+    staff : ForeignKey
+        The employee doing the service. Required once the shop has working
+        hours, see `WorkingHours`.
+
+    first_occurrence : DateTimeField
+        The first booking. Later ones keep its weekday and local time.
+
+    interval_weeks : PositiveSmallIntegerField
+        How many weeks apart the bookings are.
+
+    until : DateField
+        The last day a booking may fall on. Empty for no end.
+
+    notes : TextField
+        Notes copied to every booking.
+
+    is_active : BooleanField
+        Whether new bookings are still generated.
+
+    materialized_until : DateTimeField
+        Every occurrence before this moment has already been materialized
+        or skipped.
+
+    Methods
+    -------
+    get_occurrences(start, end)
+        Yields the occurrences starting in a window.
+    """
+
+    client = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='recurrence_rules', verbose_name='Cliente')
+    service = models.ForeignKey(
+        'BarberService', on_delete=models.CASCADE, verbose_name='Serviço')
+    staff = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True,
+        blank=True, related_name='staff_recurrence_rules',
+        limit_choices_to={'user_type': 'employee'},
+        verbose_name='Profissional')
+    first_occurrence = models.DateTimeField(
+        verbose_name='Primeiro agendamento')
+    interval_weeks = models.PositiveSmallIntegerField(
+        default=2, validators=[MinValueValidator(1)],
+        verbose_name='Repetir a cada (semanas)')
+    until = models.DateField(null=True, blank=True, verbose_name='Até')
+    notes = models.TextField(blank=True, null=True, verbose_name='Notas')
+    is_active = models.BooleanField(default=True, verbose_name='Ativa')
+    materialized_until = models.DateTimeField(
+        null=True, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Recorrência'
+        verbose_name_plural = 'Recorrências'
+
+    def __str__(self):
+        return (f'{self.client} - {self.service} a cada '
+                f'{self.interval_weeks} semana(s)')
+
+    def get_occurrences(self, start, end):
+        """
+        Yields, in order, the occurrences starting at or after `start` and
+        before `end`, without going through the earlier ones.
+
+        Parameters
+        ----------
+        start : datetime
+            The beginning of the window.
+
+        end : datetime
+            The end of the window.
+
+        Yields
+        ------
+        datetime
+            The aware start of each occurrence.
+        """
+        first = timezone.localtime(self.first_occurrence)
+        step_days = 7 * self.interval_weeks
+
+        index = 0
+        if start > self.first_occurrence:
+            index = (timezone.localdate(start) - first.date()).days // (
+                step_days)
+
+        while True:
+            day = first.date() + timedelta(days=index * step_days)
+            if self.until and day > self.until:
+                return
+
+            occurrence = timezone.make_aware(
+                datetime.combine(day, first.time()))
+            if occurrence >= end:
+                return
+            if occurrence >= start:
+                yield occurrence
+            index += 1
+
+
+class WorkingHours(models.Model):
+    """
+    WorkingHours is a shift of an employee on a day of the week. An employee
+    may have several shifts on the same day, e.g. around a lunch break.
+
+    Once any shift is registered, every booking is assigned to an employee
+    working at that time, and conflicts are checked per employee instead of
+    per service.
+
+    Attributes
+    ----------
+    staff : ForeignKey
+        The employee.
+
+    weekday : PositiveSmallIntegerField
+        The day of the week, Monday being 0.
+
+    start_time : TimeField
+        When the shift starts, in local time.
+
+    end_time : TimeField
+        When the shift ends, in local time.
+    """
+
+    WEEKDAY_CHOICES = [
+        (0, 'Segunda-feira'),
+        (1, 'Terça-feira'),
+        (2, 'Quarta-feira'),
+        (3, 'Quinta-feira'),
+        (4, 'Sexta-feira'),
+        (5, 'Sábado'),
+        (6, 'Domingo'),
+    ]
+
+    staff = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='working_hours',
+        limit_choices_to={'user_type': 'employee'},
+        verbose_name='Profissional')
+    weekday = models.PositiveSmallIntegerField(
+        choices=WEEKDAY_CHOICES, verbose_name='Dia da semana')
+    start_time = models.TimeField(verbose_name='Início')
+    end_time = models.TimeField(verbose_name='Fim')
+
+    class Meta:
+        ordering = ['staff', 'weekday', 'start_time']
+        verbose_name = 'Horário de trabalho'
+        verbose_name_plural = 'Horários de trabalho'
+        indexes = [
+            models.Index(fields=['weekday', 'staff'],
+                         name='working_hours_weekday_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(end_time__gt=models.F('start_time')),
+                name='working_hours_end_after_start',
+                violation_error_message=(
+                    'O fim do turno deve ser depois do início.'),
+            ),
+        ]
+
+    def __str__(self):
+        return (f'{self.staff} - {self.get_weekday_display()} '
+                f'{self.start_time:%H:%M}-{self.end_time:%H:%M}')
+
+
+class CalendarSyncTask(models.Model):
+    """
+    CalendarSyncTask is an outbox entry describing a change that still has to
+    be replicated to the calendar.
+
+    Tasks are written in the same transaction as the booking change and are
+    drained by the `sync_calendar` management command, so requests never
+    wait on the calendar.
+
+    Attributes
+    ----------
+    scheduling : ForeignKey
+        The scheduling to be synchronized. It is cleared when the scheduling
+        is deleted.
+
+    action : CharField
+        What has to be done in the calendar (insert, update or delete).
+
+    event_id : CharField
+        The calendar event affected by a delete.
+
+    status : CharField
+        Whether the task is pending, done or has failed for good.
+
+    attempts : PositiveIntegerField
+        How many times the task has been tried.
+
+    next_attempt_at : DateTimeField
+        The moment from which the task may be tried again.
+
+    claimed_at : DateTimeField
+        When a worker took the task, empty while nobody is running it. The
+        claim lapses after a while, in case the worker died.
+
+    last_error : TextField
+        The error of the last failed attempt.
+    """
+
+    ACTION_CHOICES = [
+        ('insert', 'Inserir'),
+        ('update', 'Atualizar'),
+        ('delete', 'Remover'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pendente'),
+        ('done', 'Concluída'),
+        ('failed', 'Falhou'),
+    ]
+
+    scheduling = models.ForeignKey(
+        'Scheduling', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='calendar_tasks')
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    event_id = models.CharField(max_length=255, blank=True, null=True)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'],
+                         name='calendar_task_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_action_display()} - {self.scheduling_id}'
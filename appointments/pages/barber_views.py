@@ -1,5 +1,8 @@
-import os
+from datetime import timedelta
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import redirect, render, resolve_url
@@ -7,12 +10,26 @@ from django.urls import reverse_lazy
 from django.views.generic.edit import UpdateView
 from django.contrib.messages.views import SuccessMessageMixin
 from django.views.generic import ListView, View
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from ..forms.barber_forms import ServiceForm
 from ..models import BarberService, Scheduling, CustomUser
+from ..pagination import ServicePagination
 from ..utils.validations import (
     OnlyStaffMixin, OnlyManagerOrSuperuserMixin)
-from ..utils.api import get_results_api
-from ..serializers import ServiceSerializer
+from ..serializers import ServiceListSerializer, ServiceSerializer
+from ..utils.api import (
+    ConditionalViewSetMixin, EagerLoadingViewSetMixin,
+    SparseFieldsetViewSetMixin
+)
+from ..services.barber_services import get_services, get_service_totals
+from ..services.scheduling_services import (
+    get_schedules, get_scheduling_totals
+)
+from ..services.user_services import get_user_totals
+from ..services.availability_service import (
+    DEFAULT_SLOT_STEP, get_available_slots
+)
 
 
 class CreateServicesView(
@@ -98,7 +115,7 @@ class ListServicesView(LoginRequiredMixin, ListView):
     ServicesListView displays a list of barber services.
 
     This view is accessible only to authenticated users. It fetches the list
-    of services from an external API and renders them in a template.
+    of services from the database and renders them in a template.
 
 
     Attributes
@@ -112,8 +129,7 @@ class ListServicesView(LoginRequiredMixin, ListView):
     Methods
     -------
     get(request)
-        Fetches the list of services from an external API and renders the
-        services list page.
+        Fetches the list of services and renders the services list page.
     """
 
     model = BarberService
@@ -123,8 +139,8 @@ class ListServicesView(LoginRequiredMixin, ListView):
         """
         Handles GET requests to fetch and display the list of barber services.
 
-        Retrieves the services from an external API and renders them in the
-        services list template.
+        Retrieves the services and renders them in the services list
+        template.
 
         Parameters
         ----------
@@ -136,12 +152,8 @@ class ListServicesView(LoginRequiredMixin, ListView):
         HttpResponse
             Renders the services list template with the fetched services.
         """
-        api_url = str(os.getenv('SERVICES_API_URL'))
-
-        response = get_results_api(self.request, api_url)
-
         context = {
-            'obj': response,
+            'obj': get_services(self.request),
             'title': 'Catálogo',
         }
         return render(self.request, self.template_name, context)
@@ -165,65 +177,21 @@ class DashboardView(LoginRequiredMixin, OnlyStaffMixin, APIView):
     Provides an overview of the system's key metrics, such as total users,
     employees,
     appointments, services, and the list of recent appointments.
+
+    Each total comes from a single aggregation query per model.
     """
     template_name = 'appointments/dashboard.html'
-
-    def get_total_users(self):
-        """
-        Calculates the total number of users in the system.
-
-        Returns:
-            int: The total number of users.
-        """
-        return CustomUser.objects.count()
-
-    def get_total_employees(self):
-        """
-        Calculates the total number of employees, including employees,
-        managers, and superusers.
-
-        Returns:
-            int: The total number of employees.
-        """
-        employee = CustomUser.objects.filter(user_type='employee').count()
-        managers = CustomUser.objects.filter(user_type='manager').count()
-        owners = CustomUser.objects.filter(user_type='superuser').count()
-        return employee + managers + owners
-
-    def get_total_appointments(self):
-        """
-        Calculates the total number of appointments in the system.
-
-        Returns:
-            int: The total number of appointments.
-        """
-        return Scheduling.objects.count()
-
-    def get_total_services(self):
-        """
-        Fetches and calculates the total number of services from an external
-        API.
-
-        Returns:
-            int: The total number of services.
-        """
-        api_url = os.getenv('SERVICES_API_URL')
-
-        response = get_results_api(self.request, api_url)
-        total_services = len(response)
-        return total_services
+    recent_appointments_limit = 30
 
     def get_appointments(self):
         """
-        Fetches the list of appointments from an external API.
+        Fetches the list of the most recent appointments, along with their
+        services, in a single query.
 
         Returns:
-            list: The list of appointments retrieved from the API.
+            list: The list of recent appointments.
         """
-        api_url = os.getenv('SCHEDULES_API_URL')
-
-        response = get_results_api(self.request, api_url)
-        return response
+        return get_schedules(limit=self.recent_appointments_limit)
 
     def get(self, request, *args, **kwargs):
         """
@@ -237,19 +205,16 @@ class DashboardView(LoginRequiredMixin, OnlyStaffMixin, APIView):
         Returns:
             HttpResponse: The rendered dashboard page.
         """
-        total_users = self.get_total_users()
-        total_employees = self.get_total_employees()
-        total_appointments = self.get_total_appointments()
-        total_services = self.get_total_services()
-        appointments = self.get_appointments()
+        user_totals = get_user_totals()
+        scheduling_totals = get_scheduling_totals()
 
         context = {
             'title': 'Dashboard',
-            'total_users': total_users,
-            'total_employees': total_employees,
-            'total_appointments': total_appointments,
-            'total_services': total_services,
-            'appointments': appointments,
+            'total_users': user_totals['total'],
+            'total_employees': user_totals['staff'],
+            'total_appointments': scheduling_totals['total'],
+            'total_services': get_service_totals()['total'],
+            'appointments': self.get_appointments(),
             'status_choices': Scheduling.STATUS_CHOICES
         }
 
@@ -343,7 +308,8 @@ class UpdateStatusView(SuccessMessageMixin, OnlyStaffMixin, UpdateView):
         return context
 
 
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(ConditionalViewSetMixin, SparseFieldsetViewSetMixin,
+                     EagerLoadingViewSetMixin, viewsets.ModelViewSet):
     """
     ServiceViewSet provides CRUD operations for barber services.
 
@@ -358,7 +324,94 @@ class ServiceViewSet(viewsets.ModelViewSet):
     serializer_class : Serializer
         The serializer class used to serialize and deserialize barber service
         data.
+
+    list_serializer_class : ValuesListSerializer
+        The read-only serializer used by `list`.
+
+    pagination_class : Pagination
+        Page number pagination, or keyset pagination over `pk` when the
+        `cursor` query parameter is given.
+
+    `list` and `retrieve` answer conditional requests, see
+    `ConditionalViewSetMixin`, and accept `?fields=` to render only some
+    fields, see `SparseFieldsetViewSetMixin`.
     """
 
-    queryset = BarberService.objects.all()
+    queryset = BarberService.objects.all().order_by('pk')
     serializer_class = ServiceSerializer
+    list_serializer_class = ServiceListSerializer
+    pagination_class = ServicePagination
+    max_availability_days = 31
+
+    def parse_day(self, name, default):
+        """
+        Parses a date query parameter.
+
+        Args:
+            name (str): The name of the query parameter.
+            default (date): The value used when the parameter is missing.
+
+        Returns:
+            date: The parsed date.
+
+        Raises:
+            ValidationError: If the value is not a valid ISO date.
+        """
+        value = self.request.query_params.get(name)
+        if not value:
+            return default
+
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+
+        if day is None:
+            raise ValidationError({name: 'Data inválida.'})
+        return day
+
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        """
+        Lists the free start times of a service between the `start` and `end`
+        dates (inclusive, defaulting to the next seven days), spaced by
+        `step` minutes.
+        """
+        service = self.get_object()
+        if not service.is_active:
+            raise ValidationError({'service': 'Serviço inativo.'})
+
+        start_date = self.parse_day('start', timezone.localdate())
+        end_date = self.parse_day('end', start_date + timedelta(days=6))
+
+        if end_date < start_date:
+            raise ValidationError(
+                {'end': 'A data final deve ser posterior à inicial.'})
+
+        if (end_date - start_date).days >= self.max_availability_days:
+            raise ValidationError(
+                {'end': f'O intervalo máximo é de '
+                        f'{self.max_availability_days} dias.'})
+
+        step = request.query_params.get('step', str(DEFAULT_SLOT_STEP))
+        if not step.isdigit() or not 5 <= int(step) <= 120:
+            raise ValidationError(
+                {'step': 'O passo deve estar entre 5 e 120 minutos.'})
+
+        availability = get_available_slots(
+            service, start_date, end_date, step=int(step))
+
+        return Response({
+            'service': service.pk,
+            'duration': service.duration,
+            'days': [
+                {
+                    'date': day.isoformat(),
+                    'slots': [
+                        timezone.localtime(slot).strftime('%H:%M')
+                        for slot in slots
+                    ],
+                }
+                for day, slots in availability.items()
+            ],
+        })
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+from ..services import google_calendar_service  # noqa: F401, client metrics
+from ..utils.metrics import render_metrics
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Exposes the booking and calendar metrics in the Prometheus text format.
+
+    When the `METRICS_TOKEN` setting is set, the scraper must send it as a
+    bearer token.
+
+    Args:
+        request: The HTTP request object.
+
+    Returns:
+        HttpResponse: The metrics, or 403 without the expected token.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and not constant_time_compare(
+            request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=403)
+
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
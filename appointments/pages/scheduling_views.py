@@ -1,19 +1,38 @@
-import os
+from datetime import datetime, time
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import redirect, render, get_object_or_404
 from django.views.generic import View, ListView
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.core.exceptions import PermissionDenied
-from ..forms.scheduling_forms import ScheduleForm
+from ..forms.scheduling_forms import (
+    ScheduleForm, SCHEDULE_CONFLICT_MESSAGE
+)
+from ..utils.api import (
+    ConditionalViewSetMixin, EagerLoadingViewSetMixin, IsStaffUser,
+    SparseFieldsetViewSetMixin
+)
+from ..utils.changes import get_change_marker
+from ..utils.metrics import BOOKING_CONFLICTS, BOOKINGS
 from ..utils.others import get_env
-from ..utils.api import get_results_api
-from ..models import Scheduling
-from ..serializers import ScheduleSerializer
-from ..services.google_calendar_service import (
-    insert_into_calendar, delete_from_calendar
+from ..models import BarberService, Scheduling
+from ..pagination import SchedulePagination
+from ..serializers import (
+    ScheduleListSerializer, ScheduleSerializer, StatusTransitionSerializer
+)
+from ..services.scheduling_services import (
+    filter_schedules, get_schedules_queryset, iter_export_rows, stream_csv,
+    stream_ndjson, transition_schedules
+)
+from ..services.calendar_sync_service import (
+    enqueue_calendar_insert, enqueue_calendar_update, enqueue_calendar_delete
 )
 get_env()
 
@@ -35,27 +54,21 @@ class CreateSchedulingView(LoginRequiredMixin, View):
         if form.is_valid():
             scheduling = form.save(commit=False)
             scheduling.client = request.user
-            start_time = scheduling.date_time
-            end_time = start_time + \
-                timezone.timedelta(minutes=scheduling.service.duration)
-
-            created_event = insert_into_calendar(
-                summary=scheduling.service.service_name,
-                start=start_time,
-                end=end_time,
-                description=form.cleaned_data.get('notes', '')
-            )
-
-            if not created_event:
-                raise Exception(
-                    'Erro ao inserir o agendamento na Agenda.')
-
-            scheduling.calendar_event_id = created_event['id']
-            scheduling.save()
 
-            messages.success(request, 'Agendado com sucesso.')
-            return redirect('appointments:schedules')
+            try:
+                with transaction.atomic():
+                    scheduling.save()
+                    enqueue_calendar_insert(scheduling)
+            except IntegrityError:
+                # Another booking took the slot after the form was validated.
+                BOOKING_CONFLICTS.inc(reason='constraint')
+                form.add_error(None, SCHEDULE_CONFLICT_MESSAGE)
+            else:
+                BOOKINGS.inc(action='create', outcome='success')
+                messages.success(request, 'Agendado com sucesso.')
+                return redirect('appointments:schedules')
 
+        BOOKINGS.inc(action='create', outcome='rejected')
         messages.error(request, 'Não foi possível agendar')
         return render(request, 'appointments/create_scheduling.html',
                       {'form': form})
@@ -67,18 +80,20 @@ class ListSchedulesView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         """
-        Retrieves the schedules from an external API and filters them by
-        the logged-in user.
+        Retrieves the schedules of the logged-in user, filtered and paginated
+        in the database.
         """
-        api_url = os.getenv('SCHEDULES_API_URL')
-
-        schedules = get_results_api(self.request, api_url)
+        return get_schedules_queryset(client=self.request.user)
 
-        user_id = self.request.user.pk
-        filtered_schedules = [
-            item for item in schedules if item['client'] == user_id
-        ]
-        return filtered_schedules
+    def get_context_data(self, **kwargs):
+        """
+        Serializes only the schedules of the current page, keeping the shape
+        expected by the template.
+        """
+        context = super().get_context_data(**kwargs)
+        context['object_list'] = ScheduleSerializer(
+            context['object_list'], many=True).data
+        return context
 
     def get(self, *args, **kwargs):
         """
@@ -197,39 +212,29 @@ class UpdateScheduleView(LoginRequiredMixin, View):
         if form.is_valid():
             try:
                 with transaction.atomic():
-                    if existing_schedule.calendar_event_id:
-                        delete_from_calendar(
-                            existing_schedule.calendar_event_id)
-
                     scheduling = form.save(commit=False)
                     scheduling.save()
+                    enqueue_calendar_update(
+                        scheduling, changed_fields=form.changed_data)
 
-                    start_time = scheduling.date_time
-                    end_time = start_time + \
-                        timezone.timedelta(minutes=scheduling.service.duration)
-
-                    created_event = insert_into_calendar(
-                        summary=scheduling.service.service_name,
-                        start=start_time,
-                        end=end_time,
-                        description=form.cleaned_data.get('notes', '')
-                    )
-
-                    if not created_event:
-                        raise Exception(
-                            'Erro ao inserir o agendamento na Agenda.')
-
-                    scheduling.calendar_event_id = created_event['id']
-                    scheduling.save()
-
+                BOOKINGS.inc(action='update', outcome='success')
                 messages.success(
                     request, 'Agendamento atualizado com sucesso.')
 
                 return redirect('appointments:schedules')
 
+            except IntegrityError:
+                BOOKING_CONFLICTS.inc(reason='constraint')
+                BOOKINGS.inc(action='update', outcome='rejected')
+                form.add_error(None, SCHEDULE_CONFLICT_MESSAGE)
+
             except Exception as e:
+                BOOKINGS.inc(action='update', outcome='error')
                 messages.error(request, f'Ocorreu um erro: {e}')
 
+        else:
+            BOOKINGS.inc(action='update', outcome='rejected')
+
         return render(request, self.template_name,
                       {'form': form, 'schedule_id': schedule_id})
 
@@ -259,23 +264,157 @@ class DeleteScheduleView(LoginRequiredMixin, View):
 
         try:
             with transaction.atomic():
-                if existing_schedule.calendar_event_id:
-                    delete_from_calendar(
-                        existing_schedule.calendar_event_id)
-
+                enqueue_calendar_delete(existing_schedule)
                 existing_schedule.delete()
+                BOOKINGS.inc(action='delete', outcome='success')
                 messages.success(request, 'Agendamento deletado')
 
                 return redirect('appointments:schedules')
 
         except Exception as e:
+            BOOKINGS.inc(action='delete', outcome='error')
             messages.error(request, f'Um erro ocorreu: {e}')
 
 
-class ScheduleViewSet(viewsets.ModelViewSet):
+class ScheduleViewSet(ConditionalViewSetMixin, SparseFieldsetViewSetMixin,
+                      EagerLoadingViewSetMixin, viewsets.ModelViewSet):
     """
     API viewset for managing schedule objects. Allows CRUD operations on
     schedules via API.
+
+    The list can be narrowed with the `client`, `status`, `start` and `end`
+    query parameters. `start` and `end` accept a date or a datetime in ISO
+    format; a date `end` includes the whole day.
+
+    Passing `cursor` switches the list to keyset pagination over
+    `(date_time, pk)`, see `KeysetPageNumberPagination`.
+
+    `export/` streams every filtered schedule as CSV or NDJSON, and
+    `status/` changes the status of many schedules at once.
+
+    `list` reads `.values()` rows through `ScheduleListSerializer`. `list`
+    and `retrieve` accept `?fields=` to render only some fields, see
+    `SparseFieldsetViewSetMixin`.
+
+    `list` and `retrieve` answer conditional requests, see
+    `ConditionalViewSetMixin`. Since the schedules show the service name,
+    the services take part in the change marker.
     """
     queryset = Scheduling.objects.all().order_by('-pk')
     serializer_class = ScheduleSerializer
+    list_serializer_class = ScheduleListSerializer
+    pagination_class = SchedulePagination
+    export_formats = {
+        'csv': (stream_csv, 'text/csv; charset=utf-8'),
+        'ndjson': (stream_ndjson, 'application/x-ndjson'),
+    }
+
+    def get_change_markers(self):
+        """
+        Adds the change marker of the services to the one of the schedules.
+        """
+        return super().get_change_markers() + [
+            get_change_marker(BarberService)]
+
+    def parse_moment(self, name, end_of_day=False):
+        """
+        Parses a date or datetime query parameter into an aware datetime.
+
+        Args:
+            name (str): The name of the query parameter.
+            end_of_day (bool): When the value is a plain date, return the
+                start of the following day instead of the start of the day.
+
+        Returns:
+            datetime | None: The parsed moment, or None if not provided.
+
+        Raises:
+            ValidationError: If the value is not a valid date or datetime.
+        """
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+
+        try:
+            # Dates first: `parse_datetime` also accepts a plain date, as
+            # midnight, which would lose `end_of_day`.
+            day = parse_date(value)
+            if day is not None:
+                if end_of_day:
+                    day += timezone.timedelta(days=1)
+                moment = datetime.combine(day, time.min)
+            else:
+                moment = parse_datetime(value)
+            if moment is None:
+                raise ValueError(value)
+        except ValueError:
+            raise ValidationError({name: 'Data ou data e hora inválida.'})
+
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    def get_queryset(self):
+        """
+        Applies the client, status and date range filters from the query
+        string to the schedules queryset.
+        """
+        params = self.request.query_params
+        client = params.get('client')
+        status = params.get('status')
+
+        if client is not None and not client.isdigit():
+            raise ValidationError({'client': 'Cliente inválido.'})
+
+        if status and status not in dict(Scheduling.STATUS_CHOICES):
+            raise ValidationError({'status': 'Status inválido.'})
+
+        return filter_schedules(
+            super().get_queryset(),
+            client=int(client) if client is not None else None,
+            status=status,
+            start=self.parse_moment('start'),
+            end=self.parse_moment('end', end_of_day=True),
+        )
+
+    @action(detail=False, methods=['get'], permission_classes=[IsStaffUser])
+    def export(self, request):
+        """
+        Streams the schedules matching the list filters, oldest first, as
+        CSV or NDJSON according to the `file_format` query parameter.
+
+        Rows are read with a server-side cursor and written as they come,
+        so memory stays flat however many rows are exported.
+        """
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in self.export_formats:
+            raise ValidationError(
+                {'file_format': 'Use "csv" ou "ndjson".'})
+
+        render_rows, content_type = self.export_formats[file_format]
+        response = StreamingHttpResponse(
+            render_rows(iter_export_rows(self.get_queryset())),
+            content_type=content_type)
+
+        filename = f'agendamentos-{timezone.localdate():%Y%m%d}.{file_format}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='status',
+            permission_classes=[IsStaffUser])
+    def bulk_status(self, request):
+        """
+        Moves the schedules listed in `ids` to `status` with a single
+        UPDATE, e.g. to close out the day, and answers with the IDs that
+        changed. Schedules whose current status doesn't allow the change
+        are left alone and listed in `skipped`.
+        """
+        serializer = StatusTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        status = serializer.validated_data['status']
+
+        changed = transition_schedules(ids, status)
+        skipped = sorted(set(ids) - set(changed))
+        return Response(
+            {'status': status, 'changed': changed, 'skipped': skipped})
@@ -0,0 +1,193 @@
+import base64
+import json
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPageNumberPagination(PageNumberPagination):
+    """
+    Page number pagination with an opt-in keyset (cursor) mode.
+
+    Without the `cursor` query parameter it behaves like the default
+    `PageNumberPagination`. With it (`?cursor=` for the first page), rows are
+    ordered by `keyset_ordering` and each page seeks past the last row of the
+    previous one with a `WHERE` on the ordering columns instead of an
+    `OFFSET`, and no `COUNT(*)` is run. Every page therefore costs the same,
+    however deep it is, and the `next` token stays valid when rows are added.
+
+    Attributes
+    ----------
+    keyset_ordering : tuple
+        The ordering fields of the keyset mode. The last one must be unique.
+
+    cursor_query_param : str
+        The query parameter holding the position token.
+    """
+
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    keyset_ordering = ('-pk',)
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_mode = self.cursor_query_param in request.query_params
+        if not self.keyset_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        queryset = queryset.order_by(*self.keyset_ordering)
+        position = self.decode_cursor(
+            queryset.model, request.query_params[self.cursor_query_param])
+        if position is not None:
+            queryset = queryset.filter(self.get_seek_filter(position))
+
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page_rows = rows[:page_size]
+        return self.page_rows
+
+    def get_paginated_response(self, data):
+        if not self.keyset_mode:
+            return super().get_paginated_response(data)
+
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not getattr(self, 'keyset_mode', False):
+            return super().get_next_link()
+
+        if not self.has_next:
+            return None
+
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param,
+            self.encode_cursor(self.page_rows[-1]))
+
+    def get_ordering_fields(self):
+        """
+        Returns the `(name, descending)` pairs of the keyset ordering.
+        """
+        return [
+            (field.lstrip('-'), field.startswith('-'))
+            for field in self.keyset_ordering
+        ]
+
+    def get_seek_filter(self, position):
+        """
+        Builds the filter selecting the rows after a position, i.e.
+        `a >= x AND ((a > x) OR (a = x AND b > y) OR ...)` with the
+        comparisons flipped for descending fields.
+
+        The leading `a >= x` is redundant, but unlike the `OR` it bounds
+        the index scan, so that the database starts it at the cursor
+        instead of walking the rows already seen.
+
+        Parameters
+        ----------
+        position : list
+            The values of the ordering fields of the last row already seen.
+
+        Returns
+        -------
+        Q
+            The filter.
+        """
+        fields = self.get_ordering_fields()
+        seek_filter = Q()
+        equal_filter = Q()
+        for (name, descending), value in zip(fields, position):
+            lookup = 'lt' if descending else 'gt'
+            seek_filter |= equal_filter & Q(**{f'{name}__{lookup}': value})
+            equal_filter &= Q(**{name: value})
+
+        if len(fields) == 1:
+            return seek_filter
+        (name, descending), value = fields[0], position[0]
+        lookup = 'lte' if descending else 'gte'
+        return Q(**{f'{name}__{lookup}': value}) & seek_filter
+
+    def encode_cursor(self, row):
+        """
+        Encodes the position of a row, a model instance or a `.values()`
+        row, as an opaque token.
+        """
+        position = []
+        for name, _ in self.get_ordering_fields():
+            if isinstance(row, dict):
+                # A `.values()` row, keyed by column name.
+                value = row['id' if name == 'pk' else name]
+            else:
+                value = getattr(row, name)
+            position.append(
+                value.isoformat() if hasattr(value, 'isoformat') else value)
+
+        return base64.urlsafe_b64encode(
+            json.dumps(position).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, model, token):
+        """
+        Decodes a token produced by `encode_cursor`.
+
+        Parameters
+        ----------
+        model : Model
+            The model being paginated, used to validate the values.
+
+        token : str
+            The token. An empty token means the first page.
+
+        Returns
+        -------
+        list | None
+            The position, or None for the first page.
+
+        Raises
+        ------
+        NotFound
+            If the token is not valid.
+        """
+        if not token:
+            return None
+
+        try:
+            padding = '=' * (-len(token) % 4)
+            position = json.loads(base64.urlsafe_b64decode(token + padding))
+            fields = self.get_ordering_fields()
+            if not isinstance(position, list) or len(position) != len(fields):
+                raise ValueError(token)
+
+            position = [
+                model._meta.get_field(
+                    model._meta.pk.name if name == 'pk' else name
+                ).to_python(value)
+                for (name, _), value in zip(fields, position)
+            ]
+            # The ordering columns are never null, and a null can't be
+            # compared in the seek filter.
+            if None in position:
+                raise ValueError(token)
+            return position
+        except (ValueError, TypeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class SchedulePagination(KeysetPageNumberPagination):
+    keyset_ordering = ('-date_time', '-pk')
+
+
+class ServicePagination(KeysetPageNumberPagination):
+    keyset_ordering = ('pk',)
@@ -0,0 +1,91 @@
+from decimal import Decimal
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the stdlib.
+    orjson = None
+
+
+class DecimalStringJSONEncoder(JSONEncoder):
+    """
+    DRF encoder that keeps `Decimal` values as strings, the same way the
+    serializer `DecimalField` renders prices, instead of turning them into
+    floats and losing precision.
+    """
+
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return str(obj)
+        return super().default(obj)
+
+
+_fallback_encoder = DecimalStringJSONEncoder()
+
+
+def encode_default(obj):
+    """
+    Converts the values orjson doesn't know natively, the same way the
+    fallback encoder does.
+    """
+    return _fallback_encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer backed by orjson when it is installed.
+
+    Like `JSONRenderer`, the output is compact UTF-8 with aware datetimes
+    in ISO 8601 (`Z` for UTC) and U+2028/U+2029 escaped, so it can be
+    embedded in a script. It differs in two ways, whichever encoder runs:
+    `Decimal` values are rendered as strings, where DRF turns them into
+    floats. And with orjson, NaN and infinities are rendered as null,
+    where DRF's strict mode raises an error. Without orjson, or when an
+    indentation other than 2 is requested (as the browsable API does), it
+    falls back to the standard library encoder.
+    """
+
+    encoder_class = DecimalStringJSONEncoder
+    orjson_options = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+                      if orjson is not None else 0)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent not in (None, 2):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+
+        options = self.orjson_options
+        if indent == 2:
+            options |= orjson.OPT_INDENT_2
+        rendered = orjson.dumps(data, default=encode_default, option=options)
+        # Valid JSON, but not valid JavaScript: escaped like `JSONRenderer`.
+        return rendered.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029')
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSON parser backed by orjson when it is installed, falling back to the
+    standard library parser otherwise or for non UTF-8 payloads.
+    """
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
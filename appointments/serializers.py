@@ -1,8 +1,107 @@
+from decimal import Decimal
+from functools import lru_cache
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from .models import BarberService, Scheduling
 
 
-class ServiceSerializer(serializers.ModelSerializer):
+class EagerLoadingMixin:
+    """
+    Lets a serializer declare what it reads from the database, so that views
+    can load everything it needs upfront instead of one query per row.
+
+    Relations read through dotted sources (e.g. `service.service_name`) are
+    detected automatically, so new fields of this kind can't bring back N+1
+    queries. Anything else has to be declared.
+
+    Attributes
+    ----------
+    select_related_fields : tuple
+        Extra relations to be joined.
+
+    prefetch_related_fields : tuple
+        Relations to be prefetched.
+
+    only_fields : tuple
+        The columns read by the serializer. When empty, every column is
+        loaded.
+
+    Methods
+    -------
+    setup_eager_loading(queryset)
+        Applies the declared loading to a queryset.
+    """
+
+    select_related_fields = ()
+    prefetch_related_fields = ()
+    only_fields = ()
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def get_related_sources(cls):
+        """
+        Lists the lookups of the fields read through a relation. The result
+        is computed once per serializer class.
+
+        Returns:
+            tuple: Lookups such as `service__service_name`.
+        """
+        return tuple(
+            field.source.replace('.', '__')
+            for field in cls().fields.values()
+            if '.' in field.source
+        )
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """
+        Applies the declared and the detected loading to a queryset.
+
+        Parameters
+        ----------
+        queryset : QuerySet
+            The queryset to be serialized.
+
+        Returns
+        -------
+        QuerySet
+            The queryset with `select_related`, `prefetch_related` and
+            `only` applied.
+        """
+        related_sources = cls.get_related_sources()
+        select_related = set(cls.select_related_fields) | {
+            source.rsplit('__', 1)[0] for source in related_sources
+        }
+
+        if select_related:
+            queryset = queryset.select_related(*sorted(select_related))
+
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(
+                *cls.prefetch_related_fields)
+
+        if cls.only_fields:
+            queryset = queryset.only(*cls.only_fields, *related_sources)
+
+        return queryset
+
+
+class SparseFieldsMixin:
+    """
+    Lets the caller keep only some of the serializer fields with the
+    `fields` argument, e.g. `ServiceSerializer(service, fields=['id'])`.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class ServiceSerializer(SparseFieldsMixin, EagerLoadingMixin,
+                        serializers.ModelSerializer):
     """
     ServiceSerializer serializes the BarberService model for use in API
     responses and requests.
@@ -22,19 +121,20 @@ class ServiceSerializer(serializers.ModelSerializer):
     model : BarberService
         The model that this serializer is based on.
 
-    fields : list
-        A list of fields to be included in the serialized output. Using
-        '__all__' includes all fields from the model.
+    exclude : list
+        The model fields left out of the serialized output. Every other
+        field is included.
     """
 
     price = serializers.DecimalField(max_digits=10, decimal_places=2)
 
     class Meta:
         model = BarberService
-        fields = '__all__'
+        exclude = ['updated_at']
 
 
-class ScheduleSerializer(serializers.ModelSerializer):
+class ScheduleSerializer(SparseFieldsMixin, EagerLoadingMixin,
+                         serializers.ModelSerializer):
     """
     Serializer for the Scheduling model, providing a formatted representation
     of scheduling data, including client, service, and scheduling details.
@@ -45,6 +145,8 @@ class ScheduleSerializer(serializers.ModelSerializer):
         The name of the service associated with the scheduling.
     formatted_date : str
         The formatted date of the scheduling, using a custom date format.
+    only_fields : tuple
+        The columns read by the serializer, see `EagerLoadingMixin`.
 
     Methods
     -------
@@ -54,6 +156,11 @@ class ScheduleSerializer(serializers.ModelSerializer):
     service_name = serializers.CharField(source='service.service_name')
     formatted_date = serializers.CharField(source='get_formatted_date')
 
+    # `client` is rendered from `client_id`, so it doesn't need a join.
+    # `formatted_date` reads `date_time`.
+    only_fields = ('id', 'client', 'client_name', 'staff', 'date_time',
+                   'status', 'notes')
+
     class Meta:
         model = Scheduling
         fields = [
@@ -61,8 +168,182 @@ class ScheduleSerializer(serializers.ModelSerializer):
             # The client associated with the scheduling (ForeignKey).
             'client',
             'client_name',  # The name of the client.
+            'staff',  # The employee doing the service, if assigned.
             'service_name',  # The name of the service scheduled.
             'formatted_date',  # The formatted date for the scheduling.
             'status',  # The current status of the scheduling.
             'notes',  # Any additional notes for the scheduling.
         ]
+
+
+class StatusTransitionSerializer(serializers.Serializer):
+    """
+    Validates a bulk status change of schedules.
+
+    Attributes
+    ----------
+    ids : ListField
+        The schedules to change.
+    status : ChoiceField
+        The new status, one of `Scheduling.STATUS_TRANSITIONS`.
+    """
+
+    MAX_IDS = 1000
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+        max_length=MAX_IDS)
+    status = serializers.ChoiceField(
+        choices=[
+            (status, label) for status, label in Scheduling.STATUS_CHOICES
+            if status in Scheduling.STATUS_TRANSITIONS
+        ])
+
+
+class ValuesListSerializer:
+    """
+    Read-only serializer for list endpoints that builds the output straight
+    from `.values()` rows, skipping model instances and the per-field
+    machinery of `ModelSerializer`. Its output must match the one of the
+    regular serializer of the model.
+
+    Attributes
+    ----------
+    value_fields : tuple
+        `(name, lookup)` pairs, in output order. Each value is read from
+        the `lookup` column and passed through the `format_<name>` method
+        when the class defines one.
+
+    Methods
+    -------
+    setup_values(queryset)
+        Turns a queryset into the `.values()` rows the serializer reads.
+    """
+
+    value_fields = ()
+
+    def __init__(self, rows, many=True, context=None, fields=None):
+        self.rows = rows
+        self.context = context or {}
+        self.fields = fields
+
+    @classmethod
+    def get_value_fields(cls, fields=None):
+        """
+        Returns the `(name, lookup)` pairs of the given output fields, in
+        output order, or all of them when `fields` is None.
+        """
+        if fields is None:
+            return cls.value_fields
+        return tuple(
+            (name, lookup) for name, lookup in cls.value_fields
+            if name in fields
+        )
+
+    @classmethod
+    def setup_values(cls, queryset, fields=None, extra=()):
+        """
+        Selects only the columns read by the serializer.
+
+        Parameters
+        ----------
+        queryset : QuerySet
+            The queryset to be serialized.
+
+        fields : Iterable[str], optional
+            The output fields to render. Defaults to all of them.
+
+        extra : Iterable[str], optional
+            Columns to read even though they are not rendered.
+
+        Returns
+        -------
+        QuerySet
+            A `.values()` queryset.
+        """
+        return queryset.values(*dict.fromkeys([
+            *(lookup for _, lookup in cls.get_value_fields(fields)), *extra
+        ]))
+
+    @property
+    def data(self):
+        """
+        Returns the serialized rows as a list of dictionaries.
+        """
+        fields = [
+            (name, lookup, getattr(self, f'format_{name}', None))
+            for name, lookup in self.get_value_fields(self.fields)
+        ]
+        return [
+            {
+                name: formatter(row[lookup]) if formatter else row[lookup]
+                for name, lookup, formatter in fields
+            }
+            for row in self.rows
+        ]
+
+    @staticmethod
+    def format_decimal(value, decimal_places=2):
+        """
+        Formats a decimal like DRF's `DecimalField` does.
+        """
+        if value is None:
+            return None
+        return '{:f}'.format(Decimal(value).quantize(
+            Decimal(1).scaleb(-decimal_places)))
+
+    def format_file(self, name):
+        """
+        Formats a stored file name like DRF's `FileField` does.
+        """
+        if not name:
+            return None
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class ServiceListSerializer(ValuesListSerializer):
+    """
+    Read-only list serializer matching `ServiceSerializer`.
+    """
+
+    value_fields = (
+        ('id', 'id'),
+        # Declared fields come first in `ServiceSerializer`.
+        ('price', 'price'),
+        ('service_name', 'service_name'),
+        ('service_type', 'service_type'),
+        ('description', 'description'),
+        ('image', 'image'),
+        ('is_active', 'is_active'),
+        ('duration', 'duration'),
+    )
+
+    def format_price(self, value):
+        return self.format_decimal(value)
+
+    def format_image(self, value):
+        return self.format_file(value)
+
+
+class ScheduleListSerializer(ValuesListSerializer):
+    """
+    Read-only list serializer matching `ScheduleSerializer`.
+    """
+
+    value_fields = (
+        ('id', 'id'),
+        ('client', 'client'),
+        ('client_name', 'client_name'),
+        ('staff', 'staff'),
+        ('service_name', 'service__service_name'),
+        ('formatted_date', 'date_time'),
+        ('status', 'status'),
+        ('notes', 'notes'),
+    )
+
+    def format_formatted_date(self, value):
+        return Scheduling.format_date(value)
@@ -0,0 +1,97 @@
+from datetime import date, datetime, timedelta
+from django.utils import timezone
+from appointments.models import BarberService, Scheduling
+from appointments.services.occupancy_service import get_occupancies, is_free
+from appointments.services.staff_service import (
+    get_shifts, has_staff_schedule, is_working
+)
+
+DEFAULT_SLOT_STEP = 15
+
+
+def get_day_bounds(day: date) -> tuple:
+    """
+    Returns the first and the last moment an appointment may start on a day.
+
+    Args:
+        day (date): The day, in the local time zone.
+
+    Returns:
+        tuple: The aware `(opening, closing)` datetimes of the day.
+    """
+    opening = timezone.make_aware(
+        datetime.combine(day, Scheduling.OPENING_TIME))
+    closing = timezone.make_aware(
+        datetime.combine(day, Scheduling.CLOSING_TIME))
+    return opening, closing
+
+
+def get_available_slots(service: BarberService, start_date: date,
+                        end_date: date,
+                        step: int = DEFAULT_SLOT_STEP) -> dict:
+    """
+    Computes the free start times of a service for every day of a range.
+
+    A start time is free if the service has no booking without an employee
+    then. When the shop registers working hours, some employee must also
+    work during the whole service and have no booking then.
+
+    Each candidate start time is checked against the occupancy bitmaps of
+    its day, see `occupancy_service`, and the bitmaps missing from the cache
+    are built with one query. Since bookings are rounded to whole 5-minute
+    slots, a start time right next to a booking that isn't aligned to 5
+    minutes may be left out, but a busy one is never offered.
+
+    Args:
+        service (BarberService): The service being booked.
+        start_date (date): The first day of the range.
+        end_date (date): The last day of the range, inclusive.
+        step (int): The distance, in minutes, between candidate start times.
+
+    Returns:
+        dict: A mapping of each day to the list of its free start datetimes.
+    """
+    duration = timedelta(minutes=service.duration)
+    step_delta = timedelta(minutes=step)
+    earliest = timezone.now() + Scheduling.MINIMUM_NOTICE
+
+    days = [
+        start_date + timedelta(days=offset)
+        for offset in range((end_date - start_date).days + 1)
+    ]
+
+    staff_schedule = has_staff_schedule()
+    resources = {}
+    if staff_schedule:
+        shifts = get_shifts({day.weekday() for day in days})
+        resources = {('staff', staff_id): staff_shifts
+                     for staff_id, staff_shifts in shifts.items()}
+    service_resource = ('service', service.pk)
+    occupancies = get_occupancies([*resources, service_resource], days)
+
+    availability = {}
+    for day in days:
+        opening, closing = get_day_bounds(day)
+        slots = []
+        candidate = opening
+        if earliest > opening:
+            # Skip the start times that are too close, keeping the step.
+            skipped = -((opening - earliest) // step_delta)
+            candidate = opening + skipped * step_delta
+
+        while candidate <= closing:
+            candidate_end = candidate + duration
+            service_free = is_free(occupancies[service_resource, day], day,
+                                   candidate, candidate_end)
+            if service_free and (not staff_schedule or any(
+                is_working(staff_shifts, candidate, candidate_end)
+                and is_free(occupancies[resource, day], day, candidate,
+                            candidate_end)
+                for resource, staff_shifts in resources.items()
+            )):
+                slots.append(candidate)
+            candidate += step_delta
+
+        availability[day] = slots
+
+    return availability
@@ -0,0 +1,115 @@
+import time
+from django.core.cache import cache
+from django.db.models import Count, Q
+from appointments.models import BarberService
+from appointments.serializers import ServiceSerializer
+from appointments.utils.caches import is_cache_shared
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_TIMEOUT = 60 * 60 * 24
+# With a cache private to each process, a new version only reaches the
+# process that made the change, so the others may serve the old catalog
+# until their entries expire.
+LOCAL_CATALOG_TIMEOUT = 30
+
+
+def get_catalog_version() -> int:
+    """
+    Retrieves the current version of the service catalog.
+
+    When the version is missing (first use, eviction or a cache restart) it
+    starts again from the current time in milliseconds, so it never matches
+    a version used by entries that may still be cached.
+
+    Returns:
+        int: The catalog version.
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns() // 1_000_000,
+                  timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Invalidates every cached copy of the service catalog by moving to a new
+    version. Old entries are never read again and expire on their own.
+    """
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+
+
+def get_catalog_key(name: str) -> str:
+    """
+    Builds the cache key of a catalog entry for the current version.
+    """
+    return f'catalog:{get_catalog_version()}:{name}'
+
+
+def get_catalog_timeout() -> int:
+    """
+    Returns how long catalog entries are kept: a day when the cache is
+    shared, so that invalidations reach every process, and
+    `LOCAL_CATALOG_TIMEOUT` otherwise, bounding how stale the catalog of
+    the other processes may get.
+    """
+    return CATALOG_TIMEOUT if is_cache_shared() else LOCAL_CATALOG_TIMEOUT
+
+
+def get_active_services() -> list:
+    """
+    Retrieves the active services, from the cache when possible.
+
+    Returns:
+        list: The active BarberService instances, ordered by name.
+    """
+    key = get_catalog_key('active')
+    services = cache.get(key)
+    if services is None:
+        services = list(
+            BarberService.objects.filter(is_active=True).order_by(
+                'service_name', 'pk'))
+        cache.set(key, services, get_catalog_timeout())
+    return services
+
+
+def get_services(request=None) -> list:
+    """
+    Retrieves the barber services serialized with the same shape returned by
+    the services API, from the cache when possible.
+
+    Args:
+        request (HttpRequest, optional): The current request, used to build
+            absolute image URLs just like the API does.
+
+    Returns:
+        list: A list of dictionaries, one per service.
+    """
+    origin = (f'{request.scheme}://{request.get_host()}'
+              if request is not None else '')
+    key = get_catalog_key(f'serialized:{origin}')
+
+    services = cache.get(key)
+    if services is None:
+        services = ServiceSerializer(
+            BarberService.objects.all().order_by('pk'), many=True,
+            context={'request': request}).data
+        cache.set(key, services, get_catalog_timeout())
+    return services
+
+
+def get_service_totals() -> dict:
+    """
+    Counts the registered and the active services with a single query.
+
+    Returns:
+        dict: The `total` and `active` counts.
+    """
+    return BarberService.objects.aggregate(
+        total=Count('pk'),
+        active=Count('pk', filter=Q(is_active=True)),
+    )
@@ -0,0 +1,369 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from appointments.models import CalendarSyncTask, Scheduling
+from appointments.services.google_calendar_service import (
+    build_event, get_calendar_backend
+)
+
+MAX_ATTEMPTS = 8
+# Scheduling fields that are shown in the calendar event.
+CALENDAR_FIELDS = ('service', 'date_time', 'notes')
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=1)
+# How long a worker may run the tasks it claimed before other workers take
+# them over, assuming it died. Well above the time a batch may take.
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+def has_pending_insert(scheduling: Scheduling) -> bool:
+    """
+    Checks whether the scheduling still waits for its event to be created,
+    including while a worker is creating it.
+
+    Args:
+        scheduling (Scheduling): The scheduling to check.
+
+    Returns:
+        bool: True if an insert task of the scheduling is still pending.
+    """
+    return CalendarSyncTask.objects.filter(
+        scheduling=scheduling, action='insert', status='pending').exists()
+
+
+def get_pending_inserts(schedules) -> set:
+    """
+    Finds, among several schedules, the ones that still wait for their event
+    to be created, see `has_pending_insert`, with a single query.
+
+    Args:
+        schedules (Iterable[Scheduling]): The schedules to check.
+
+    Returns:
+        set: The IDs of the schedules with a pending insert task.
+    """
+    return set(CalendarSyncTask.objects.filter(
+        scheduling__in=[schedule.pk for schedule in schedules],
+        action='insert', status='pending',
+    ).values_list('scheduling_id', flat=True))
+
+
+def enqueue_calendar_insert(scheduling: Scheduling) -> CalendarSyncTask:
+    """
+    Queues the creation of the calendar event of a new scheduling. Must be
+    called inside the transaction that saves the scheduling.
+
+    Args:
+        scheduling (Scheduling): The saved scheduling.
+
+    Returns:
+        CalendarSyncTask: The queued task.
+    """
+    return CalendarSyncTask.objects.create(
+        scheduling=scheduling, action='insert')
+
+
+def enqueue_calendar_update(scheduling: Scheduling, changed_fields=None):
+    """
+    Queues the replication of a changed scheduling to its calendar event,
+    which is patched in place. Must be called inside the transaction that
+    saves the scheduling.
+
+    Nothing is queued when none of the `CALENDAR_FIELDS` changed.
+
+    Nothing is queued while an insert or an update of the scheduling is
+    still pending and unclaimed, since that task will read the current
+    state of the scheduling when it runs. A claimed task may have read the
+    scheduling already, so the change gets a task of its own, which no
+    worker claims before the claimed one is released, see `claim_tasks`.
+
+    Args:
+        scheduling (Scheduling): The saved scheduling.
+        changed_fields (Iterable[str], optional): The fields that changed.
+            When omitted, the scheduling is assumed to have changed.
+
+    Returns:
+        CalendarSyncTask | None: The queued task, if any.
+    """
+    if changed_fields is not None and not set(changed_fields) & set(
+            CALENDAR_FIELDS):
+        return None
+
+    if CalendarSyncTask.objects.filter(
+            scheduling=scheduling, action__in=['insert', 'update'],
+            status='pending', claimed_at__isnull=True).exists():
+        return None
+
+    return CalendarSyncTask.objects.create(
+        scheduling=scheduling, action='update')
+
+
+def enqueue_calendar_delete(scheduling: Scheduling):
+    """
+    Queues the removal of the calendar event of a scheduling about to be
+    deleted or canceled, see `enqueue_calendar_deletes`. Must be called
+    inside the transaction that changes it.
+
+    Args:
+        scheduling (Scheduling): The scheduling being deleted.
+
+    Returns:
+        CalendarSyncTask | None: The queued task, if any.
+    """
+    tasks = enqueue_calendar_deletes([scheduling])
+    return tasks[0] if tasks else None
+
+
+def enqueue_calendar_deletes(schedules) -> list:
+    """
+    Queues the removal of the calendar events of several schedules about to
+    be deleted or canceled, with a constant number of queries. Must be
+    called inside the transaction that changes them.
+
+    The pending tasks no worker has claimed yet are dropped, since they
+    would have nothing left to do. A claimed insert may be creating an
+    event right now: it is left alone, and the worker queues the removal
+    of the event itself once it finds the scheduling gone or canceled, see
+    `apply_task_results`.
+
+    The scheduling rows are locked to read their event IDs, so that an
+    event stored by a worker meanwhile is not missed.
+
+    Args:
+        schedules (Iterable[Scheduling]): The schedules.
+
+    Returns:
+        list: The queued tasks, one per schedule with an event.
+    """
+    ids = sorted(schedule.pk for schedule in schedules)
+    CalendarSyncTask.objects.filter(
+        scheduling__in=ids, status='pending',
+        claimed_at__isnull=True).delete()
+
+    events = Scheduling.objects.select_for_update().filter(
+        pk__in=ids).order_by('pk').values_list('pk', 'calendar_event_id')
+    return CalendarSyncTask.objects.bulk_create(
+        CalendarSyncTask(
+            scheduling_id=pk, action='delete', event_id=event_id)
+        for pk, event_id in events if event_id
+    )
+
+
+def build_scheduling_event(scheduling: Scheduling) -> dict:
+    """
+    Builds the calendar event body of a scheduling.
+
+    Args:
+        scheduling (Scheduling): The scheduling.
+
+    Returns:
+        dict: The event body expected by the calendar backend.
+    """
+    return build_event(
+        summary=scheduling.service.service_name,
+        start=scheduling.date_time,
+        end=scheduling.end_time,
+        description=scheduling.notes or '',
+    )
+
+
+def set_event_id(scheduling: Scheduling, event_id) -> bool:
+    """
+    Stores the calendar event ID of a scheduling without touching its other
+    fields.
+
+    Returns:
+        bool: False if the scheduling no longer exists.
+    """
+    scheduling.calendar_event_id = event_id
+    return bool(Scheduling.objects.filter(pk=scheduling.pk).update(
+        calendar_event_id=event_id))
+
+
+def build_task_operations(task: CalendarSyncTask) -> list:
+    """
+    Translates a task into the calendar operations that replicate it.
+
+    Args:
+        task (CalendarSyncTask): The task.
+
+    Returns:
+        list: The operations, see `sync_calendar_batch`. Empty when there is
+            nothing left to do.
+    """
+    scheduling = task.scheduling
+
+    if task.action == 'delete':
+        return [{'action': 'delete', 'event_id': task.event_id}]
+
+    if scheduling is None or scheduling.status == 'canceled':
+        # The scheduling was deleted or canceled before it was synchronized.
+        return []
+
+    event = build_scheduling_event(scheduling)
+
+    # An event may exist already whatever the action, e.g. created by the
+    # admin while an insert was queued, so it is patched rather than
+    # duplicated.
+    if scheduling.calendar_event_id:
+        return [{'action': 'patch', 'event_id': scheduling.calendar_event_id,
+                 'event': event}]
+    return [{'action': 'insert', 'event': event}]
+
+
+def apply_task_results(task: CalendarSyncTask, operations: list,
+                       results: list):
+    """
+    Stores the outcome of the operations of a task.
+
+    When the scheduling was deleted or canceled while its event was being
+    created, the removal of the new event is queued. A removed event is
+    forgotten by the scheduling, when it still exists.
+
+    Args:
+        task (CalendarSyncTask): The task.
+        operations (list): The operations built for the task.
+        results (list): The result of each operation.
+
+    Returns:
+        str | None: The first error found, or None when every operation
+            succeeded.
+    """
+    errors = [result['error'] for result in results if not result['ok']]
+
+    for operation, result in zip(operations, results):
+        if not result['ok']:
+            continue
+
+        if operation['action'] == 'insert':
+            event_id = result['event']['id']
+            if not set_event_id(task.scheduling, event_id):
+                CalendarSyncTask.objects.create(
+                    action='delete', event_id=event_id)
+            elif Scheduling.objects.filter(
+                    pk=task.scheduling_id, status='canceled').exists():
+                CalendarSyncTask.objects.create(
+                    scheduling_id=task.scheduling_id, action='delete',
+                    event_id=event_id)
+        elif operation['action'] == 'delete' and task.scheduling_id:
+            Scheduling.objects.filter(
+                pk=task.scheduling_id,
+                calendar_event_id=operation['event_id'],
+            ).update(calendar_event_id=None)
+
+    return errors[0] if errors else None
+
+
+def get_backoff(attempts: int) -> timedelta:
+    """
+    Computes how long to wait before trying a task again.
+
+    Args:
+        attempts (int): How many times the task has been tried.
+
+    Returns:
+        timedelta: The exponential delay, capped at `BACKOFF_MAX`.
+    """
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def claim_tasks(limit: int) -> list:
+    """
+    Takes the due pending tasks, oldest first, for the current worker, in a
+    transaction of its own.
+
+    The claimed tasks are skipped by the other workers until they are
+    released or until `CLAIM_TIMEOUT` has passed, so no row lock is held
+    while the calendar is called. So are the other tasks of their
+    schedules, e.g. an update queued while an insert is running, which
+    would otherwise create a second event.
+
+    Args:
+        limit (int): The maximum number of tasks to claim.
+
+    Returns:
+        list: The claimed tasks, with their scheduling and service.
+    """
+    now = timezone.now()
+    expired = Q(claimed_at__lt=now - CLAIM_TIMEOUT)
+    busy = CalendarSyncTask.objects.filter(
+        ~expired, status='pending', claimed_at__isnull=False,
+        scheduling__isnull=False).values('scheduling_id')
+    with transaction.atomic():
+        ids = list(
+            CalendarSyncTask.objects.select_for_update(
+                skip_locked=True
+            ).filter(
+                Q(claimed_at__isnull=True) | expired,
+                status='pending', next_attempt_at__lte=now,
+            ).exclude(
+                Q(claimed_at__isnull=True) & Q(scheduling__in=busy)
+            ).order_by('pk').values_list('pk', flat=True)[:limit]
+        )
+        CalendarSyncTask.objects.filter(pk__in=ids).update(claimed_at=now)
+
+    return list(
+        CalendarSyncTask.objects.select_related('scheduling__service').filter(
+            pk__in=ids).order_by('pk'))
+
+
+def process_pending_tasks(limit: int = 50, backend=None) -> dict:
+    """
+    Runs the due pending tasks, oldest first, sending their calendar
+    operations together as a batch.
+
+    The tasks are claimed first, see `claim_tasks`, so several workers can
+    drain the outbox at the same time, then the calendar is called outside
+    any transaction and the outcomes are recorded in a short one. Failed
+    tasks are retried with an exponential backoff and marked as failed
+    after `MAX_ATTEMPTS` attempts.
+
+    Args:
+        limit (int): The maximum number of tasks to run.
+        backend: The calendar backend. Defaults to the configured one.
+
+    Returns:
+        dict: How many tasks were `done`, will be `retried` or have `failed`.
+    """
+    backend = backend or get_calendar_backend()
+    summary = {'done': 0, 'retried': 0, 'failed': 0}
+
+    tasks = claim_tasks(limit)
+
+    plan = []
+    operations = []
+    for task in tasks:
+        task_operations = build_task_operations(task)
+        plan.append((task, len(operations), task_operations))
+        operations.extend(task_operations)
+
+    results = backend.execute_batch(operations) if operations else []
+
+    with transaction.atomic():
+        for task, offset, task_operations in plan:
+            task.attempts += 1
+            task.claimed_at = None
+            error = apply_task_results(
+                task, task_operations,
+                results[offset:offset + len(task_operations)])
+
+            if error is None:
+                task.status = 'done'
+                task.last_error = ''
+                summary['done'] += 1
+            elif task.attempts >= MAX_ATTEMPTS:
+                task.status = 'failed'
+                task.last_error = error
+                summary['failed'] += 1
+            else:
+                task.next_attempt_at = (
+                    timezone.now() + get_backoff(task.attempts))
+                task.last_error = error
+                summary['retried'] += 1
+
+            task.save(update_fields=[
+                'attempts', 'claimed_at', 'status', 'last_error',
+                'next_attempt_at'])
+
+    return summary
@@ -1,9 +1,23 @@
 from datetime import datetime
+from django.conf import settings
+from django.utils.module_loading import import_string
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
 from pathlib import Path
 from dotenv import load_dotenv
+import httplib2
 import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from appointments.utils.metrics import (
+    CALENDAR_REQUEST_SECONDS, CALENDAR_REQUESTS, CallbackCounter
+)
+from appointments.utils.timing import timed
 
 
 ROOT_FILE = Path(__file__).parent.parent.parent
@@ -12,25 +26,147 @@ load_dotenv(ROOT_FILE / 'env' / '.env')
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 CREDENTIALS_FILE = ROOT_FILE / 'secrets' / 'barber_service.json'
 CALENDAR_ID = os.getenv('CALENDAR_ID')
+HTTP_TIMEOUT = 10
+# Largest number of calls sent in one HTTP batch request.
+BATCH_SIZE = 50
+
+
+class CalendarClient:
+    """
+    Process-wide holder of the Google Calendar client.
+
+    The service account credentials and the discovery document are loaded
+    once per process. Each thread gets its own client, built on top of its
+    own HTTP connection, because `httplib2.Http` is not thread-safe; the
+    client is then reused by every later call made from that thread, keeping
+    the connection open. Access tokens are refreshed lazily by the
+    authorized HTTP object, right before a request needs them.
+
+    Attributes
+    ----------
+    builds : int
+        How many clients have been built.
+
+    builds_avoided : int
+        How many calls were served by an already built client.
+    """
+
+    def __init__(self, credentials_file, scopes):
+        self.credentials_file = credentials_file
+        self.scopes = scopes
+        self.builds = 0
+        self.builds_avoided = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._credentials = None
+        self._document = None
+
+    def get_credentials(self):
+        """
+        Loads the service account credentials on first use.
+
+        Returns:
+            google.oauth2.service_account.Credentials: The shared credentials.
+        """
+        if self._credentials is None:
+            with self._lock:
+                if self._credentials is None:
+                    self._credentials = (
+                        service_account.Credentials.from_service_account_file(
+                            self.credentials_file, scopes=self.scopes))
+        return self._credentials
+
+    def get_discovery_document(self):
+        """
+        Reads the Calendar v3 discovery document shipped with the Google API
+        client on first use.
+
+        Returns:
+            str: The discovery document.
+        """
+        if self._document is None:
+            with self._lock:
+                if self._document is None:
+                    self._document = discovery_cache.get_static_doc(
+                        'calendar', 'v3')
+        return self._document
+
+    def get_service(self):
+        """
+        Retrieves the calendar client of the current thread, building it on
+        first use.
+
+        Returns:
+            googleapiclient.discovery.Resource: The calendar service instance.
+        """
+        service = getattr(self._local, 'service', None)
+
+        if service is not None:
+            with self._lock:
+                self.builds_avoided += 1
+            return service
+
+        http = AuthorizedHttp(
+            self.get_credentials(), http=httplib2.Http(timeout=HTTP_TIMEOUT))
+        service = build_from_document(
+            self.get_discovery_document(), http=http)
+        self._local.service = service
+
+        with self._lock:
+            self.builds += 1
+        return service
+
+    def reset(self):
+        """
+        Drops the loaded credentials, the discovery document and the
+        clients of every thread, forcing them to be loaded and built again
+        on the next call of each thread.
+        """
+        with self._lock:
+            self._credentials = None
+            self._document = None
+            self._local = threading.local()
+
+    def stats(self) -> dict:
+        """
+        Returns the build counters of the client.
+
+        Returns:
+            dict: The `builds` and `builds_avoided` counters.
+        """
+        with self._lock:
+            return {
+                'builds': self.builds,
+                'builds_avoided': self.builds_avoided,
+            }
+
+
+calendar_client = CalendarClient(CREDENTIALS_FILE, SCOPES)
+
+CALENDAR_CLIENT_BUILDS = CallbackCounter(
+    'calendar_client_builds_total', 'Google Calendar clients built.',
+    lambda: calendar_client.stats()['builds'])
+CALENDAR_CLIENT_BUILDS_AVOIDED = CallbackCounter(
+    'calendar_client_builds_avoided_total',
+    'Calendar calls served by an already built client.',
+    lambda: calendar_client.stats()['builds_avoided'])
 
 
 def get_calendar_service():
     """
     Retrieves the Google Calendar service using the service account
-    credentials.
+    credentials, reusing the client already built for the current thread.
 
     Returns:
         googleapiclient.discovery.Resource: The calendar service instance.
     """
-    credentials = service_account.Credentials.from_service_account_file(
-        CREDENTIALS_FILE, scopes=SCOPES)
-    return build('calendar', 'v3', credentials=credentials)
+    return calendar_client.get_service()
 
 
-def insert_into_calendar(
+def build_event(
         summary: str, start: datetime, end: datetime, description: str):
     """
-    Inserts an event into the Google Calendar.
+    Builds the body of a Google Calendar event.
 
     Args:
         summary (str): The title of the event.
@@ -39,10 +175,9 @@ def insert_into_calendar(
         description (str): A description for the event.
 
     Returns:
-        dict: The created event object if successful, None if failed.
+        dict: The event body expected by the Calendar API.
     """
-    service = get_calendar_service()
-    event = {
+    return {
         'summary': f'Serviço agendado - {summary}',
         'description': description,
         'start': {
@@ -55,31 +190,303 @@ def insert_into_calendar(
         },
     }
 
+
+@contextmanager
+def observe_request(operation: str):
+    """
+    Measures a calendar API request, for the request timing and for the
+    calendar metrics.
+
+    Args:
+        operation (str): `insert`, `patch`, `delete` or `batch`.
+    """
+    start = time.perf_counter()
+    outcome = 'error'
     try:
-        created_event = service.events().insert(
-            calendarId=CALENDAR_ID, body=event).execute()
+        with timed('http'):
+            yield
+        outcome = 'ok'
+    finally:
+        CALENDAR_REQUEST_SECONDS.observe(
+            time.perf_counter() - start, operation=operation)
+        CALENDAR_REQUESTS.inc(operation=operation, outcome=outcome)
+
+
+class GoogleCalendarBackend:
+    """
+    Calendar backend that talks to the Google Calendar API.
+
+    Errors are raised to the caller, so that it can decide whether to retry.
+    """
+
+    def insert(self, event: dict) -> dict:
+        """
+        Inserts an event into the calendar.
+
+        Args:
+            event (dict): The event body.
+
+        Returns:
+            dict: The created event object.
+        """
+        request = self.build_request(
+            get_calendar_service(), {'action': 'insert', 'event': event})
+        with observe_request('insert'):
+            return request.execute()
+
+    def patch(self, event_id: str, event: dict) -> dict:
+        """
+        Changes the given fields of an existing event.
+
+        Args:
+            event_id (str): The ID of the event to be changed.
+            event (dict): The fields to change.
+
+        Returns:
+            dict: The updated event object.
+        """
+        request = self.build_request(
+            get_calendar_service(),
+            {'action': 'patch', 'event_id': event_id, 'event': event})
+        with observe_request('patch'):
+            return request.execute()
+
+    def delete(self, event_id: str):
+        """
+        Deletes an event from the calendar. Events that no longer exist are
+        considered deleted.
+
+        Args:
+            event_id (str): The ID of the event to be deleted.
+        """
+        request = self.build_request(
+            get_calendar_service(),
+            {'action': 'delete', 'event_id': event_id})
+        try:
+            with observe_request('delete'):
+                request.execute()
+        except HttpError as e:
+            if not self.is_missing_event(e):
+                raise
+
+    def execute_batch(self, operations: list) -> list:
+        """
+        Runs many operations using HTTP batch requests of up to `BATCH_SIZE`
+        calls each.
+
+        Args:
+            operations (list): The operations, see `sync_calendar_batch`.
+
+        Returns:
+            list: One result per operation, in the same order.
+        """
+        service = get_calendar_service()
+        results = [None] * len(operations)
+
+        def callback(request_id, response, exception):
+            index = int(request_id)
+            if exception is None or (
+                    operations[index]['action'] == 'delete'
+                    and self.is_missing_event(exception)):
+                results[index] = {
+                    'ok': True, 'event': response or None, 'error': None}
+            else:
+                results[index] = {
+                    'ok': False, 'event': None, 'error': str(exception)}
+
+        for offset in range(0, len(operations), BATCH_SIZE):
+            chunk = range(offset, min(offset + BATCH_SIZE, len(operations)))
+            batch = service.new_batch_http_request(callback=callback)
+            for index in chunk:
+                batch.add(self.build_request(service, operations[index]),
+                          request_id=str(index))
+
+            try:
+                with observe_request('batch'):
+                    batch.execute()
+            except Exception as e:
+                for index in chunk:
+                    if results[index] is None:
+                        results[index] = {
+                            'ok': False, 'event': None, 'error': str(e)}
+
+        return results
+
+    def build_request(self, service, operation: dict):
+        """
+        Builds the Calendar API request of an operation, without running it.
+
+        Args:
+            service (googleapiclient.discovery.Resource): The calendar
+                service instance.
+            operation (dict): The operation.
+
+        Returns:
+            googleapiclient.http.HttpRequest: The request.
+        """
+        events = service.events()
+        action = operation['action']
+
+        if action == 'insert':
+            return events.insert(
+                calendarId=CALENDAR_ID, body=operation['event'])
+        if action == 'patch':
+            return events.patch(
+                calendarId=CALENDAR_ID, eventId=operation['event_id'],
+                body=operation['event'])
+        if action == 'delete':
+            return events.delete(
+                calendarId=CALENDAR_ID, eventId=operation['event_id'])
+
+        raise ValueError(f'Unknown calendar operation: {action}')
+
+    @staticmethod
+    def is_missing_event(error) -> bool:
+        """
+        Checks whether an error means that the event does not exist anymore.
+        """
+        return isinstance(error, HttpError) and error.resp.status in (404, 410)
+
+
+class LocalCalendarBackend:
+    """
+    In-memory calendar backend, used in development and tests instead of
+    Google Calendar.
+
+    Attributes
+    ----------
+    events : dict
+        The stored events, keyed by their ID.
+    """
+
+    def __init__(self):
+        self.events = {}
+        self._lock = threading.Lock()
+
+    def insert(self, event: dict) -> dict:
+        """
+        Stores an event under a new random ID.
+
+        Args:
+            event (dict): The event body.
+
+        Returns:
+            dict: The stored event, including its ID.
+        """
+        created_event = {**event, 'id': uuid.uuid4().hex}
+        with self._lock:
+            self.events[created_event['id']] = created_event
         return created_event
 
-    except Exception as e:
-        print(f"Erro ao criar evento: {e}")
-        return
+    def patch(self, event_id: str, event: dict) -> dict:
+        """
+        Changes the given fields of a stored event.
 
+        Args:
+            event_id (str): The ID of the event to be changed.
+            event (dict): The fields to change.
 
-def delete_from_calendar(event_id):
+        Returns:
+            dict: The updated event.
+
+        Raises:
+            KeyError: If the event does not exist.
+        """
+        with self._lock:
+            updated_event = {**self.events[event_id], **event}
+            self.events[event_id] = updated_event
+        return updated_event
+
+    def delete(self, event_id: str):
+        """
+        Removes an event, if it exists.
+
+        Args:
+            event_id (str): The ID of the event to be deleted.
+        """
+        with self._lock:
+            self.events.pop(event_id, None)
+
+    def clear(self):
+        """
+        Removes every stored event.
+        """
+        with self._lock:
+            self.events.clear()
+
+    def execute_batch(self, operations: list) -> list:
+        """
+        Runs many operations one after the other.
+
+        Args:
+            operations (list): The operations, see `sync_calendar_batch`.
+
+        Returns:
+            list: One result per operation, in the same order.
+        """
+        results = []
+        for operation in operations:
+            try:
+                action = operation['action']
+                if action == 'insert':
+                    event = self.insert(operation['event'])
+                elif action == 'patch':
+                    event = self.patch(
+                        operation['event_id'], operation['event'])
+                elif action == 'delete':
+                    event = self.delete(operation['event_id'])
+                else:
+                    raise ValueError(
+                        f'Unknown calendar operation: {action}')
+            except Exception as e:
+                results.append({'ok': False, 'event': None, 'error': str(e)})
+            else:
+                results.append({'ok': True, 'event': event, 'error': None})
+        return results
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_calendar_backend():
     """
-    Deletes an event from the Google Calendar using its event ID.
+    Retrieves the calendar backend configured by the `CALENDAR_BACKEND`
+    setting. A single instance is kept per backend class.
+
+    Returns:
+        GoogleCalendarBackend | LocalCalendarBackend: The calendar backend.
+    """
+    path = getattr(
+        settings, 'CALENDAR_BACKEND',
+        'appointments.services.google_calendar_service.GoogleCalendarBackend')
+
+    with _backends_lock:
+        if path not in _backends:
+            _backends[path] = import_string(path)()
+        return _backends[path]
+
+
+def sync_calendar_batch(operations: list) -> list:
+    """
+    Runs many calendar operations at once, reporting the outcome of each one
+    so that partial failures can be handled by the caller.
+
+    Each operation is a dict with an `action` key and the keys that action
+    needs:
+
+    - `{'action': 'insert', 'event': {...}}`
+    - `{'action': 'patch', 'event_id': '...', 'event': {...}}`
+    - `{'action': 'delete', 'event_id': '...'}`
 
     Args:
-        event_id (str): The ID of the event to be deleted.
+        operations (list): The operations to run.
 
     Returns:
-        None: Prints a success or error message.
+        list: One dict per operation, in the same order, with `ok`, the
+            resulting `event` (None for deletes) and the `error` message.
     """
-    service = get_calendar_service()
-    try:
-        service.events().delete(
-            calendarId=CALENDAR_ID, eventId=event_id).execute()
+    if not operations:
+        return []
+    return get_calendar_backend().execute_batch(operations)
 
-        print(f"{event_id} event has been deleted successfully.")
-    except Exception as e:
-        print(f"Error in delete operation: {e}")
@@ -0,0 +1,374 @@
+import csv
+import itertools
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from appointments.models import (
+    BarberService, CalendarSyncTask, CustomUser, Scheduling
+)
+from appointments.services.occupancy_service import (
+    bump_occupancy_version, get_days, get_recurrence_intervals, get_resource,
+    get_window
+)
+from appointments.services.staff_service import (
+    get_shifts, has_staff_schedule, is_working
+)
+from appointments.utils.changes import bump_change_marker
+
+IMPORT_CHUNK_SIZE = 1000
+STATUSES = {status for status, _ in Scheduling.STATUS_CHOICES}
+STAFF_REQUIRED_MESSAGE = (
+    'staff: campo obrigatório quando há horários de trabalho.')
+OFF_SHIFT_MESSAGE = 'staff: o profissional não trabalha neste horário.'
+
+
+def read_rows(stream, file_format: str = 'csv'):
+    """
+    Reads the rows of an import file one at a time.
+
+    CSV files need a header, e.g. the one written by the export. JSON files
+    hold either one object per line, as the export writes them, or a single
+    array of objects, which is read at once. Files saved with a UTF-8 BOM,
+    as spreadsheets do, must be opened with the `utf-8-sig` encoding.
+
+    Args:
+        stream (TextIO): The open file.
+        file_format (str): `csv` or `json`.
+
+    Yields:
+        tuple: The line number and the row as a dictionary, or None when
+            the line is not valid JSON.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    first_line = stream.readline()
+    if first_line.lstrip().startswith('['):
+        yield from enumerate(json.loads(first_line + stream.read()), start=1)
+        return
+
+    for number, line in enumerate(
+            itertools.chain([first_line], stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+
+class IntervalIndex:
+    """
+    The active bookings of each resource per local day, loaded from the
+    database in one query per chunk of imported rows, plus the occurrences
+    of the recurrence rules that are not materialized yet, and kept up to
+    date with the rows accepted so far, so that overlaps are found in
+    memory.
+    """
+
+    def __init__(self):
+        self.intervals = defaultdict(list)
+        self.loaded_days = set()
+
+    def load(self, days):
+        """
+        Loads the bookings and the recurrence occurrences of the days that
+        are not in the index yet.
+        """
+        days = sorted(set(days) - self.loaded_days)
+        if not days:
+            return
+
+        range_start = get_window(days[0])[0]
+        range_end = get_window(days[-1])[1]
+        bookings = Scheduling.objects.filter(
+            status='active',
+            date_time__lt=range_end,
+            end_time__gt=range_start,
+        ).values_list('staff_id', 'service_id', 'date_time', 'end_time')
+        intervals = [
+            (('staff', staff_id) if staff_id else ('service', service_id),
+             start, end)
+            for staff_id, service_id, start, end in bookings
+        ]
+        intervals += [
+            (resource, start, end)
+            for resource, occurrences in get_recurrence_intervals(
+                None, range_start, range_end).items()
+            for start, end in occurrences
+        ]
+
+        missing = set(days)
+        for resource, start, end in intervals:
+            for day in get_days(start, end):
+                if day in missing:
+                    self.intervals[resource, day].append((start, end))
+        self.loaded_days.update(days)
+
+    def overlaps(self, resource: tuple, start: datetime,
+                 end: datetime) -> bool:
+        return any(
+            booking_start < end and start < booking_end
+            for day in get_days(start, end)
+            for booking_start, booking_end in self.intervals[resource, day]
+        )
+
+    def add(self, resource: tuple, start: datetime, end: datetime):
+        for day in get_days(start, end):
+            self.intervals[resource, day].append((start, end))
+
+
+def parse_id(value) -> int:
+    """
+    Converts an ID read from CSV, a string, or from JSON, a number.
+
+    Raises:
+        ValueError: If the value is not an integer, e.g. `1.9` or `true`,
+            which `int` would silently turn into 1.
+    """
+    if isinstance(value, bool) or (
+            isinstance(value, float) and not value.is_integer()):
+        raise ValueError(value)
+    return int(value)
+
+
+def parse_row(row, services: dict) -> tuple:
+    """
+    Converts the values of an import row.
+
+    Args:
+        row (dict | None): The raw row.
+        services (dict): Every service, keyed by ID.
+
+    Returns:
+        tuple: The parsed values and the list of error messages.
+    """
+    if not isinstance(row, dict):
+        return {}, ['Linha inválida.']
+
+    errors = []
+    values = {
+        'notes': row.get('notes') or None,
+        'client_name': row.get('client_name') or '',
+        'status': row.get('status') or 'active',
+    }
+
+    for field in ('client', 'staff', 'service'):
+        value = row.get(field)
+        try:
+            values[field] = (
+                parse_id(value) if value not in (None, '') else None)
+        except (TypeError, ValueError):
+            errors.append(f'{field}: "{value}" não é um ID válido.')
+            values[field] = None
+
+    if values['client'] is None and row.get('client') in (None, ''):
+        errors.append('client: campo obrigatório.')
+
+    service = values['service'] = services.get(values['service'])
+    if service is None:
+        errors.append('service: serviço não encontrado.')
+
+    try:
+        date_time = parse_datetime(str(row.get('date_time') or ''))
+    except ValueError:
+        date_time = None
+    if date_time is None:
+        errors.append(f'date_time: "{row.get("date_time")}" não é uma data '
+                      'e hora válida.')
+    else:
+        if timezone.is_naive(date_time):
+            date_time = timezone.make_aware(date_time)
+        values['date_time'] = date_time
+        if service is not None:
+            values['end_time'] = date_time + timedelta(
+                minutes=service.duration)
+
+    if values['status'] not in STATUSES:
+        errors.append(f'status: "{values["status"]}" não é um status '
+                      'válido.')
+
+    return values, errors
+
+
+def import_schedules(rows, chunk_size: int = IMPORT_CHUNK_SIZE,
+                     dry_run: bool = False) -> dict:
+    """
+    Validates and creates schedules in bulk, a chunk at a time.
+
+    Every row is checked against the business hours and, when active,
+    against the active bookings and the recurrence rules of its employee
+    or service, including the rows imported before it. Bookings without
+    an employee hold their service whatever the row. When the shop has
+    working hours, active rows must name an employee working during their
+    whole range, like the booking form requires. Invalid rows are
+    reported and skipped without stopping the import. Active schedules get
+    their calendar events queued in bulk, like the ones created through
+    the views.
+
+    Args:
+        rows (Iterable[tuple]): Line numbers and rows, see `read_rows`.
+        chunk_size (int): How many rows are validated and written at once.
+        dry_run (bool): Only validate, writing nothing.
+
+    Returns:
+        dict: The number of schedules `created` and the `errors`, a list of
+            `(line, message)` pairs.
+    """
+    services = BarberService.objects.in_bulk()
+    index = IntervalIndex()
+    # Without a staff schedule, employees are not bound to shifts.
+    shifts = get_shifts() if has_staff_schedule() else None
+    summary = {'created': 0, 'errors': []}
+
+    chunk = []
+    for line, row in rows:
+        chunk.append((line, row))
+        if len(chunk) >= chunk_size:
+            import_chunk(chunk, services, index, summary, dry_run, shifts)
+            chunk = []
+    if chunk:
+        import_chunk(chunk, services, index, summary, dry_run, shifts)
+
+    if summary['created']:
+        # `bulk_create` sends no signals.
+        bump_occupancy_version()
+        bump_change_marker(Scheduling)
+    summary['errors'].sort(key=lambda error: error[0])
+    return summary
+
+
+def import_chunk(chunk: list, services: dict, index: IntervalIndex,
+                 summary: dict, dry_run: bool, shifts: dict = None):
+    """
+    Validates and writes one chunk of rows, see `import_schedules`.
+    """
+    parsed = []
+    for line, row in chunk:
+        values, errors = parse_row(row, services)
+        if errors:
+            summary['errors'] += [(line, error) for error in errors]
+        else:
+            parsed.append((line, values))
+
+    # Three queries per chunk: the users, then the bookings and the
+    # recurrence rules of the days not seen yet.
+    user_ids = {values['client'] for _, values in parsed} | {
+        values['staff'] for _, values in parsed if values['staff']}
+    users = CustomUser.objects.only(
+        'pk', 'first_name', 'last_name', 'user_type').in_bulk(user_ids)
+    index.load(
+        day for _, values in parsed
+        for day in get_days(values['date_time'], values['end_time']))
+
+    schedules = []
+    for line, values in parsed:
+        error = validate_values(values, users, index, shifts)
+        if error:
+            summary['errors'].append((line, error))
+            continue
+
+        client = users[values['client']]
+        schedule = Scheduling(
+            client=client,
+            client_name=values['client_name'] or client.get_full_name(),
+            staff_id=values['staff'],
+            service=values['service'],
+            date_time=values['date_time'],
+            status=values['status'],
+            end_time=values['end_time'],
+            notes=values['notes'],
+        )
+        if schedule.status == 'active':
+            index.add(get_resource(schedule), schedule.date_time,
+                      schedule.end_time)
+        schedules.append((line, schedule))
+
+    if dry_run or not schedules:
+        return
+
+    try:
+        with transaction.atomic():
+            summary['created'] += save_schedules(
+                [schedule for _, schedule in schedules])
+    except IntegrityError:
+        # Someone booked concurrently: find the offending rows one by one.
+        for line, schedule in schedules:
+            try:
+                with transaction.atomic():
+                    summary['created'] += save_schedules([schedule])
+            except IntegrityError as error:
+                summary['errors'].append((line, str(error)))
+
+
+def validate_values(values: dict, users: dict, index: IntervalIndex,
+                    shifts: dict = None):
+    """
+    Checks a parsed row against the users, the business hours and the
+    bookings in the index.
+
+    `shifts` holds the shifts of every employee, see `get_shifts`, or None
+    when the shop has no working hours. With them, active rows must name
+    an employee who works during their whole range, like `ScheduleForm`
+    only assigns such an employee.
+
+    Returns:
+        str | None: The error message, if any.
+    """
+    client = users.get(values['client'])
+    if client is None:
+        return 'client: cliente não encontrado.'
+
+    staff_id = values['staff']
+    if staff_id and getattr(users.get(staff_id), 'user_type', None) != (
+            'employee'):
+        return 'staff: profissional não encontrado.'
+
+    date_time = values['date_time']
+    local_time = timezone.localtime(date_time).time()
+    if not (Scheduling.OPENING_TIME <= local_time
+            <= Scheduling.CLOSING_TIME):
+        return ('O agendamento deve ser feito durante o horário comercial '
+                '(07:00 - 17:00).')
+
+    if values['status'] != 'active':
+        return None
+
+    if shifts is not None:
+        if not staff_id:
+            return STAFF_REQUIRED_MESSAGE
+        if not is_working(shifts.get(staff_id, {}), date_time,
+                          values['end_time']):
+            return OFF_SHIFT_MESSAGE
+
+    # Bookings without an employee hold their service, see
+    # `has_service_conflict`.
+    resources = [('service', values['service'].pk)]
+    if staff_id:
+        resources.append(('staff', staff_id))
+    if any(index.overlaps(resource, date_time, values['end_time'])
+           for resource in resources):
+        return 'O horário conflita com outro agendamento ativo.'
+    return None
+
+
+def save_schedules(schedules: list) -> int:
+    """
+    Inserts schedules and queues the calendar events of the active ones.
+    Must be called inside a transaction.
+
+    Returns:
+        int: The number of schedules created.
+    """
+    schedules = Scheduling.objects.bulk_create(schedules)
+    CalendarSyncTask.objects.bulk_create(
+        CalendarSyncTask(scheduling=schedule, action='insert')
+        for schedule in schedules if schedule.status == 'active'
+    )
+    return len(schedules)
@@ -0,0 +1,358 @@
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from appointments.models import RecurrenceRule, Scheduling
+
+SLOT_MINUTES = 5
+SLOT = timedelta(minutes=SLOT_MINUTES)
+OCCUPANCY_TIMEOUT = 60 * 10
+OCCUPANCY_VERSION_KEY = 'occupancy:version'
+
+
+def get_window(day: date) -> tuple:
+    """
+    Returns the range covered by the occupancy bitmap of a day: from the
+    opening time until midnight, so that bookings starting at the closing
+    time still fit.
+
+    Args:
+        day (date): The day, in the local time zone.
+
+    Returns:
+        tuple: The aware `(start, end)` datetimes of the window.
+    """
+    start = timezone.make_aware(
+        datetime.combine(day, Scheduling.OPENING_TIME))
+    end = timezone.make_aware(
+        datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def get_slot_mask(day: date, start: datetime, end: datetime) -> int:
+    """
+    Builds the bitmask of the 5-minute slots of a day touched by a range.
+
+    Partial slots count as touched, so a mask always covers its range and
+    two masks that don't intersect belong to ranges that don't overlap.
+
+    Args:
+        day (date): The day of the bitmap.
+        start (datetime): The beginning of the range.
+        end (datetime): The end of the range.
+
+    Returns:
+        int: The mask, bit `n` standing for the `n`-th slot of the window.
+    """
+    window_start, window_end = get_window(day)
+    start = max(start, window_start)
+    end = min(end, window_end)
+    if start >= end:
+        return 0
+
+    first = (start - window_start) // SLOT
+    last = -((window_start - end) // SLOT)
+    return ((1 << (last - first)) - 1) << first
+
+
+def get_days(start: datetime, end: datetime) -> list:
+    """
+    Lists the local days a range touches.
+    """
+    day = timezone.localdate(start)
+    last_day = timezone.localdate(end)
+    days = []
+    while day <= last_day:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def get_resource(booking) -> tuple:
+    """
+    Returns what a booking occupies: its employee or, when it has none, its
+    service.
+
+    Args:
+        booking: A `Scheduling`, or any object with `staff_id` and
+            `service_id` attributes.
+
+    Returns:
+        tuple: `('staff', staff_id)` or `('service', service_id)`.
+    """
+    if booking.staff_id:
+        return ('staff', booking.staff_id)
+    return ('service', booking.service_id)
+
+
+def get_occupancy_version() -> int:
+    """
+    Retrieves the version of all the occupancy bitmaps. It restarts from
+    the current time when missing, see `get_catalog_version`.
+    """
+    version = cache.get(OCCUPANCY_VERSION_KEY)
+    if version is None:
+        cache.add(OCCUPANCY_VERSION_KEY,
+                  int(timezone.now().timestamp() * 1000), timeout=None)
+        version = cache.get(OCCUPANCY_VERSION_KEY)
+    return version
+
+
+def bump_occupancy_version():
+    """
+    Invalidates every occupancy bitmap at once. Used when recurrence rules
+    change, since their occurrences may fall on any future day.
+    """
+    try:
+        cache.incr(OCCUPANCY_VERSION_KEY)
+    except ValueError:
+        get_occupancy_version()
+
+
+def get_generation_key(resource: tuple, day: date) -> str:
+    kind, resource_id = resource
+    return f'occupancy:generation:{kind}:{resource_id}:{day.isoformat()}'
+
+
+def get_generations(pairs) -> dict:
+    """
+    Retrieves the generations of the bitmaps of several resources and days.
+
+    Each bitmap is stored under its generation, which moves whenever a
+    booking of that resource and day changes, see `invalidate_occupancy`.
+    A bitmap built from rows read before the change is written under the
+    old generation and never read again, so a build can't overwrite a
+    newer invalidation. Missing generations restart from the current
+    time, see `get_catalog_version`.
+
+    Args:
+        pairs (Iterable[tuple]): The `(resource, day)` pairs.
+
+    Returns:
+        dict: A mapping of each pair to its generation.
+    """
+    keys = {pair: get_generation_key(*pair) for pair in pairs}
+    generations = cache.get_many(keys.values())
+
+    missing = [key for key in keys.values() if key not in generations]
+    if missing:
+        now = int(timezone.now().timestamp() * 1000)
+        for key in missing:
+            cache.add(key, now, OCCUPANCY_TIMEOUT)
+        generations.update(cache.get_many(missing))
+    return {
+        pair: generations.get(key) for pair, key in keys.items()
+    }
+
+
+def get_occupancy_key(resource: tuple, day: date, version: int,
+                      generation: int) -> str:
+    kind, resource_id = resource
+    return (f'occupancy:{version}:{kind}:{resource_id}:{day.isoformat()}:'
+            f'{generation}')
+
+
+def get_resource_filter(resources) -> Q:
+    """
+    Builds the filter of the bookings or rules occupying any of the given
+    resources.
+    """
+    staff_ids = {resource_id for kind, resource_id in resources
+                 if kind == 'staff'}
+    service_ids = {resource_id for kind, resource_id in resources
+                   if kind == 'service'}
+    return (Q(staff_id__in=staff_ids)
+            | Q(service_id__in=service_ids, staff__isnull=True))
+
+
+def get_recurrence_intervals(resources, start: datetime, end: datetime,
+                             exclude_rule=None) -> dict:
+    """
+    Expands, with a single query, the occurrences of the active recurrence
+    rules of some resources that overlap a window and are not materialized
+    yet. Materialized ones are regular bookings.
+
+    Args:
+        resources (Iterable[tuple] | None): The resources, see
+            `get_resource`, or None for every resource.
+        start (datetime): The beginning of the window.
+        end (datetime): The end of the window.
+        exclude_rule (int, optional): A rule to leave out.
+
+    Returns:
+        dict: A mapping of each resource to its `(start, end)` intervals.
+    """
+    rules = RecurrenceRule.objects.filter(
+        Q(until__isnull=True) | Q(until__gte=timezone.localdate(start)
+                                  - timedelta(days=1)),
+        is_active=True,
+        first_occurrence__lt=end,
+    ).select_related('service')
+    if resources is not None:
+        rules = rules.filter(get_resource_filter(resources))
+    if exclude_rule:
+        rules = rules.exclude(pk=exclude_rule)
+
+    intervals = defaultdict(list)
+    for rule in rules:
+        duration = timedelta(minutes=rule.service.duration)
+        window_start = start - duration
+        if rule.materialized_until:
+            window_start = max(window_start, rule.materialized_until)
+
+        for occurrence in rule.get_occurrences(window_start, end):
+            intervals[get_resource(rule)].append(
+                (occurrence, occurrence + duration))
+    return intervals
+
+
+def has_recurrence_conflict(resource: tuple, start: datetime,
+                            end: datetime, exclude_rule=None) -> bool:
+    """
+    Checks whether a range overlaps an occurrence of a recurrence rule that
+    is not materialized yet.
+    """
+    return bool(get_recurrence_intervals(
+        [resource], start, end, exclude_rule=exclude_rule)[resource])
+
+
+def get_occupancies(resources, days) -> dict:
+    """
+    Retrieves the occupancy bitmaps of several resources and days.
+
+    The generations and then the cached bitmaps are read in one round trip
+    each, and the missing bitmaps are built from one query on the bookings
+    and one on the recurrence rules.
+
+    Args:
+        resources (Iterable[tuple]): The resources, see `get_resource`.
+        days (Iterable[date]): The days, in the local time zone.
+
+    Returns:
+        dict: A mapping of each `(resource, day)` pair to its bitmap.
+    """
+    version = get_occupancy_version()
+    generations = get_generations(
+        (resource, day) for resource in resources for day in days)
+    keys = {
+        pair: get_occupancy_key(*pair, version, generation)
+        for pair, generation in generations.items()
+    }
+    cached = cache.get_many(keys.values())
+    occupancies = {
+        pair: cached[key] for pair, key in keys.items() if key in cached
+    }
+
+    missing = set(keys) - set(occupancies)
+    if not missing:
+        return occupancies
+
+    built = dict.fromkeys(missing, 0)
+    missing_days = sorted({day for _, day in missing})
+    missing_resources = {resource for resource, _ in missing}
+    range_start = get_window(missing_days[0])[0]
+    range_end = get_window(missing_days[-1])[1]
+
+    bookings = Scheduling.objects.filter(
+        get_resource_filter(missing_resources),
+        status='active',
+        date_time__lt=range_end,
+        end_time__gt=range_start,
+    ).values_list('staff_id', 'service_id', 'date_time', 'end_time')
+    intervals = [
+        (('staff', staff_id) if staff_id else ('service', service_id),
+         booking_start, booking_end)
+        for staff_id, service_id, booking_start, booking_end in bookings
+    ]
+
+    # Future occurrences of recurrence rules are busy too.
+    recurrences = get_recurrence_intervals(
+        missing_resources, range_start, range_end)
+    intervals += [
+        (resource, occurrence_start, occurrence_end)
+        for resource, occurrences in recurrences.items()
+        for occurrence_start, occurrence_end in occurrences
+    ]
+
+    for resource, booking_start, booking_end in intervals:
+        for day in get_days(booking_start, booking_end):
+            if (resource, day) in built:
+                built[resource, day] |= get_slot_mask(
+                    day, booking_start, booking_end)
+
+    cache.set_many({keys[pair]: mask for pair, mask in built.items()},
+                   OCCUPANCY_TIMEOUT)
+    occupancies.update(built)
+    return occupancies
+
+
+def is_free(occupancy: int, day: date, start: datetime,
+            end: datetime) -> bool:
+    """
+    Checks a range of a day against the bitmap of that day.
+
+    Args:
+        occupancy (int): The bitmap of the day.
+        day (date): The day.
+        start (datetime): The beginning of the range.
+        end (datetime): The end of the range.
+
+    Returns:
+        bool: True when the range lies inside the window of the day and
+            certainly overlaps no booking. False when it may overlap one,
+            or when the bitmap can't tell.
+    """
+    window_start, window_end = get_window(day)
+    if start < window_start or end > window_end:
+        return False
+    return not occupancy & get_slot_mask(day, start, end)
+
+
+def may_conflict(resource: tuple, start: datetime, end: datetime) -> bool:
+    """
+    Checks a range against the occupancy bitmap of its day.
+
+    Args:
+        resource (tuple): The employee or service, see `get_resource`.
+        start (datetime): The beginning of the range.
+        end (datetime): The end of the range.
+
+    Returns:
+        bool: False when the range is certainly free. True when it may
+            overlap a booking, which must then be confirmed in the
+            database.
+    """
+    day = timezone.localdate(start)
+    occupancy = get_occupancies([resource], [day])[resource, day]
+    return not is_free(occupancy, day, start, end)
+
+
+def invalidate_occupancy(resource: tuple, start: datetime, end: datetime):
+    """
+    Moves the generation of the bitmaps of the days a range touches, once
+    a booking is created, moved, canceled or deleted. Bitmaps are never
+    updated in place, since two concurrent updates could drop each
+    other's bits.
+    """
+    for day in get_days(start, end):
+        key = get_generation_key(resource, day)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Expired: the next read restarts it from the current time.
+            pass
+
+
+def invalidate_schedules(schedules):
+    """
+    Drops the cached bitmaps of the given schedules, for changes made
+    through queryset updates, which send no signals.
+
+    Args:
+        schedules (Iterable[Scheduling]): Schedules with their `staff_id`,
+            `service_id`, `date_time` and `end_time` loaded.
+    """
+    for schedule in schedules:
+        invalidate_occupancy(
+            get_resource(schedule), schedule.date_time, schedule.end_time)
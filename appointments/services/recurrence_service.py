@@ -0,0 +1,252 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import partial
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from appointments.models import CalendarSyncTask, RecurrenceRule, Scheduling
+from appointments.services.occupancy_service import (
+    bump_occupancy_version, get_recurrence_intervals, get_resource,
+    get_resource_filter
+)
+from appointments.services.staff_service import (
+    get_shifts, has_staff_schedule, is_working
+)
+from appointments.utils.changes import bump_change_marker
+
+MATERIALIZE_WEEKS = 4
+
+
+def merge_intervals(intervals) -> list:
+    """
+    Sorts ranges and merges the ones that overlap or touch.
+
+    Args:
+        intervals (Iterable[tuple]): `(start, end)` ranges.
+
+    Returns:
+        list: The merged `(start, end)` ranges, in order.
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def sweep(candidates, busy) -> tuple:
+    """
+    Splits candidate ranges into free and conflicting ones in a single pass
+    over both lists, sorted by start.
+
+    A candidate also conflicts with the candidates accepted before it, so
+    that two rules of the same resource never produce overlapping bookings.
+
+    Args:
+        candidates (Iterable[tuple]): `(start, end, ...)` ranges. Extra
+            items are kept untouched.
+        busy (Iterable[tuple]): The `(start, end)` ranges already taken.
+
+    Returns:
+        tuple: The accepted and the rejected candidates, in start order.
+    """
+    busy = merge_intervals(busy)
+    accepted, rejected = [], []
+    index = 0
+    accepted_end = None
+
+    for candidate in sorted(candidates, key=lambda item: item[:2]):
+        start, end = candidate[:2]
+        while index < len(busy) and busy[index][1] <= start:
+            index += 1
+
+        if ((index < len(busy) and busy[index][0] < end)
+                or (accepted_end is not None and start < accepted_end)):
+            rejected.append(candidate)
+            continue
+
+        accepted.append(candidate)
+        accepted_end = end if accepted_end is None else max(
+            accepted_end, end)
+    return accepted, rejected
+
+
+def get_busy_intervals(resources, start: datetime, end: datetime,
+                       exclude_rule=None) -> dict:
+    """
+    Loads, with a single query, the active bookings of some resources that
+    overlap a window.
+
+    Args:
+        resources (Iterable[tuple]): The resources, see `get_resource`.
+        start (datetime): The beginning of the window.
+        end (datetime): The end of the window.
+        exclude_rule (int, optional): Leave out the bookings materialized
+            from this rule.
+
+    Returns:
+        dict: A mapping of each resource to its `(start, end)` intervals.
+    """
+    bookings = Scheduling.objects.filter(
+        get_resource_filter(resources),
+        status='active',
+        date_time__lt=end,
+        end_time__gt=start,
+    )
+    if exclude_rule:
+        bookings = bookings.exclude(recurrence_id=exclude_rule)
+
+    intervals = defaultdict(list)
+    for staff_id, service_id, booking_start, booking_end in (
+            bookings.values_list(
+                'staff_id', 'service_id', 'date_time', 'end_time')):
+        resource = ('staff', staff_id) if staff_id else (
+            'service', service_id)
+        intervals[resource].append((booking_start, booking_end))
+    return intervals
+
+
+def find_rule_conflicts(rule: RecurrenceRule, start: datetime,
+                        end: datetime) -> list:
+    """
+    Expands the occurrences of a rule in a window and checks all of them at
+    once against the bookings and the other rules of its resource.
+
+    Args:
+        rule (RecurrenceRule): The rule, saved or not. Its own bookings and
+            occurrences are ignored.
+        start (datetime): The beginning of the window.
+        end (datetime): The end of the window.
+
+    Returns:
+        list: The starts of the occurrences that conflict, in order.
+    """
+    duration = timedelta(minutes=rule.service.duration)
+    candidates = [
+        (occurrence, occurrence + duration)
+        for occurrence in rule.get_occurrences(start, end)
+    ]
+    if not candidates:
+        return []
+
+    resource = get_resource(rule)
+    window_start, window_end = candidates[0][0], candidates[-1][1]
+    busy = get_busy_intervals(
+        [resource], window_start, window_end, exclude_rule=rule.pk)[resource]
+    busy += get_recurrence_intervals(
+        [resource], window_start, window_end, exclude_rule=rule.pk)[resource]
+
+    _, rejected = sweep(candidates, busy)
+    return [occurrence for occurrence, _ in rejected]
+
+
+def materialize_recurrences(weeks: int = MATERIALIZE_WEEKS,
+                            now=None) -> dict:
+    """
+    Creates the bookings of the active recurrence rules for the next few
+    weeks, in bulk, and queues the creation of their calendar events.
+
+    Rules are locked while they are materialized, so concurrent runs don't
+    create the same bookings twice. Occurrences that conflict with another
+    booking, fall outside the shifts of the employee or are too close to
+    the present are skipped for good.
+
+    Args:
+        weeks (int): How far ahead bookings are created.
+        now (datetime, optional): The current moment. Defaults to now.
+
+    Returns:
+        dict: The number of bookings `created` and of occurrences `skipped`.
+    """
+    now = now or timezone.now()
+    earliest = now + Scheduling.MINIMUM_NOTICE
+    horizon = now + timedelta(weeks=weeks)
+    summary = {'created': 0, 'skipped': 0}
+
+    with transaction.atomic():
+        rules = list(
+            RecurrenceRule.objects.select_for_update(of=('self',)).filter(
+                Q(materialized_until__isnull=True)
+                | Q(materialized_until__lt=horizon),
+                is_active=True,
+                first_occurrence__lt=horizon,
+            ).select_related('client', 'service'))
+        if not rules:
+            return summary
+
+        candidates = defaultdict(list)
+        for rule in rules:
+            duration = timedelta(minutes=rule.service.duration)
+            start = max(rule.materialized_until or earliest, earliest)
+            for occurrence in rule.get_occurrences(start, horizon):
+                candidates[get_resource(rule)].append(
+                    (occurrence, occurrence + duration, rule))
+            rule.materialized_until = horizon
+
+        occurrences = [
+            candidate for resource_candidates in candidates.values()
+            for candidate in resource_candidates
+        ]
+        if occurrences:
+            window_start = min(start for start, _, _ in occurrences)
+            window_end = max(end for _, end, _ in occurrences)
+
+            # Occurrences created by an earlier, interrupted run.
+            existing = set(Scheduling.objects.filter(
+                recurrence__in=rules,
+                date_time__gte=window_start,
+                date_time__lt=window_end,
+            ).values_list('recurrence_id', 'date_time'))
+            busy = get_busy_intervals(
+                candidates.keys(), window_start, window_end)
+            # Without a staff schedule, employees are not bound to shifts.
+            shifts = get_shifts() if has_staff_schedule() else None
+
+            schedules = []
+            for resource, resource_candidates in candidates.items():
+                pending = []
+                for start, end, rule in resource_candidates:
+                    if (rule.pk, start) in existing:
+                        continue
+                    if shifts is not None and rule.staff_id and not (
+                            is_working(shifts.get(rule.staff_id, {}),
+                                       start, end)):
+                        summary['skipped'] += 1
+                        continue
+                    pending.append((start, end, rule))
+
+                accepted, rejected = sweep(pending, busy[resource])
+                summary['skipped'] += len(rejected)
+                schedules += [
+                    Scheduling(
+                        client=rule.client,
+                        client_name=rule.client.get_full_name(),
+                        service=rule.service,
+                        staff_id=rule.staff_id,
+                        recurrence=rule,
+                        date_time=start,
+                        end_time=end,
+                        notes=rule.notes,
+                    )
+                    for start, end, rule in accepted
+                ]
+
+            # `bulk_create` skips `save`, so `end_time` and `client_name`
+            # are set above, and sends no signals.
+            schedules = Scheduling.objects.bulk_create(schedules)
+            CalendarSyncTask.objects.bulk_create(
+                CalendarSyncTask(scheduling=schedule, action='insert')
+                for schedule in schedules
+            )
+            summary['created'] = len(schedules)
+
+        RecurrenceRule.objects.bulk_update(rules, ['materialized_until'])
+        transaction.on_commit(bump_occupancy_version)
+        if summary['created']:
+            bump_change_marker(Scheduling)
+            transaction.on_commit(partial(bump_change_marker, Scheduling))
+
+    return summary
@@ -0,0 +1,219 @@
+import csv
+import json
+from functools import partial
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from appointments.models import Scheduling
+from appointments.services.calendar_sync_service import (
+    enqueue_calendar_deletes
+)
+from appointments.services.occupancy_service import invalidate_schedules
+from appointments.serializers import (
+    ScheduleListSerializer, ScheduleSerializer
+)
+from appointments.utils.changes import bump_change_marker
+
+EXPORT_COLUMNS = (
+    'id', 'client', 'client_name', 'staff', 'service',
+    'service__service_name', 'date_time', 'end_time', 'status', 'notes',
+)
+EXPORT_FIELD_NAMES = tuple(
+    column.replace('service__', '') for column in EXPORT_COLUMNS)
+EXPORT_CHUNK_SIZE = 2000
+
+
+def filter_schedules(queryset=None, client=None, status=None, start=None,
+                     end=None):
+    """
+    Narrows a schedules queryset down in the database.
+
+    Args:
+        queryset (QuerySet, optional): The queryset to filter. Defaults to
+            every schedule.
+        client (CustomUser | int, optional): Only schedules of this client.
+        status (str, optional): Only schedules with this status.
+        start (datetime, optional): Only schedules at or after this moment.
+        end (datetime, optional): Only schedules before this moment.
+
+    Returns:
+        QuerySet: The filtered queryset.
+    """
+    if queryset is None:
+        queryset = Scheduling.objects.all()
+
+    if client is not None:
+        queryset = queryset.filter(client=client)
+
+    if status:
+        queryset = queryset.filter(status=status)
+
+    if start is not None:
+        queryset = queryset.filter(date_time__gte=start)
+
+    if end is not None:
+        queryset = queryset.filter(date_time__lt=end)
+
+    return queryset
+
+
+def get_schedules_queryset(**filters):
+    """
+    Builds the queryset used to list schedules, newest first.
+
+    Args:
+        **filters: Keyword arguments accepted by `filter_schedules`.
+
+    Returns:
+        QuerySet: The ordered schedules queryset.
+    """
+    queryset = ScheduleSerializer.setup_eager_loading(
+        Scheduling.objects.order_by('-pk'))
+    return filter_schedules(queryset, **filters)
+
+
+def get_schedules(limit: int | None = None, **filters) -> list:
+    """
+    Retrieves the schedules serialized with the same shape returned by the
+    schedules API, newest first.
+
+    Args:
+        limit (int, optional): The maximum number of schedules to return.
+        **filters: Keyword arguments accepted by `filter_schedules`.
+
+    Returns:
+        list: A list of dictionaries, one per schedule.
+    """
+    schedules = ScheduleListSerializer.setup_values(
+        get_schedules_queryset(**filters))
+
+    if limit is not None:
+        schedules = schedules[:limit]
+
+    return ScheduleListSerializer(schedules).data
+
+
+def get_scheduling_totals() -> dict:
+    """
+    Counts all the schedules and the schedules of each status with a single
+    query.
+
+    Returns:
+        dict: The `total` count and one count per status, keyed by status.
+    """
+    return Scheduling.objects.aggregate(
+        total=Count('pk'),
+        **{
+            status: Count('pk', filter=Q(status=status))
+            for status, _ in Scheduling.STATUS_CHOICES
+        },
+    )
+
+
+def transition_schedules(ids, status: str) -> list:
+    """
+    Moves several schedules to a new status with a single UPDATE.
+
+    Only the schedules whose current status allows the transition, see
+    `Scheduling.STATUS_TRANSITIONS`, are changed. The rows are locked
+    before the update, so the returned IDs are exactly the ones that
+    changed. Canceled schedules get the removal of their calendar events
+    queued in the same transaction.
+
+    Args:
+        ids (Iterable[int]): The schedules to change.
+        status (str): The new status.
+
+    Returns:
+        list: The IDs of the schedules that changed, in order.
+
+    Raises:
+        ValueError: If no schedule may be moved to `status` in bulk.
+    """
+    if status not in Scheduling.STATUS_TRANSITIONS:
+        raise ValueError(f'Invalid target status: {status}')
+
+    allowed = Q(pk__in=set(ids),
+                status__in=Scheduling.STATUS_TRANSITIONS[status])
+    with transaction.atomic():
+        schedules = list(
+            Scheduling.objects.select_for_update().filter(allowed).order_by(
+                'pk').only('pk', 'staff', 'service', 'date_time', 'end_time'))
+        if not schedules:
+            return []
+
+        Scheduling.objects.filter(allowed).update(
+            status=status, updated_at=timezone.now())
+        if status == 'canceled':
+            enqueue_calendar_deletes(schedules)
+        # Leaving `active` frees the range of the schedules. Queryset
+        # updates send no signals, see `record_change`.
+        transaction.on_commit(partial(invalidate_schedules, schedules))
+        bump_change_marker(Scheduling)
+        transaction.on_commit(partial(bump_change_marker, Scheduling))
+    changed = [schedule.pk for schedule in schedules]
+    return changed
+
+
+def iter_export_rows(queryset, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """
+    Iterates over the schedules to be exported as dictionaries, reading them
+    from the database in chunks through a server-side cursor, so that
+    memory stays flat whatever the number of rows.
+
+    Args:
+        queryset (QuerySet): The schedules to export.
+        chunk_size (int): How many rows are fetched at a time.
+
+    Yields:
+        dict: One row per schedule, keyed by the export column names, with
+            the dates in local time and ISO format.
+    """
+    rows = queryset.order_by('date_time', 'pk').values_list(
+        *EXPORT_COLUMNS).iterator(chunk_size=chunk_size)
+
+    for row in rows:
+        row = dict(zip(EXPORT_FIELD_NAMES, row))
+        row['date_time'] = timezone.localtime(row['date_time']).isoformat()
+        row['end_time'] = timezone.localtime(row['end_time']).isoformat()
+        yield row
+
+
+class EchoBuffer:
+    """
+    File-like object that hands back what is written to it, letting
+    `csv.writer` produce the lines of a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """
+    Renders export rows as CSV lines, header first.
+
+    Args:
+        rows (Iterable[dict]): The rows from `iter_export_rows`.
+
+    Yields:
+        str: One CSV line at a time.
+    """
+    writer = csv.DictWriter(EchoBuffer(), fieldnames=EXPORT_FIELD_NAMES)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_ndjson(rows):
+    """
+    Renders export rows as newline-delimited JSON.
+
+    Args:
+        rows (Iterable[dict]): The rows from `iter_export_rows`.
+
+    Yields:
+        str: One JSON document per line.
+    """
+    for row in rows:
+        yield json.dumps(row) + '\n'
@@ -0,0 +1,166 @@
+from collections import defaultdict
+from datetime import datetime
+from django.utils import timezone
+from appointments.models import Scheduling, WorkingHours
+from appointments.services.occupancy_service import (
+    has_recurrence_conflict, may_conflict
+)
+
+
+def has_staff_schedule() -> bool:
+    """
+    Checks whether the shop works with per-employee schedules, i.e. whether
+    any working hours are registered.
+
+    Returns:
+        bool: True if bookings must be assigned to employees.
+    """
+    return WorkingHours.objects.exists()
+
+
+def get_shifts(weekdays=None) -> dict:
+    """
+    Loads the shifts of every employee with a single query.
+
+    Args:
+        weekdays (Iterable[int], optional): Only these days of the week.
+
+    Returns:
+        dict: A mapping of each employee ID to a mapping of each weekday to
+            its `(start_time, end_time)` shifts.
+    """
+    working_hours = WorkingHours.objects.filter(staff__is_active=True)
+    if weekdays is not None:
+        working_hours = working_hours.filter(weekday__in=set(weekdays))
+
+    shifts = defaultdict(lambda: defaultdict(list))
+    for staff_id, weekday, start_time, end_time in working_hours.values_list(
+            'staff_id', 'weekday', 'start_time', 'end_time'):
+        shifts[staff_id][weekday].append((start_time, end_time))
+    return shifts
+
+
+def is_working(staff_shifts: dict, start: datetime, end: datetime) -> bool:
+    """
+    Checks whether a range fits entirely in one shift of an employee.
+
+    Args:
+        staff_shifts (dict): The shifts of the employee per weekday, as
+            returned by `get_shifts`.
+        start (datetime): The beginning of the range.
+        end (datetime): The end of the range.
+
+    Returns:
+        bool: True if the employee works during the whole range.
+    """
+    local_start = timezone.localtime(start)
+    local_end = timezone.localtime(end)
+    if local_start.date() != local_end.date():
+        return False
+
+    return any(
+        shift_start <= local_start.time() and local_end.time() <= shift_end
+        for shift_start, shift_end in staff_shifts.get(
+            local_start.weekday(), ())
+    )
+
+
+def has_staff_conflict(staff_id: int, start: datetime, end: datetime,
+                       exclude_pk=None) -> bool:
+    """
+    Checks whether an employee has an active booking, or an occurrence of a
+    recurrence rule, overlapping a range, using the occupancy bitmap first
+    and the database only to confirm.
+
+    Args:
+        staff_id (int): The employee.
+        start (datetime): The beginning of the range.
+        end (datetime): The end of the range.
+        exclude_pk (int, optional): A booking to ignore, e.g. the one being
+            edited.
+
+    Returns:
+        bool: True if the employee is busy during the range.
+    """
+    if not may_conflict(('staff', staff_id), start, end):
+        return False
+
+    conflicts = Scheduling.objects.filter(
+        staff_id=staff_id,
+        status='active',
+        date_time__lt=end,
+        end_time__gt=start,
+    )
+    if exclude_pk:
+        conflicts = conflicts.exclude(pk=exclude_pk)
+    return conflicts.exists() or has_recurrence_conflict(
+        ('staff', staff_id), start, end)
+
+
+def has_service_conflict(service_id: int, start: datetime, end: datetime,
+                         exclude_pk=None) -> bool:
+    """
+    Checks whether a service has an active booking, or an occurrence of a
+    recurrence rule, that is not assigned to any employee and overlaps a
+    range, using the occupancy bitmap first and the database only to
+    confirm.
+
+    Without working hours every booking is checked this way. With them,
+    the bookings made before they were registered have no employee and
+    still hold their range.
+
+    Args:
+        service_id (int): The service.
+        start (datetime): The beginning of the range.
+        end (datetime): The end of the range.
+        exclude_pk (int, optional): A booking to ignore, e.g. the one being
+            edited.
+
+    Returns:
+        bool: True if the service is busy during the range.
+    """
+    if not may_conflict(('service', service_id), start, end):
+        return False
+
+    conflicts = Scheduling.objects.filter(
+        service_id=service_id,
+        staff__isnull=True,
+        status='active',
+        date_time__lt=end,
+        end_time__gt=start,
+    )
+    if exclude_pk:
+        conflicts = conflicts.exclude(pk=exclude_pk)
+    return conflicts.exists() or has_recurrence_conflict(
+        ('service', service_id), start, end)
+
+
+def find_available_staff(start: datetime, end: datetime, exclude_pk=None,
+                         preferred=None):
+    """
+    Picks an employee who works and is free during a range.
+
+    Args:
+        start (datetime): The beginning of the range.
+        end (datetime): The end of the range.
+        exclude_pk (int, optional): A booking to ignore, e.g. the one being
+            edited.
+        preferred (int, optional): An employee to pick first when free,
+            e.g. the one already assigned to the booking being edited.
+
+    Returns:
+        int | None: The ID of the employee, or None if nobody is available.
+    """
+    shifts = get_shifts([timezone.localtime(start).weekday()])
+    candidates = sorted(
+        staff_id for staff_id, staff_shifts in shifts.items()
+        if is_working(staff_shifts, start, end)
+    )
+    if preferred in candidates:
+        candidates.remove(preferred)
+        candidates.insert(0, preferred)
+
+    for staff_id in candidates:
+        if not has_staff_conflict(staff_id, start, end, exclude_pk):
+            return staff_id
+    return None
@@ -2,8 +2,11 @@ from django.core.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
 from django.http import Http404
 from django.core.exceptions import PermissionDenied
+from django.db.models import Count, Q
 from appointments.models import CustomUser
 
+STAFF_USER_TYPES = ('employee', 'manager', 'superuser')
+
 
 class UserPermissionMixin:
     """
@@ -86,3 +89,21 @@ def update_profile_picture(user: CustomUser, profile_picture):
     user.profile_picture = profile_picture
     user.save()
     return user
+
+
+def get_user_totals() -> dict:
+    """
+    Counts the users of each type with a single query.
+
+    Returns:
+        dict: The `total` count, the `staff` count (employees, managers and
+            superusers) and one count per user type, keyed by type.
+    """
+    return CustomUser.objects.aggregate(
+        total=Count('pk'),
+        staff=Count('pk', filter=Q(user_type__in=STAFF_USER_TYPES)),
+        **{
+            user_type: Count('pk', filter=Q(user_type=user_type))
+            for user_type, _ in CustomUser.USER_TYPES
+        },
+    )
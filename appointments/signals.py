@@ -0,0 +1,92 @@
+from functools import partial
+from types import SimpleNamespace
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .models import BarberService, RecurrenceRule, Scheduling
+from .services.barber_services import bump_catalog_version
+from .services.occupancy_service import (
+    bump_occupancy_version, get_resource, invalidate_occupancy
+)
+from .utils.changes import bump_change_marker
+
+
+@receiver([post_save, post_delete], sender=BarberService)
+@receiver([post_save, post_delete], sender=Scheduling)
+def record_change(sender, **kwargs):
+    """
+    Moves the change marker of the table, which the conditional API
+    responses are built from, see `ConditionalViewSetMixin`.
+
+    The marker is moved again once the transaction commits, since another
+    request may have read the old rows in the meantime.
+    """
+    bump_change_marker(sender)
+    transaction.on_commit(partial(bump_change_marker, sender))
+
+
+@receiver([post_save, post_delete], sender=BarberService)
+def invalidate_catalog(sender, **kwargs):
+    """
+    Invalidates the cached service catalog whenever a service changes,
+    whether through the views, the API or the admin.
+
+    The version is bumped again once the transaction commits, since another
+    request may have cached the old rows in the meantime.
+    """
+    bump_catalog_version()
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(pre_save, sender=Scheduling)
+def remember_previous_booking(sender, instance, **kwargs):
+    """
+    Keeps the range a scheduling occupied before an update, so that the
+    bitmaps of its previous days can be invalidated too.
+    """
+    previous = None
+    if instance.pk and not instance._state.adding:
+        row = Scheduling.objects.filter(pk=instance.pk).values(
+            'staff_id', 'service_id', 'date_time', 'end_time').first()
+        if row is not None:
+            previous = (get_resource(SimpleNamespace(**row)), row['date_time'],
+                        row['end_time'])
+    instance._previous_booking = previous
+
+
+@receiver(post_save, sender=Scheduling)
+def update_occupancy(sender, instance, created, **kwargs):
+    """
+    Keeps the occupancy bitmaps in line with the saved scheduling, once the
+    transaction commits, by dropping the bitmaps of the days involved. A
+    new booking that is not active occupies nothing.
+    """
+    booking = (get_resource(instance), instance.date_time, instance.end_time)
+
+    if created and instance.status != 'active':
+        return
+
+    transaction.on_commit(partial(invalidate_occupancy, *booking))
+    previous = getattr(instance, '_previous_booking', None)
+    if previous and previous != booking:
+        transaction.on_commit(partial(invalidate_occupancy, *previous))
+
+
+@receiver(post_delete, sender=Scheduling)
+def release_occupancy(sender, instance, **kwargs):
+    """
+    Drops the occupancy bitmaps of the days of a deleted scheduling.
+    """
+    transaction.on_commit(partial(
+        invalidate_occupancy, get_resource(instance), instance.date_time,
+        instance.end_time))
+
+
+@receiver([post_save, post_delete], sender=RecurrenceRule)
+def invalidate_recurrence_occupancy(sender, **kwargs):
+    """
+    Invalidates every occupancy bitmap when a recurrence rule changes, since
+    its occurrences may fall on any future day.
+    """
+    bump_occupancy_version()
+    transaction.on_commit(bump_occupancy_version)
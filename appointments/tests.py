@@ -1,3 +1,1511 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock, skipIf
+from django.apps import apps
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, override_settings
+)
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from .forms.scheduling_forms import RecurrenceRuleForm, ScheduleForm
+from .models import (
+    BarberService, CalendarSyncTask, CustomUser, RecurrenceRule, Scheduling,
+    WorkingHours
+)
+from .renderers import FastJSONParser, FastJSONRenderer, orjson
+from .serializers import (
+    ScheduleListSerializer, ScheduleSerializer, ServiceListSerializer,
+    ServiceSerializer
+)
+from .services.barber_services import (
+    LOCAL_CATALOG_TIMEOUT, get_active_services, get_services
+)
+from .services.availability_service import get_available_slots
+from .services.occupancy_service import get_slot_mask, may_conflict
+from .services.import_service import (
+    OFF_SHIFT_MESSAGE, STAFF_REQUIRED_MESSAGE, import_schedules, read_rows
+)
+from .services.recurrence_service import materialize_recurrences
+from .services.scheduling_services import (
+    EXPORT_CHUNK_SIZE, transition_schedules
+)
+from .services.staff_service import find_available_staff
+from .services.calendar_sync_service import (
+    MAX_ATTEMPTS, enqueue_calendar_delete, enqueue_calendar_insert,
+    enqueue_calendar_update, has_pending_insert, process_pending_tasks
+)
+from .services.google_calendar_service import (
+    CalendarClient, LocalCalendarBackend, calendar_client,
+    get_calendar_backend
+)
+from .utils.changes import bump_change_marker
+from .utils.metrics import BOOKING_CONFLICTS, CALENDAR_REQUEST_SECONDS
 
-# Create your tests here.
+
+class FailingCalendarBackend(LocalCalendarBackend):
+    def insert(self, event):
+        raise ConnectionError('calendar unavailable')
+
+
+class BaseSchedulingTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = CustomUser.objects.create_user(
+            username='client', email='client@example.com', password='x',
+            first_name='Client', last_name='User')
+        cls.service = BarberService.objects.create(
+            service_name='Corte', price=30, duration=30)
+
+    def create_scheduling(self, days=1, **kwargs):
+        kwargs.setdefault('client', self.client_user)
+        kwargs.setdefault('service', self.service)
+        kwargs.setdefault('date_time', timezone.now() + timedelta(days=days))
+        return Scheduling.objects.create(**kwargs)
+
+
+@override_settings(CALENDAR_BACKEND=(
+    'appointments.services.google_calendar_service.LocalCalendarBackend'))
+class CalendarSyncTaskTests(BaseSchedulingTestCase):
+    def setUp(self):
+        self.backend = LocalCalendarBackend()
+
+    def test_insert_creates_event_and_stores_its_id(self):
+        scheduling = self.create_scheduling(notes='Sem máquina')
+        enqueue_calendar_insert(scheduling)
+
+        summary = process_pending_tasks(backend=self.backend)
+
+        scheduling.refresh_from_db()
+        self.assertEqual(summary['done'], 1)
+        event = self.backend.events[scheduling.calendar_event_id]
+        self.assertEqual(event['description'], 'Sem máquina')
+
+    def test_delete_before_sync_drops_pending_tasks(self):
+        scheduling = self.create_scheduling()
+        enqueue_calendar_insert(scheduling)
+        enqueue_calendar_update(scheduling)
+
+        enqueue_calendar_delete(scheduling)
+        scheduling.delete()
+
+        self.assertFalse(CalendarSyncTask.objects.exists())
+
+    def test_delete_after_sync_removes_event(self):
+        scheduling = self.create_scheduling()
+        enqueue_calendar_insert(scheduling)
+        process_pending_tasks(backend=self.backend)
+        scheduling.refresh_from_db()
+
+        enqueue_calendar_delete(scheduling)
+        scheduling.delete()
+        process_pending_tasks(backend=self.backend)
+
+        self.assertEqual(self.backend.events, {})
+
+    def test_update_patches_event_in_place(self):
+        scheduling = self.create_scheduling()
+        enqueue_calendar_insert(scheduling)
+        process_pending_tasks(backend=self.backend)
+        scheduling.refresh_from_db()
+        event_id = scheduling.calendar_event_id
+
+        scheduling.notes = 'Com barba'
+        scheduling.save()
+        enqueue_calendar_update(scheduling, changed_fields=['notes'])
+        process_pending_tasks(backend=self.backend)
+
+        scheduling.refresh_from_db()
+        self.assertEqual(scheduling.calendar_event_id, event_id)
+        self.assertEqual(list(self.backend.events), [event_id])
+        self.assertEqual(
+            self.backend.events[event_id]['description'], 'Com barba')
+
+    def test_claimed_tasks_are_skipped_while_the_calendar_is_called(self):
+        scheduling = self.create_scheduling()
+        enqueue_calendar_insert(scheduling)
+        seen = []
+
+        class ReentrantBackend(LocalCalendarBackend):
+            def execute_batch(backend, operations):
+                # Another worker polling meanwhile finds nothing to do.
+                seen.append(process_pending_tasks(backend=backend))
+                seen.append(CalendarSyncTask.objects.get().claimed_at)
+                return super().execute_batch(operations)
+
+        process_pending_tasks(backend=ReentrantBackend())
+
+        self.assertEqual(seen[0], {'done': 0, 'retried': 0, 'failed': 0})
+        self.assertIsNotNone(seen[1])
+        task = CalendarSyncTask.objects.get()
+        self.assertEqual(task.status, 'done')
+        self.assertIsNone(task.claimed_at)
+
+    def test_abandoned_claims_are_taken_over(self):
+        scheduling = self.create_scheduling()
+        enqueue_calendar_insert(scheduling)
+        CalendarSyncTask.objects.update(claimed_at=timezone.now())
+        self.assertEqual(process_pending_tasks(backend=self.backend)['done'],
+                         0)
+
+        CalendarSyncTask.objects.update(
+            claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(process_pending_tasks(backend=self.backend)['done'],
+                         1)
+
+    def test_delete_during_insert_removes_the_new_event(self):
+        scheduling = self.create_scheduling()
+        enqueue_calendar_insert(scheduling)
+        test = self
+
+        class DeletingBackend(LocalCalendarBackend):
+            def execute_batch(backend, operations):
+                # The booking is deleted while its event is being created.
+                if scheduling.pk is not None:
+                    test.assertTrue(has_pending_insert(scheduling))
+                    enqueue_calendar_delete(scheduling)
+                    scheduling.delete()
+                return super().execute_batch(operations)
+
+        backend = DeletingBackend()
+        process_pending_tasks(backend=backend)
+        self.assertEqual(len(backend.events), 1)
+
+        process_pending_tasks(backend=backend)
+        self.assertEqual(backend.events, {})
+
+    def test_edit_during_insert_is_replicated(self):
+        scheduling = self.create_scheduling(notes='Antes')
+        enqueue_calendar_insert(scheduling)
+        seen = []
+
+        class EditingBackend(LocalCalendarBackend):
+            def execute_batch(backend, operations):
+                # The booking is edited after the insert read it.
+                if not seen:
+                    scheduling.notes = 'Depois'
+                    scheduling.save()
+                    seen.append(enqueue_calendar_update(
+                        scheduling, changed_fields=['notes']))
+                    # Not claimed until the insert is released.
+                    seen.append(process_pending_tasks(backend=backend))
+                return super().execute_batch(operations)
+
+        backend = EditingBackend()
+        process_pending_tasks(backend=backend)
+        self.assertIsNotNone(seen[0])
+        self.assertEqual(seen[1], {'done': 0, 'retried': 0, 'failed': 0})
+
+        self.assertEqual(process_pending_tasks(backend=backend)['done'], 1)
+        scheduling.refresh_from_db()
+        self.assertEqual(list(backend.events), [scheduling.calendar_event_id])
+        self.assertEqual(
+            backend.events[scheduling.calendar_event_id]['description'],
+            'Depois')
+
+    def test_cancel_queues_the_removal_of_the_event(self):
+        scheduling = self.create_scheduling()
+        enqueue_calendar_insert(scheduling)
+        process_pending_tasks(backend=self.backend)
+        scheduling.refresh_from_db()
+
+        self.client.force_login(CustomUser.objects.create_user(
+            username='staff', email='staff@example.com', password='x',
+            user_type='employee'))
+        self.client.post(
+            '/api/schedules/status/',
+            {'ids': [scheduling.pk], 'status': 'canceled'},
+            content_type='application/json')
+        self.assertEqual(CalendarSyncTask.objects.get(
+            status='pending').event_id, scheduling.calendar_event_id)
+
+        process_pending_tasks(backend=self.backend)
+        scheduling.refresh_from_db()
+        self.assertEqual(self.backend.events, {})
+        self.assertIsNone(scheduling.calendar_event_id)
+
+    def test_cancel_during_insert_removes_the_new_event(self):
+        scheduling = self.create_scheduling()
+        enqueue_calendar_insert(scheduling)
+
+        class CancelingBackend(LocalCalendarBackend):
+            def execute_batch(backend, operations):
+                # The booking is canceled while its event is being created.
+                transition_schedules([scheduling.pk], 'canceled')
+                return super().execute_batch(operations)
+
+        backend = CancelingBackend()
+        process_pending_tasks(backend=backend)
+        self.assertEqual(len(backend.events), 1)
+
+        process_pending_tasks(backend=backend)
+        scheduling.refresh_from_db()
+        self.assertEqual(backend.events, {})
+        self.assertIsNone(scheduling.calendar_event_id)
+
+    def test_update_without_calendar_changes_is_not_queued(self):
+        scheduling = self.create_scheduling()
+
+        self.assertIsNone(
+            enqueue_calendar_update(scheduling, changed_fields=[]))
+        self.assertFalse(CalendarSyncTask.objects.exists())
+
+    def test_failures_are_retried_with_backoff_then_failed(self):
+        scheduling = self.create_scheduling()
+        task = enqueue_calendar_insert(scheduling)
+        backend = FailingCalendarBackend()
+
+        summary = process_pending_tasks(backend=backend)
+        task.refresh_from_db()
+        self.assertEqual(summary['retried'], 1)
+        self.assertGreater(task.next_attempt_at, timezone.now())
+
+        # Not due yet, so nothing runs.
+        self.assertEqual(sum(process_pending_tasks(backend=backend).values()),
+                         0)
+
+        CalendarSyncTask.objects.update(
+            attempts=MAX_ATTEMPTS - 1, next_attempt_at=timezone.now())
+        summary = process_pending_tasks(backend=backend)
+        task.refresh_from_db()
+        self.assertEqual(summary['failed'], 1)
+        self.assertEqual(task.status, 'failed')
+        self.assertIn('calendar unavailable', task.last_error)
+
+        # The booking never got an event, so there is nothing to delete.
+        scheduling.refresh_from_db()
+        self.assertIsNone(scheduling.calendar_event_id)
+        self.assertIsNone(enqueue_calendar_delete(scheduling))
+
+
+@override_settings(CALENDAR_BACKEND=(
+    'appointments.services.google_calendar_service.LocalCalendarBackend'))
+class SchedulingAdminTests(BaseSchedulingTestCase):
+    def setUp(self):
+        self.backend = get_calendar_backend()
+        self.backend.clear()
+        self.client.force_login(CustomUser.objects.create_superuser(
+            username='admin', email='admin@example.com', password='x'))
+
+    def run_action(self, action, schedules):
+        return self.client.post('/admin/appointments/scheduling/', {
+            'action': action,
+            '_selected_action': [schedule.pk for schedule in schedules],
+        }, follow=True)
+
+    def test_sync_leaves_queued_inserts_to_the_worker(self):
+        queued = self.create_scheduling()
+        enqueue_calendar_insert(queued)
+        unsynced = self.create_scheduling(days=2)
+
+        response = self.run_action('sync_with_calendar', [queued, unsynced])
+
+        self.assertContains(response, '1 agendamentos ignorados')
+        unsynced.refresh_from_db()
+        self.assertEqual(list(self.backend.events),
+                         [unsynced.calendar_event_id])
+
+        # The worker patches the event if one exists by the time it runs.
+        Scheduling.objects.filter(pk=queued.pk).update(
+            calendar_event_id=self.backend.insert({})['id'])
+        process_pending_tasks(backend=self.backend)
+        self.assertEqual(len(self.backend.events), 2)
+
+    def test_cancel_leaves_finished_schedules_alone(self):
+        active = self.create_scheduling()
+        Scheduling.objects.filter(pk=active.pk).update(
+            calendar_event_id=self.backend.insert({})['id'])
+        completed = self.create_scheduling(days=2, status='completed')
+
+        response = self.run_action(
+            'cancel_and_remove_from_calendar', [active, completed])
+
+        self.assertContains(response, '1 agendamentos cancelados.')
+        self.assertContains(response, '1 agendamentos ignorados')
+        completed.refresh_from_db()
+        self.assertEqual(completed.status, 'completed')
+
+        # The event is removed by the calendar worker.
+        self.assertEqual(len(self.backend.events), 1)
+        process_pending_tasks(backend=self.backend)
+        active.refresh_from_db()
+        self.assertEqual(active.status, 'canceled')
+        self.assertIsNone(active.calendar_event_id)
+        self.assertEqual(self.backend.events, {})
+
+
+class ServiceCatalogCacheTests(BaseSchedulingTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_catalog_is_read_once_until_a_service_changes(self):
+        get_active_services()
+        get_services()
+        with self.assertNumQueries(0):
+            ScheduleForm().as_p()
+            get_services()
+
+        self.service.service_name = 'Corte e barba'
+        self.service.save()
+
+        self.assertEqual(get_active_services()[0].service_name,
+                         'Corte e barba')
+        self.assertEqual(get_services()[0]['service_name'], 'Corte e barba')
+
+    def test_entries_expire_soon_when_the_cache_is_private(self):
+        get_active_services()
+        later = time.time() + LOCAL_CATALOG_TIMEOUT + 1
+        # Another process doesn't see the version bumped by this one.
+        with mock.patch('django.core.cache.backends.locmem.time.time',
+                        return_value=later):
+            with self.assertNumQueries(1):
+                get_active_services()
+
+    def test_deleted_service_leaves_the_catalog(self):
+        service = BarberService.objects.create(
+            service_name='Barba', price=20, duration=15)
+        self.assertEqual(len(get_active_services()), 2)
+
+        service.delete()
+
+        self.assertEqual(get_active_services(), [self.service])
+
+
+class DashboardViewTests(BaseSchedulingTestCase):
+    def setUp(self):
+        self.manager = CustomUser.objects.create_user(
+            username='manager', email='manager@example.com', password='x',
+            user_type='manager')
+        for days in range(1, 6):
+            self.create_scheduling(days=days)
+        self.create_scheduling(days=7, status='canceled')
+        self.client.force_login(self.manager)
+
+    def test_dashboard_runs_a_fixed_number_of_queries(self):
+        # Session, user, one aggregation per model and the recent
+        # appointments with their services.
+        with self.assertNumQueries(6):
+            response = self.client.get('/dashboard/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_users'], 2)
+        self.assertEqual(response.context['total_employees'], 1)
+        self.assertEqual(response.context['total_appointments'], 6)
+        self.assertEqual(response.context['total_services'], 1)
+        self.assertEqual(len(response.context['appointments']), 6)
+
+    def test_query_count_does_not_grow_with_appointments(self):
+        for days in range(10, 30):
+            self.create_scheduling(days=days)
+
+        with self.assertNumQueries(6):
+            self.client.get('/dashboard/')
+
+
+class ScheduleViewSetTests(BaseSchedulingTestCase):
+    def test_list_query_count_does_not_grow_with_rows(self):
+        self.create_scheduling()
+        with self.assertNumQueries(4):
+            self.client.get('/api/schedules/')
+
+        for days in range(2, 20):
+            self.create_scheduling(days=days)
+
+        # The two change markers, the count and the page, with the
+        # services joined in.
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/schedules/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['service_name'],
+                         'Corte')
+
+    def test_cursor_pagination_walks_every_row_without_counting(self):
+        moment = timezone.now() + timedelta(days=3)
+        for _ in range(5):
+            # Rows sharing the same date_time are told apart by pk.
+            self.create_scheduling(date_time=moment)
+            self.create_scheduling(date_time=moment + timedelta(hours=1))
+
+        seen = []
+        url = '/api/schedules/?cursor=&page_size=3'
+        while url:
+            # The two change markers and the page.
+            with self.assertNumQueries(3) as queries:
+                data = self.client.get(url).json()
+            self.assertNotIn('count', data)
+            if 'cursor=&' not in url:
+                # The seek filter starts with a bound the index can use.
+                self.assertIn(
+                    'WHERE ("appointments_scheduling"."date_time" <=',
+                    queries.captured_queries[-1]['sql'])
+            seen += [row['id'] for row in data['results']]
+            url = data['next']
+
+        expected = list(Scheduling.objects.order_by(
+            '-date_time', '-pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/schedules/?cursor=invalid')
+        self.assertEqual(response.status_code, 404)
+
+    def test_forged_cursors_are_rejected(self):
+        def encode(position):
+            return base64.urlsafe_b64encode(
+                json.dumps(position).encode()).decode()
+
+        for url, position in (
+            ('/api/schedules/', [None, None]),
+            ('/api/schedules/', ['2025-01-02T10:00:00', None]),
+            ('/api/schedules/', [1]),
+            ('/api/services/', [None]),
+            ('/api/services/', [1, 2]),
+            ('/api/services/', {'pk': 1}),
+        ):
+            with self.subTest(url=url, position=position):
+                response = self.client.get(
+                    f'{url}?cursor={encode(position)}')
+                self.assertEqual(response.status_code, 404)
+
+    def test_bulk_status_changes_only_allowed_rows(self):
+        active = [self.create_scheduling(days=days) for days in (1, 2)]
+        canceled = self.create_scheduling(days=3, status='canceled')
+        ids = [schedule.pk for schedule in active] + [canceled.pk, 999]
+        payload = {'ids': ids, 'status': 'completed'}
+
+        self.client.force_login(self.client_user)
+        response = self.client.post(
+            '/api/schedules/status/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(CustomUser.objects.create_user(
+            username='staff', email='staff@example.com', password='x',
+            user_type='employee'))
+        response = self.client.post(
+            '/api/schedules/status/', payload, content_type='application/json')
+
+        self.assertEqual(response.json(), {
+            'status': 'completed',
+            'changed': [schedule.pk for schedule in active],
+            'skipped': [canceled.pk, 999],
+        })
+        self.assertEqual(
+            dict(Scheduling.objects.values_list('pk', 'status')),
+            {active[0].pk: 'completed', active[1].pk: 'completed',
+             canceled.pk: 'canceled'})
+
+        response = self.client.post(
+            '/api/schedules/status/', {'ids': ids, 'status': 'active'},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ScheduleFilterTests(BaseSchedulingTestCase):
+    def setUp(self):
+        self.other_client = CustomUser.objects.create_user(
+            username='other', email='other@example.com', password='x')
+        self.day = timezone.localdate() + timedelta(days=2)
+        self.first = self.create_scheduling(date_time=self.at(10))
+        self.second = self.create_scheduling(
+            date_time=self.at(15), status='canceled')
+        self.later = self.create_scheduling(
+            date_time=self.at(10) + timedelta(days=1),
+            client=self.other_client)
+
+    def at(self, hour):
+        return timezone.make_aware(
+            datetime.combine(self.day, datetime.min.time()).replace(
+                hour=hour))
+
+    def get_ids(self, query):
+        response = self.client.get(f'/api/schedules/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return {row['id'] for row in response.json()['results']}
+
+    def test_client_and_status_filters(self):
+        self.assertEqual(self.get_ids(f'client={self.client_user.pk}'),
+                         {self.first.pk, self.second.pk})
+        self.assertEqual(self.get_ids('status=canceled'), {self.second.pk})
+        self.assertEqual(
+            self.get_ids(f'client={self.other_client.pk}&status=canceled'),
+            set())
+
+    def test_date_range_filters(self):
+        day = self.day.isoformat()
+        # A date end includes the whole day.
+        self.assertEqual(self.get_ids(f'start={day}&end={day}'),
+                         {self.first.pk, self.second.pk})
+        self.assertEqual(
+            self.get_ids(f'start={self.day + timedelta(days=1)}'),
+            {self.later.pk})
+
+        moment = self.at(12).isoformat().replace('+', '%2B')
+        self.assertEqual(self.get_ids(f'start={moment}&end={day}'),
+                         {self.second.pk})
+        self.assertEqual(self.get_ids(f'end={moment}'), {self.first.pk})
+
+    def test_invalid_filters_are_rejected(self):
+        for query, field, message in (
+            ('client=abc', 'client', 'Cliente inválido.'),
+            ('status=unknown', 'status', 'Status inválido.'),
+            ('start=2025-13-01', 'start', 'Data ou data e hora inválida.'),
+            ('end=tomorrow', 'end', 'Data ou data e hora inválida.'),
+        ):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/schedules/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {field: message})
+
+
+class ScheduleExportTests(BaseSchedulingTestCase):
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user(
+            username='staff', email='staff@example.com', password='x',
+            user_type='employee')
+        self.client.force_login(self.staff)
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/schedules/export/?{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return b''.join(response.streaming_content).decode()
+
+    def test_only_staff_may_export(self):
+        self.client.logout()
+        self.assertEqual(
+            self.client.get('/api/schedules/export/').status_code, 403)
+
+        self.client.force_login(self.client_user)
+        self.assertEqual(
+            self.client.get('/api/schedules/export/').status_code, 403)
+
+    def test_csv_has_a_header_and_escapes_values(self):
+        scheduling = self.create_scheduling(notes='Sem máquina, "curto"\nok')
+
+        response = self.client.get('/api/schedules/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('.csv"', response['Content-Disposition'])
+
+        rows = list(csv.reader(io.StringIO(
+            b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], [
+            'id', 'client', 'client_name', 'staff', 'service',
+            'service_name', 'date_time', 'end_time', 'status', 'notes'])
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][0], str(scheduling.pk))
+        self.assertEqual(rows[1][-1], 'Sem máquina, "curto"\nok')
+
+    def test_ndjson_format(self):
+        scheduling = self.create_scheduling()
+
+        response = self.client.get('/api/schedules/export/?file_format=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines],
+                         [scheduling.pk])
+
+        response = self.client.get('/api/schedules/export/?file_format=xml')
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_filters_apply_to_the_export(self):
+        kept = self.create_scheduling(days=1)
+        self.create_scheduling(days=2, status='canceled')
+        later = self.create_scheduling(days=3)
+
+        lines = self.export('file_format=ndjson&status=active').splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines],
+                         [kept.pk, later.pk])
+
+        end = (timezone.localdate() + timedelta(days=1)).isoformat()
+        lines = self.export(f'file_format=ndjson&end={end}').splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines],
+                         [kept.pk])
+
+    def test_rows_are_read_in_chunks_while_streaming(self):
+        for days in range(1, 4):
+            self.create_scheduling(days=days)
+
+        with mock.patch.object(QuerySet, 'iterator', autospec=True,
+                               side_effect=QuerySet.iterator) as iterator:
+            response = self.client.get('/api/schedules/export/')
+            # Nothing is read until the response is consumed.
+            iterator.assert_not_called()
+            content = b''.join(response.streaming_content).decode()
+
+        iterator.assert_called_once()
+        self.assertEqual(iterator.call_args.kwargs,
+                         {'chunk_size': EXPORT_CHUNK_SIZE})
+        self.assertEqual(len(content.splitlines()), 4)
+
+
+class CalendarClientTests(SimpleTestCase):
+    def setUp(self):
+        self.calendar = CalendarClient('unused.json', [])
+        # Every build returns a new client, without credentials or network.
+        patcher = mock.patch.multiple(
+            'appointments.services.google_calendar_service',
+            AuthorizedHttp=mock.DEFAULT,
+            build_from_document=mock.Mock(
+                side_effect=lambda *args, **kwargs: object()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name in ('get_credentials', 'get_discovery_document'):
+            patcher = mock.patch.object(self.calendar, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_each_thread_reuses_its_own_client(self):
+        service = self.calendar.get_service()
+        self.assertIs(self.calendar.get_service(), service)
+
+        other = []
+        thread = threading.Thread(
+            target=lambda: other.append(self.calendar.get_service()))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(other[0], service)
+        self.assertEqual(self.calendar.stats(),
+                         {'builds': 2, 'builds_avoided': 1})
+
+    def test_reset_rebuilds_the_client(self):
+        service = self.calendar.get_service()
+        self.calendar.reset()
+
+        self.assertIsNot(self.calendar.get_service(), service)
+        self.assertEqual(self.calendar.stats(),
+                         {'builds': 2, 'builds_avoided': 0})
+
+
+class ConditionalRequestTests(BaseSchedulingTestCase):
+    # The tests run on the local-memory cache, so the change markers are
+    # read from the database, one aggregate per table.
+    marker_queries = 2
+
+    def test_unchanged_list_is_answered_with_304(self):
+        self.create_scheduling()
+        response = self.client.get('/api/schedules/')
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(self.marker_queries):
+            response = self.client.get(
+                '/api/schedules/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_and_deletions_change_the_etag(self):
+        scheduling = self.create_scheduling()
+        other = self.create_scheduling(days=2)
+        etag = self.client.get('/api/schedules/')['ETag']
+
+        other.delete()
+        response = self.client.get('/api/schedules/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        self.service.service_name = 'Corte e barba'
+        self.service.save()
+        response = self.client.get('/api/schedules/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(f'/api/schedules/{scheduling.pk}/')
+        self.assertEqual(response.json()['service_name'], 'Corte e barba')
+        response = self.client.get(f'/api/schedules/{scheduling.pk}/',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_bulk_updates_change_the_etag(self):
+        scheduling = self.create_scheduling()
+        etag = self.client.get('/api/schedules/')['ETag']
+
+        transition_schedules([scheduling.pk], 'completed')
+        response = self.client.get('/api/schedules/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_the_query_string(self):
+        first = self.client.get('/api/services/')['ETag']
+        second = self.client.get('/api/services/?page_size=5')['ETag']
+        self.assertNotEqual(first, second)
+
+    def test_writes_of_other_processes_change_the_etag(self):
+        scheduling = self.create_scheduling()
+        etag = self.client.get('/api/schedules/')['ETag']
+
+        # Like a write handled by another worker: no marker moves here.
+        Scheduling.objects.filter(pk=scheduling.pk).update(
+            notes='Com barba', updated_at=timezone.now())
+        response = self.client.get('/api/schedules/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_modification_date_alone_misses_no_deletion(self):
+        self.create_scheduling()
+        other = self.create_scheduling(days=2)
+        last_modified = self.client.get('/api/schedules/')['Last-Modified']
+
+        other.delete()
+        response = self.client.get(
+            '/api/schedules/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+
+
+class SharedCacheConditionalRequestTests(ConditionalRequestTests):
+    # The change markers live in the shared cache.
+    marker_queries = 0
+
+    def setUp(self):
+        patcher = mock.patch('appointments.utils.changes.is_cache_shared',
+                             return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+
+    def test_writes_of_other_processes_change_the_etag(self):
+        # Writes skipping the signals must bump the marker themselves.
+        scheduling = self.create_scheduling()
+        etag = self.client.get('/api/schedules/')['ETag']
+
+        Scheduling.objects.filter(pk=scheduling.pk).update(
+            notes='Com barba', updated_at=timezone.now())
+        bump_change_marker(Scheduling)
+        response = self.client.get('/api/schedules/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_modification_date_alone_misses_no_deletion(self):
+        # The marker moves on deletions, so the date alone is trusted.
+        self.create_scheduling()
+        last_modified = self.client.get('/api/schedules/')['Last-Modified']
+        response = self.client.get(
+            '/api/schedules/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    def test_matches_drf_renderer(self):
+        data = {
+            'price': '30.00', 'notes': 'Sem máquina', 'id': 1,
+            'date_time': datetime(2025, 1, 2, 10, 30, tzinfo=dt_timezone.utc),
+            'items': [{'a': None}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data),
+                         JSONRenderer().render(data))
+
+    def test_line_separators_are_escaped(self):
+        data = {'notes': 'Linha\u2028Parágrafo\u2029'}
+        rendered = FastJSONRenderer().render(data)
+        self.assertEqual(rendered, JSONRenderer().render(data))
+        self.assertEqual(
+            rendered, '{"notes":"Linha\\u2028Parágrafo\\u2029"}'.encode())
+
+        with mock.patch('appointments.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), rendered)
+
+    @skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson_renders_nan_as_null(self):
+        rendered = FastJSONRenderer().render({'ratio': float('nan')})
+        self.assertEqual(rendered, b'{"ratio":null}')
+
+    def test_decimals_keep_their_precision(self):
+        rendered = FastJSONRenderer().render({'price': Decimal('0.10')})
+        self.assertEqual(rendered, b'{"price":"0.10"}')
+
+    def test_aware_datetimes_keep_their_offset(self):
+        moment = timezone.localtime(
+            datetime(2025, 1, 2, 13, 0, tzinfo=dt_timezone.utc))
+        rendered = FastJSONRenderer().render({'date_time': moment})
+        self.assertEqual(
+            rendered, b'{"date_time":"2025-01-02T10:00:00-03:00"}')
+
+    def test_parser_reads_utf8_payloads(self):
+        stream = io.BytesIO('{"notes": "Sem máquina"}'.encode())
+        self.assertEqual(FastJSONParser().parse(stream),
+                         {'notes': 'Sem máquina'})
+
+
+class ValuesListSerializerTests(BaseSchedulingTestCase):
+    def assertSameOutput(self, list_serializer, serializer, queryset,
+                         context=None):
+        context = context or {}
+        expected = serializer(queryset, many=True, context=context).data
+        output = list_serializer(
+            list_serializer.setup_values(queryset), context=context).data
+
+        self.assertEqual(JSONRenderer().render(output),
+                         JSONRenderer().render(expected))
+
+    def test_services_match_service_serializer(self):
+        BarberService.objects.create(
+            service_name='Barba', price=Decimal('19.9'), duration=15,
+            image=None, is_active=False, description='Com toalha quente')
+        BarberService.objects.create(
+            service_name='Sobrancelha', price=10, duration=10, image='')
+        request = RequestFactory().get('/', HTTP_HOST='localhost')
+
+        queryset = BarberService.objects.order_by('pk')
+        self.assertSameOutput(ServiceListSerializer, ServiceSerializer,
+                              queryset)
+        self.assertSameOutput(ServiceListSerializer, ServiceSerializer,
+                              queryset, context={'request': request})
+        # Null decimals are rendered as null, like `DecimalField` does.
+        service = BarberService(pk=0, service_name='Avulso', price=None,
+                                duration=10, image='')
+        row = {name: getattr(service, lookup)
+               for name, lookup in ServiceListSerializer.value_fields}
+        self.assertEqual(
+            JSONRenderer().render(ServiceListSerializer([row]).data),
+            JSONRenderer().render(
+                ServiceSerializer([service], many=True).data))
+
+        # The modification date is bookkeeping, not part of the API.
+        self.assertNotIn('updated_at', ServiceSerializer(self.service).data)
+
+    def test_schedules_match_schedule_serializer(self):
+        self.create_scheduling(notes='Sem máquina')
+        self.create_scheduling(days=2, status='canceled')
+
+        self.assertSameOutput(ScheduleListSerializer, ScheduleSerializer,
+                              Scheduling.objects.order_by('pk'))
+
+
+class SparseFieldsetTests(BaseSchedulingTestCase):
+    def test_list_renders_and_reads_only_requested_fields(self):
+        with self.assertNumQueries(3) as queries:
+            response = self.client.get(
+                '/api/services/?fields=id,service_name,price')
+
+        self.assertEqual(response.json()['results'], [
+            {'id': self.service.pk, 'price': '30.00',
+             'service_name': 'Corte'},
+        ])
+        self.assertNotIn('description', queries.captured_queries[-1]['sql'])
+
+    def test_cursor_pagination_works_without_ordering_fields(self):
+        for days in range(1, 4):
+            self.create_scheduling(days=days)
+
+        data = self.client.get(
+            '/api/schedules/?cursor=&page_size=2&fields=status').json()
+        self.assertEqual(data['results'], [{'status': 'active'}] * 2)
+        self.assertEqual(len(self.client.get(data['next']).json()['results']),
+                         1)
+
+    def test_retrieve_renders_only_requested_fields(self):
+        scheduling = self.create_scheduling(notes='Sem máquina')
+        response = self.client.get(
+            f'/api/schedules/{scheduling.pk}/?fields=service_name,notes')
+        self.assertEqual(response.json(),
+                         {'service_name': 'Corte', 'notes': 'Sem máquina'})
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get('/api/services/?fields=id,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['fields'])
+
+
+class BookingDayTestCase(BaseSchedulingTestCase):
+    def setUp(self):
+        cache.clear()
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def at(self, hour, minute=0):
+        return timezone.make_aware(
+            datetime.combine(self.day, datetime.min.time()).replace(
+                hour=hour, minute=minute))
+
+    def book(self, hour, minute=0, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.create_scheduling(
+                date_time=self.at(hour, minute), **kwargs)
+
+
+class OccupancyTests(BookingDayTestCase):
+    def setUp(self):
+        super().setUp()
+        self.resource = ('service', self.service.pk)
+
+    def test_masks_round_partial_slots_outwards(self):
+        # 07:03-07:11 touches the 07:00, 07:05 and 07:10 slots.
+        self.assertEqual(
+            get_slot_mask(self.day, self.at(7, 3), self.at(7, 11)), 0b111)
+        self.assertFalse(
+            get_slot_mask(self.day, self.at(7, 0), self.at(7, 5))
+            & get_slot_mask(self.day, self.at(7, 5), self.at(7, 10)))
+
+    def test_checks_are_answered_from_the_cached_bitmap(self):
+        self.book(10)
+
+        # One query for the bookings and one for the recurrence rules.
+        with self.assertNumQueries(2):
+            self.assertTrue(
+                may_conflict(self.resource, self.at(10, 15), self.at(11)))
+        with self.assertNumQueries(0):
+            self.assertFalse(
+                may_conflict(self.resource, self.at(10, 30), self.at(11)))
+
+        # A new booking moves the generation, so the bitmap is rebuilt.
+        self.book(13)
+        with self.assertNumQueries(2):
+            self.assertTrue(
+                may_conflict(self.resource, self.at(13), self.at(13, 30)))
+
+    def test_bitmaps_built_before_a_change_are_not_served(self):
+        def book_while_building(*args, **kwargs):
+            # Another booking commits after the rows were read.
+            self.book(13)
+            return {}
+
+        with mock.patch(
+                'appointments.services.occupancy_service.'
+                'get_recurrence_intervals', side_effect=book_while_building):
+            self.assertFalse(
+                may_conflict(self.resource, self.at(13), self.at(13, 30)))
+
+        self.assertTrue(
+            may_conflict(self.resource, self.at(13), self.at(13, 30)))
+
+    def test_moved_and_deleted_bookings_free_their_range(self):
+        scheduling = self.book(10)
+        may_conflict(self.resource, self.at(10), self.at(10, 30))
+
+        scheduling.date_time = self.at(14)
+        with self.captureOnCommitCallbacks(execute=True):
+            scheduling.save()
+        self.assertFalse(
+            may_conflict(self.resource, self.at(10), self.at(10, 30)))
+        self.assertTrue(
+            may_conflict(self.resource, self.at(14), self.at(14, 30)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            scheduling.delete()
+        self.assertFalse(
+            may_conflict(self.resource, self.at(14), self.at(14, 30)))
+
+    def test_form_confirms_possible_conflicts_in_the_database(self):
+        self.book(10, 2)
+        data = {'service': self.service.pk, 'notes': ''}
+
+        # Shares the 10:30 slot with the booking but doesn't overlap it.
+        form = ScheduleForm(data={**data, 'date_time': self.at(10, 32)})
+        self.assertTrue(form.is_valid(), form.errors)
+
+        form = ScheduleForm(data={**data, 'date_time': self.at(10, 20)})
+        self.assertFalse(form.is_valid())
+
+    def test_availability_skips_busy_start_times(self):
+        self.book(10)
+
+        slots = get_available_slots(self.service, self.day, self.day)
+        times = [slot.time() for slot in slots[self.day]]
+        self.assertIn(self.at(9, 30).time(), times)
+        self.assertNotIn(self.at(9, 45).time(), times)
+        self.assertNotIn(self.at(10, 15).time(), times)
+        self.assertIn(self.at(10, 30).time(), times)
+
+
+class OverlapTests(BookingDayTestCase):
+    def is_free(self, hour, minute=0):
+        form = ScheduleForm(data={
+            'service': self.service.pk, 'notes': '',
+            'date_time': self.at(hour, minute)})
+        return form.is_valid()
+
+    def test_same_start_time_conflicts(self):
+        self.book(10)
+        self.assertFalse(self.is_free(10))
+
+    def test_earlier_booking_running_into_the_slot_conflicts(self):
+        self.book(9, 45)
+        self.assertFalse(self.is_free(10))
+        self.assertFalse(self.is_free(9, 30))
+
+    def test_back_to_back_bookings_are_allowed(self):
+        self.book(10)
+        self.assertTrue(self.is_free(9, 30))
+        self.assertTrue(self.is_free(10, 30))
+
+    def test_migration_stops_on_existing_overlaps(self):
+        migration = import_module('appointments.migrations.'
+                                  '0020_scheduling_end_time_and_overlap_'
+                                  'constraint')
+        schema_editor = mock.Mock(**{'connection.vendor': 'postgresql'})
+        kept = [self.create_scheduling(date_time=self.at(hour))
+                for hour in (10, 11)]
+        self.create_scheduling(
+            date_time=self.at(10), service=BarberService.objects.create(
+                service_name='Barba', price=20, duration=30))
+        migration.check_overlapping_schedules(apps, schema_editor)
+
+        overlapping = [
+            self.create_scheduling(date_time=self.at(10)),
+            self.create_scheduling(date_time=self.at(10, 15)),
+        ]
+        with self.assertRaisesMessage(
+                RuntimeError, f'{overlapping[0].pk}, {overlapping[1].pk}.'):
+            migration.check_overlapping_schedules(apps, schema_editor)
+
+        # Nothing is changed.
+        self.assertEqual(
+            Scheduling.objects.filter(pk__in=[
+                schedule.pk for schedule in kept + overlapping],
+                status='active').count(), 4)
+
+
+class AvailabilityViewTests(BookingDayTestCase):
+    def get_days(self, **params):
+        params.setdefault('start', self.day.isoformat())
+        response = self.client.get(
+            f'/api/services/{self.service.pk}/availability/', params)
+        self.assertEqual(response.status_code, 200)
+        return {day['date']: day['slots'] for day in response.json()['days']}
+
+    def test_slots_cover_the_working_hours_of_each_day(self):
+        days = self.get_days(
+            end=(self.day + timedelta(days=1)).isoformat(), step=60)
+
+        hours = [f'{hour:02d}:00' for hour in range(7, 18)]
+        self.assertEqual(days, {
+            self.day.isoformat(): hours,
+            (self.day + timedelta(days=1)).isoformat(): hours,
+        })
+
+    def test_booked_and_recurring_slots_are_left_out(self):
+        self.book(10)
+        RecurrenceRule.objects.create(
+            client=self.client_user, service=self.service,
+            first_occurrence=self.at(14) - timedelta(weeks=2))
+
+        slots = self.get_days(step=30)[self.day.isoformat()]
+        self.assertIn('09:30', slots)
+        self.assertNotIn('10:00', slots)
+        self.assertIn('10:30', slots)
+        self.assertNotIn('14:00', slots)
+        self.assertIn('14:30', slots)
+
+    def test_invalid_parameters_are_rejected(self):
+        url = f'/api/services/{self.service.pk}/availability/'
+        tomorrow = self.day.isoformat()
+        for params, field in (
+            ({'start': '2025-02-30'}, 'start'),
+            ({'start': 'tomorrow'}, 'start'),
+            ({'start': tomorrow,
+              'end': (self.day - timedelta(days=1)).isoformat()}, 'end'),
+            ({'start': tomorrow,
+              'end': (self.day + timedelta(days=31)).isoformat()}, 'end'),
+            ({'step': '4'}, 'step'),
+            ({'step': '121'}, 'step'),
+            ({'step': '1.5'}, 'step'),
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.json()), [field])
+
+
+class StaffSchedulingTests(BookingDayTestCase):
+    def setUp(self):
+        super().setUp()
+        self.beard = BarberService.objects.create(
+            service_name='Barba', price=20, duration=30)
+        self.barbers = [
+            CustomUser.objects.create_user(
+                username=f'barber{number}', email=f'barber{number}@x.com',
+                password='x', user_type='employee')
+            for number in (1, 2)
+        ]
+        for barber in self.barbers:
+            WorkingHours.objects.create(
+                staff=barber, weekday=self.day.weekday(),
+                start_time=self.at(9).time(), end_time=self.at(12).time())
+
+    def submit(self, hour, minute=0, service=None):
+        form = ScheduleForm(data={
+            'service': (service or self.service).pk, 'notes': '',
+            'date_time': self.at(hour, minute)})
+        if form.is_valid():
+            scheduling = form.save(commit=False)
+            scheduling.client = self.client_user
+            with self.captureOnCommitCallbacks(execute=True):
+                scheduling.save()
+        return form
+
+    def test_bookings_are_spread_over_the_free_employees(self):
+        first = self.submit(10).instance
+        second = self.submit(10).instance
+
+        self.assertEqual({first.staff, second.staff}, set(self.barbers))
+        self.assertIn('Nenhum profissional', str(self.submit(10).errors))
+
+    def test_different_services_conflict_for_the_same_employee(self):
+        self.barbers[1].working_hours.all().delete()
+        self.submit(10)
+
+        self.assertFalse(self.submit(10, 15, service=self.beard).is_valid())
+        self.assertTrue(self.submit(10, 30, service=self.beard).is_valid())
+
+    def test_bookings_must_fit_in_a_shift(self):
+        self.assertFalse(self.submit(11, 45).is_valid())
+        self.assertIsNone(find_available_staff(self.at(8), self.at(8, 30)))
+
+    def test_unassigned_bookings_still_hold_their_service(self):
+        # Made before the working hours were registered.
+        self.book(10)
+
+        self.assertIn('conflita', str(self.submit(10, 15).errors))
+        self.assertTrue(self.submit(10, 15, service=self.beard).is_valid())
+        slots = get_available_slots(self.service, self.day, self.day)
+        self.assertNotIn(
+            self.at(10).time(), {slot.time() for slot in slots[self.day]})
+
+    def test_availability_follows_shifts_and_headcount(self):
+        self.submit(10)
+        self.submit(10)
+
+        slots = get_available_slots(self.service, self.day, self.day)
+        times = {slot.time() for slot in slots[self.day]}
+        self.assertIn(self.at(9).time(), times)
+        self.assertNotIn(self.at(10).time(), times)
+        self.assertIn(self.at(11, 30).time(), times)
+        self.assertNotIn(self.at(11, 45).time(), times)
+
+
+class RecurrenceTests(BookingDayTestCase):
+    def create_rule(self, **kwargs):
+        kwargs.setdefault('client', self.client_user)
+        kwargs.setdefault('service', self.service)
+        kwargs.setdefault('first_occurrence', self.at(10))
+        return RecurrenceRule.objects.create(**kwargs)
+
+    def test_occurrences_are_expanded_lazily(self):
+        rule = self.create_rule(until=self.day + timedelta(weeks=6))
+        # Starting far from the first occurrence doesn't walk the earlier
+        # ones, and the local time is kept.
+        occurrences = list(rule.get_occurrences(
+            self.at(10, 1), self.at(10) + timedelta(weeks=52)))
+
+        self.assertEqual(occurrences, [
+            self.at(10) + timedelta(weeks=weeks) for weeks in (2, 4, 6)])
+        self.assertFalse(Scheduling.objects.exists())
+
+    def test_bitmaps_see_future_occurrences(self):
+        self.create_rule()
+        resource = ('service', self.service.pk)
+
+        self.assertTrue(may_conflict(
+            resource, self.at(10, 15) + timedelta(weeks=2),
+            self.at(11) + timedelta(weeks=2)))
+        self.assertFalse(may_conflict(
+            resource, self.at(10, 15) + timedelta(weeks=1),
+            self.at(11) + timedelta(weeks=1)))
+
+    def test_materialization_creates_bookings_and_calendar_tasks(self):
+        rule = self.create_rule(notes='Degradê')
+        # The third occurrence is taken by a regular booking.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_scheduling(
+                date_time=self.at(10, 15) + timedelta(weeks=4))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            summary = materialize_recurrences(weeks=6)
+
+        self.assertEqual(summary, {'created': 2, 'skipped': 1})
+        schedules = Scheduling.objects.filter(recurrence=rule).order_by(
+            'date_time')
+        self.assertEqual(
+            [schedule.date_time for schedule in schedules],
+            [self.at(10), self.at(10) + timedelta(weeks=2)])
+        self.assertEqual(schedules[0].end_time, self.at(10, 30))
+        self.assertEqual(schedules[0].client_name, 'Client User')
+        self.assertEqual(CalendarSyncTask.objects.filter(
+            scheduling__recurrence=rule, action='insert').count(), 2)
+
+        # Later runs only create what entered the window since.
+        self.assertEqual(materialize_recurrences(weeks=6),
+                         {'created': 0, 'skipped': 0})
+
+    def test_staff_rules_ignore_shifts_without_a_staff_schedule(self):
+        barber = CustomUser.objects.create_user(
+            username='barber', email='barber@x.com', password='x',
+            user_type='employee')
+        self.create_rule(staff=barber)
+
+        self.assertEqual(materialize_recurrences(weeks=6),
+                         {'created': 3, 'skipped': 0})
+
+    def test_form_rejects_rules_that_conflict(self):
+        self.create_scheduling(date_time=self.at(10) + timedelta(weeks=4))
+        data = {
+            'client': self.client_user.pk, 'service': self.service.pk,
+            'first_occurrence': self.at(10), 'interval_weeks': 2,
+            'notes': '', 'is_active': True,
+        }
+
+        form = RecurrenceRuleForm(data=data)
+        self.assertFalse(form.is_valid())
+        self.assertIn('conflita', str(form.errors))
+
+        data['interval_weeks'] = 3
+        self.assertTrue(RecurrenceRuleForm(data=data).is_valid())
+
+
+class ImportSchedulesTests(BookingDayTestCase):
+    def import_csv(self, lines, **kwargs):
+        stream = io.StringIO('\n'.join(
+            ['client,service,date_time,status,notes'] + lines))
+        return import_schedules(read_rows(stream, 'csv'), **kwargs)
+
+    def row(self, hour, minute=0, status='active', service=None):
+        return (f'{self.client_user.pk},{service or self.service.pk},'
+                f'{self.at(hour, minute).isoformat()},{status},')
+
+    def test_valid_rows_are_imported_and_invalid_ones_reported(self):
+        self.book(9)
+
+        # The services and the working hours, then per chunk the users,
+        # the bookings and the recurrence rules of days not seen yet and
+        # the inserts, whatever the number of rows.
+        with self.assertNumQueries(14):
+            summary = self.import_csv([
+                self.row(10),
+                self.row(9, 15),  # Overlaps the existing booking.
+                self.row(10, 15),  # Overlaps the row above.
+                self.row(10, 15, status='completed'),
+                self.row(18),  # After hours.
+                self.row(11, service=999),
+                self.row(11, 30),
+            ], chunk_size=4)
+
+        self.assertEqual(summary['created'], 3)
+        self.assertEqual([line for line, _ in summary['errors']],
+                         [3, 4, 6, 7])
+        self.assertEqual(CalendarSyncTask.objects.filter(
+            scheduling__date_time__in=[self.at(10), self.at(11, 30)]).count(),
+            2)
+        imported = Scheduling.objects.get(date_time=self.at(10))
+        self.assertEqual(imported.end_time, self.at(10, 30))
+        self.assertEqual(imported.client_name, 'Client User')
+
+    def test_rows_respect_recurrences_and_the_staff_schedule(self):
+        RecurrenceRule.objects.create(
+            client=self.client_user, service=self.service,
+            first_occurrence=self.at(10) - timedelta(weeks=2))
+
+        summary = self.import_csv([self.row(10, 15)], dry_run=True)
+        self.assertIn('conflita', summary['errors'][0][1])
+
+        WorkingHours.objects.create(
+            staff=CustomUser.objects.create_user(
+                username='barber', email='barber@x.com', password='x',
+                user_type='employee'),
+            weekday=self.day.weekday(), start_time=self.at(9).time(),
+            end_time=self.at(12).time())
+        summary = self.import_csv(
+            [self.row(11), self.row(11, status='completed')], dry_run=True)
+        self.assertEqual(summary['errors'], [(2, STAFF_REQUIRED_MESSAGE)])
+
+    def test_staff_rows_must_fit_the_employee_shifts(self):
+        barber = CustomUser.objects.create_user(
+            username='barber', email='barber@x.com', password='x',
+            user_type='employee')
+        WorkingHours.objects.create(
+            staff=barber, weekday=self.day.weekday(),
+            start_time=self.at(9).time(), end_time=self.at(12).time())
+        stream = io.StringIO('\n'.join(
+            json.dumps({'client': self.client_user.pk, 'staff': barber.pk,
+                        'service': self.service.pk,
+                        'date_time': self.at(hour, minute).isoformat()})
+            for hour, minute in [(11, 0), (11, 45)]))
+
+        summary = import_schedules(read_rows(stream, 'json'), dry_run=True)
+
+        self.assertEqual(summary['errors'], [(2, OFF_SHIFT_MESSAGE)])
+
+    def test_non_integral_ids_are_rejected(self):
+        stream = io.StringIO('\n'.join(
+            json.dumps({'client': client, 'service': self.service.pk,
+                        'date_time': self.at(10).isoformat()})
+            for client in [self.client_user.pk + 0.9, True]))
+
+        summary = import_schedules(read_rows(stream, 'json'), dry_run=True)
+
+        self.assertEqual([line for line, _ in summary['errors']], [1, 2])
+        self.assertIn('não é um ID válido', summary['errors'][0][1])
+
+    def test_command_reads_csv_files_with_a_bom(self):
+        output = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'schedules.csv')
+            with open(path, 'w', encoding='utf-8-sig') as stream:
+                stream.write('client,service,date_time\n' + ','.join([
+                    str(self.client_user.pk), str(self.service.pk),
+                    self.at(10).isoformat()]) + '\n')
+            call_command('import_schedules', path, stdout=output)
+
+        self.assertIn('1 created, 0 errors.', output.getvalue())
+
+    def test_json_lines_and_dry_run(self):
+        stream = io.StringIO(
+            '{"client": %d, "service": %d, "date_time": "%s"}\nnot json\n'
+            % (self.client_user.pk, self.service.pk, self.at(10).isoformat()))
+
+        summary = import_schedules(read_rows(stream, 'json'), dry_run=True)
+
+        self.assertEqual(summary, {'created': 0,
+                                   'errors': [(2, 'Linha inválida.')]})
+        self.assertFalse(Scheduling.objects.exists())
+
+
+class RequestTimingTests(BaseSchedulingTestCase):
+    def test_header_is_left_out_when_disabled(self):
+        response = self.client.get('/our_services/')
+        self.assertNotIn('Server-Timing', response.headers)
+
+    @override_settings(REQUEST_TIMING=True)
+    def test_database_and_templates_are_measured(self):
+        # The session and the user are loaded from the database.
+        self.client.force_login(self.client_user)
+        with self.assertLogs('appointments.timing') as logs:
+            response = self.client.get('/our_services/')
+
+        metrics = {
+            metric.split(';')[0]: metric
+            for metric in response.headers['Server-Timing'].split(', ')
+        }
+        self.assertEqual(set(metrics), {'total', 'db', 'http', 'template'})
+        self.assertIn('desc="Outbound HTTP (0)"', metrics['http'])
+
+        timing = logs.records[0].timing
+        self.assertEqual(timing['path'], '/our_services/')
+        self.assertGreater(timing['db_count'], 0)
+        self.assertGreater(timing['template_count'], 0)
+
+
+class MetricsTests(BookingDayTestCase):
+    def setUp(self):
+        super().setUp()
+        caches['metrics'].clear()
+
+    def get_samples(self, **kwargs):
+        response = self.client.get('/metrics', **kwargs)
+        self.assertEqual(response.status_code, 200)
+        # The tests run on the local-memory cache, whose samples are
+        # labeled with the process.
+        lines = [
+            re.sub(r',?pid="\d+",process_start="\d+"', '', line).replace(
+                '{,', '{').replace('{}', '')
+            for line in response.content.decode().splitlines()
+        ]
+        return dict(
+            line.rsplit(' ', 1) for line in lines if not line.startswith('#'))
+
+    def test_bookings_and_conflicts_are_counted(self):
+        self.client.force_login(self.client_user)
+        data = {'service': self.service.pk, 'notes': '',
+                'date_time': self.at(10).strftime('%Y-%m-%dT%H:%M')}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/schedule/create', data)
+        self.client.post('/schedule/create', data)
+
+        samples = self.get_samples()
+        self.assertEqual(samples['appointments_bookings_total'
+                                 '{action="create",outcome="success"}'], '1')
+        self.assertEqual(samples['appointments_bookings_total'
+                                 '{action="create",outcome="rejected"}'], '1')
+        self.assertEqual(samples['appointments_booking_conflicts_total'
+                                 '{reason="conflict"}'], '1')
+        self.assertEqual(
+            samples['appointments_schedule_form_clean_seconds_count'], '2')
+
+    def test_histogram_buckets_are_cumulative(self):
+        CALENDAR_REQUEST_SECONDS.observe(0.03, operation='insert')
+        CALENDAR_REQUEST_SECONDS.observe(20, operation='insert')
+
+        samples = self.get_samples()
+        name = 'appointments_calendar_request_seconds'
+        self.assertEqual(
+            samples[f'{name}_bucket{{operation="insert",le="0.025"}}'], '0')
+        self.assertEqual(
+            samples[f'{name}_bucket{{operation="insert",le="0.05"}}'], '1')
+        self.assertEqual(
+            samples[f'{name}_bucket{{operation="insert",le="+Inf"}}'], '2')
+        self.assertEqual(samples[f'{name}_sum{{operation="insert"}}'], '20.03')
+
+    def test_samples_of_a_private_cache_are_labeled_with_the_process(self):
+        content = self.client.get('/metrics').content.decode()
+        self.assertIn(
+            f'appointments_bookings_total{{action="create",outcome="success",'
+            f'pid="{os.getpid()}",process_start="', content)
+
+        with mock.patch('appointments.utils.metrics.is_cache_shared',
+                        return_value=True):
+            content = self.client.get('/metrics').content.decode()
+        self.assertIn('appointments_bookings_total'
+                      '{action="create",outcome="success"} ', content)
+
+    def test_counters_survive_culling_of_the_default_cache(self):
+        BOOKING_CONFLICTS.inc(reason='no_staff')
+        # Far more entries than the default cache keeps, as the occupancy
+        # bitmaps of a busy month would take.
+        cache.set_many({f'filler:{number}': number for number in range(1000)})
+
+        samples = self.get_samples()
+        self.assertEqual(samples['appointments_booking_conflicts_total'
+                                 '{reason="no_staff"}'], '1')
+
+    def test_calendar_client_builds_are_exported(self):
+        with mock.patch.object(calendar_client, 'stats', return_value={
+                'builds': 2, 'builds_avoided': 40}):
+            samples = self.get_samples()
+
+        self.assertEqual(
+            samples['appointments_calendar_client_builds_total'], '2')
+        self.assertEqual(
+            samples['appointments_calendar_client_builds_avoided_total'],
+            '40')
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_is_required_when_configured(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.get_samples(HTTP_AUTHORIZATION='Bearer secret')
+
+
+class SeedDataTests(TestCase):
+    def seed(self, **options):
+        call_command('seed_data', clients=5, employees=2, services=3,
+                     schedules=300, stdout=io.StringIO(), **options)
+
+    def test_history_has_no_overlaps_and_is_repeatable(self):
+        def get_rows():
+            return list(Scheduling.objects.order_by(
+                'service__service_name', 'date_time').values_list(
+                    'service__service_name', 'date_time', 'end_time',
+                    'status'))
+
+        self.seed()
+        rows = get_rows()
+
+        self.assertTrue(200 < len(rows) <= 300)
+        for previous, current in zip(rows, rows[1:]):
+            if previous[0] == current[0]:
+                self.assertLessEqual(previous[2], current[1])
+        self.assertEqual({status for *_, status in rows},
+                         {'active', 'canceled', 'completed'})
+
+        with self.assertRaises(CommandError):
+            self.seed()
+        # The same seed generates the same history again.
+        self.seed(flush=True)
+        self.assertEqual(get_rows(), rows)
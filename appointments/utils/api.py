@@ -1,34 +1,252 @@
-import requests
-from django.contrib import messages
+import hashlib
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+from rest_framework.response import Response
+from .changes import get_change_marker
 
 
-def get_results_api(request, api_url: str | None) -> list:
+class EagerLoadingViewSetMixin:
     """
-    Fetches data from an external API and returns the results.
+    Viewset mixin that loads, for read requests, everything the serializer
+    declares through `EagerLoadingMixin`.
 
-    Args:
-        request (HttpRequest): The HTTP request object used for displaying messages.
-        api_url (Optional[str]): The URL of the API to fetch data from. If not provided,
-            an error message is shown.
+    Writes keep the plain queryset, so that saved instances don't have
+    deferred columns.
+    """
+
+    def get_queryset(self):
+        """
+        Returns the viewset queryset with the serializer eager loading
+        applied on read requests.
+        """
+        queryset = super().get_queryset()  # type: ignore
+
+        serializer_class = self.get_serializer_class()  # type: ignore
+        if (self.request.method in SAFE_METHODS  # type: ignore
+                and hasattr(serializer_class, 'setup_eager_loading')):
+            queryset = serializer_class.setup_eager_loading(queryset)
+
+        return queryset
+
+
+class ValuesListViewSetMixin:
+    """
+    Viewset mixin that serves `list` with a `ValuesListSerializer`, reading
+    `.values()` rows instead of model instances. The other actions keep the
+    regular serializer.
+
+    Attributes
+    ----------
+    list_serializer_class : type
+        The `ValuesListSerializer` used by `list`.
+
+    requested_fields : tuple | None
+        The output fields to render, None for all of them. Set by
+        `SparseFieldsetViewSetMixin`.
+    """
+
+    list_serializer_class = None
+    requested_fields = None
+
+    def get_values_queryset(self, queryset):
+        """
+        Turns the list queryset into `.values()` rows, including the
+        columns the keyset pagination reads even when they are not shown.
+        """
+        keyset_columns = [
+            'id' if name == 'pk' else name
+            for name in (
+                field.lstrip('-') for field in getattr(
+                    self.paginator, 'keyset_ordering', ()))  # type: ignore
+        ]
+        return self.list_serializer_class.setup_values(  # type: ignore
+            queryset, fields=self.requested_fields, extra=keyset_columns)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_values_queryset(
+            self.filter_queryset(self.get_queryset()))  # type: ignore
+        serializer_kwargs = {
+            'context': self.get_serializer_context(),  # type: ignore
+            'fields': self.requested_fields,
+        }
+
+        page = self.paginate_queryset(queryset)  # type: ignore
+        if page is not None:
+            serializer = self.list_serializer_class(  # type: ignore
+                page, **serializer_kwargs)
+            return self.get_paginated_response(  # type: ignore
+                serializer.data)
+
+        serializer = self.list_serializer_class(  # type: ignore
+            queryset, **serializer_kwargs)
+        return Response(serializer.data)
+
+
+class SparseFieldsetViewSetMixin(ValuesListViewSetMixin):
+    """
+    Viewset mixin adding the `fields` query parameter to `list` and
+    `retrieve`, e.g. `?fields=id,service_name,price`. Only the requested
+    fields are rendered and only their columns are read from the database.
+
+    The valid names are the output fields of `list_serializer_class`. The
+    regular serializer must accept a `fields` argument, see
+    `SparseFieldsMixin`.
+    """
+
+    fields_query_param = 'fields'
+    sparse_actions = ('list', 'retrieve')
+    invalid_fields_message = 'Campos inválidos: {fields}.'
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)  # type: ignore
+        self.requested_fields = self.parse_requested_fields(request)
 
-    Returns:
-        list: A list of results from the API response. If no results are found or an error occurs,
-            an empty list is returned.
+    def parse_requested_fields(self, request):
+        """
+        Reads the requested fields from the query string.
 
-    Raises:
-        requests.exceptions.RequestException: If there is an error in the HTTP request.
+        Returns
+        -------
+        tuple | None
+            The field names, or None when every field is wanted.
+
+        Raises
+        ------
+        ValidationError
+            If a name is not an output field.
+        """
+        value = request.query_params.get(self.fields_query_param)
+        if not value or self.action not in self.sparse_actions:  # type: ignore
+            return None
+
+        names = tuple(dict.fromkeys(
+            name.strip() for name in value.split(',') if name.strip()))
+        available = {
+            name for name, _ in
+            self.list_serializer_class.value_fields  # type: ignore
+        }
+        invalid = [name for name in names if name not in available]
+        if invalid or not names:
+            raise ValidationError({
+                self.fields_query_param: self.invalid_fields_message.format(
+                    fields=', '.join(invalid) or value)
+            })
+        return names
+
+    def get_queryset(self):
+        """
+        Reads only the columns of the requested fields on `retrieve`.
+        """
+        queryset = super().get_queryset()  # type: ignore
+        action = self.action  # type: ignore
+        if self.requested_fields is None or action != 'retrieve':
+            return queryset
+
+        lookups = [
+            lookup for _, lookup in
+            self.list_serializer_class.get_value_fields(  # type: ignore
+                self.requested_fields)
+        ]
+        relations = {
+            lookup.rsplit('__', 1)[0] for lookup in lookups if '__' in lookup
+        }
+        queryset = queryset.select_related(None).only(*lookups)
+        if relations:
+            queryset = queryset.select_related(*sorted(relations))
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.requested_fields is not None:
+            kwargs['fields'] = self.requested_fields
+        return super().get_serializer(*args, **kwargs)  # type: ignore
+
+
+class ConditionalViewSetMixin:
+    """
+    Viewset mixin that answers `list` and `retrieve` with a strong `ETag`
+    and a `Last-Modified` header, and with a 304 when the client copy is
+    still current.
+
+    The validators come from the change markers of the tables the response
+    reads, see `get_change_marker`, which move whenever a row is saved or
+    deleted, so that deletions are noticed too. They cover the whole table
+    rather than the filtered rows, which may cost a few needless 200s but
+    never a stale 304. The `ETag` also covers the URL, including the query
+    string and the page, and the negotiated media type.
+
+    With a shared cache the markers are read from it, without touching the
+    database. Otherwise they are read from the database, one aggregate per
+    table, and since `Last-Modified` then misses deletions, a request with
+    `If-Modified-Since` but no `If-None-Match` is always answered in full.
+    """
+
+    def get_change_markers(self):
+        """
+        Returns the change markers the response depends on. Viewsets whose
+        output includes related rows add the markers of those.
+        """
+        return [get_change_marker(self.get_queryset().model)]  # type: ignore
+
+    def get_conditional_validators(self, request):
+        """
+        Builds the `ETag` and the last modification date of a response.
+
+        Returns
+        -------
+        tuple
+            The quoted `ETag`, the latest change as a datetime, and whether
+            that date also moves on deletions.
+        """
+        markers = self.get_change_markers()
+        parts = [request.build_absolute_uri(),
+                 getattr(request, 'accepted_media_type', '')]
+        parts += [marker.value for marker in markers]
+        digest = hashlib.sha1('|'.join(parts).encode()).hexdigest()
+        return (
+            f'"{digest}"',
+            max(marker.last_modified for marker in markers),
+            all(marker.tracks_deletions for marker in markers),
+        )
+
+    def conditional_response(self, request, respond, *args, **kwargs):
+        """
+        Answers a conditional request from the change markers, calling
+        `respond` only when the client copy is stale.
+        """
+        etag, last_modified, tracks_deletions = (
+            self.get_conditional_validators(request))
+        last_modified = int(last_modified.timestamp())
+
+        response = get_conditional_response(
+            request, etag=etag,
+            last_modified=last_modified if tracks_deletions else None)
+        if response is None:
+            response = respond(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, super().list, *args, **kwargs)  # type: ignore
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, super().retrieve, *args, **kwargs)  # type: ignore
+
+
+class IsStaffUser(BasePermission):
+    """
+    Allows access only to authenticated users who are not clients.
     """
-    if not api_url:
-        messages.error(request, 'URL da API não está configurada.')
-        return []
 
-    try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-        data = response.json().get('results', [])
-        return data
+    message = 'You dont have permission to access this page.'
 
-    except requests.exceptions.RequestException as e:
-        messages.error(
-            request, f'Erro ao pegar informações: {str(e)}')
-        return []
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated
+                    and not request.user.is_client())
@@ -0,0 +1,18 @@
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_cache_shared(alias: str = 'default') -> bool:
+    """
+    Checks whether a cache is shared by the processes of the site, e.g.
+    Redis, rather than private to each process, like the local-memory
+    cache, so that writes made by a process are seen by the others.
+
+    Args:
+        alias (str): The cache alias.
+
+    Returns:
+        bool: False for the local-memory and the dummy caches.
+    """
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
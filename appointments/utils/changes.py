@@ -0,0 +1,98 @@
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple
+from django.core.cache import cache
+from django.db.models import Count, Max
+from .caches import is_cache_shared
+
+
+class ChangeMarker(NamedTuple):
+    """
+    The state of a table, which moves whenever one of its rows changes.
+
+    Attributes
+    ----------
+    value : str
+        The marker itself, to be compared or hashed.
+
+    last_modified : datetime
+        The last change of the table.
+
+    tracks_deletions : bool
+        Whether `last_modified` also moves when rows are deleted.
+    """
+
+    value: str
+    last_modified: datetime
+    tracks_deletions: bool
+
+
+def get_change_key(model) -> str:
+    return f'changes:{model._meta.label_lower}'
+
+
+def now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def get_change_marker(model) -> ChangeMarker:
+    """
+    Retrieves the change marker of a table.
+
+    With a cache shared by every process, the marker is the time of the
+    last change in milliseconds, kept in the cache and moved by
+    `bump_change_marker`, so reading it runs no query. When the marker is
+    missing (first use, eviction or a cache restart) it starts again from
+    the current time, so it never matches a marker that clients may still
+    hold.
+
+    With a cache private to each process, a bump would only be seen by the
+    process that made the change, so the marker is read from the database
+    instead: the latest `updated_at` and the row count, which drops on
+    deletions.
+
+    Args:
+        model (type): The model of the table, with an `updated_at` field.
+
+    Returns:
+        ChangeMarker: The change marker.
+    """
+    if not is_cache_shared():
+        state = model._default_manager.order_by().aggregate(
+            latest=Max('updated_at'), count=Count('pk'))
+        latest = state['latest'] or datetime.fromtimestamp(0, tz=timezone.utc)
+        return ChangeMarker(
+            f'{latest.isoformat()}:{state["count"]}', latest, False)
+
+    key = get_change_key(model)
+    marker = cache.get(key)
+    if marker is None:
+        cache.add(key, now_ms(), timeout=None)
+        marker = cache.get(key)
+    return ChangeMarker(str(marker), get_marker_datetime(marker), True)
+
+
+def bump_change_marker(model):
+    """
+    Records a change to a table in the shared cache. Called from the
+    `post_save` and `post_delete` signals, and by the bulk writes, which
+    send none.
+
+    Args:
+        model (type): The model of the table.
+    """
+    if not is_cache_shared():
+        return
+
+    key = get_change_key(model)
+    marker = cache.get(key)
+    # Concurrent bumps may write the same value, which is fine: any of
+    # them differs from the marker read before the changes.
+    cache.set(key, max(now_ms(), (marker or 0) + 1), timeout=None)
+
+
+def get_marker_datetime(marker: int) -> datetime:
+    """
+    Converts a cached change marker into an aware datetime.
+    """
+    return datetime.fromtimestamp(marker / 1000, tz=timezone.utc)
@@ -0,0 +1,264 @@
+import bisect
+import itertools
+import os
+import time
+from contextlib import contextmanager
+from django.core.cache import caches
+from .caches import is_cache_shared
+
+METRICS_PREFIX = 'metrics'
+# The cache alias of the metrics, kept apart from the default cache, whose
+# entries may be culled, see `CACHES` in the settings.
+METRICS_CACHE = 'metrics'
+# Upper bounds, in seconds, of the histogram buckets by default.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Histogram sums are kept as integers, in millionths.
+SUM_SCALE = 1_000_000
+
+registry = []
+# The current process and when it was first seen, as `(pid, start_time)`.
+_process = (None, None)
+
+
+def increment(key: str, amount: int = 1):
+    """
+    Atomically adds to a cache counter, creating it when missing.
+
+    The counters live in the `METRICS_CACHE` cache, so every worker sharing
+    it, e.g. Redis, adds to the same value. With the local-memory cache each
+    process counts on its own, see `get_process_labels`.
+    """
+    cache = caches[METRICS_CACHE]
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key, amount)
+
+
+def get_process_labels() -> dict:
+    """
+    Returns the labels telling apart the processes that count on their
+    own, i.e. when the metrics cache is private to each process.
+
+    Each process then reports separate series labeled with its `pid` and
+    `process_start`, its start time, so that a scrape answered by another
+    worker, or by a restarted one, is never read as a counter going
+    backwards. With a shared cache there is a single series.
+
+    Returns:
+        dict: The `pid` and `process_start` labels, or an empty dict.
+    """
+    if is_cache_shared(METRICS_CACHE):
+        return {}
+    return get_process_identity()
+
+
+def get_process_identity() -> dict:
+    """
+    Returns the `pid` and `process_start` labels of the current process.
+    """
+    global _process
+
+    pid = os.getpid()
+    if _process[0] != pid:
+        # First use, or a worker forked after the module was imported.
+        _process = (pid, int(time.time()))
+    return {'pid': pid, 'process_start': _process[1]}
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        f'{name}="{value}"' for name, value in labels.items())
+
+
+class Metric:
+    """
+    Base class of the metrics. Label values are declared upfront, since the
+    cache can't list the keys that exist.
+
+    Attributes
+    ----------
+    name : str
+        The metric name, without the `appointments_` prefix.
+    documentation : str
+        The help text.
+    labels : dict
+        The possible values of each label.
+    """
+
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labels=None):
+        self.name = f'appointments_{name}'
+        self.documentation = documentation
+        self.labels = labels or {}
+        registry.append(self)
+
+    def get_key(self, suffix: str, labels: dict) -> str:
+        if set(labels) != set(self.labels) or any(
+                value not in self.labels[name]
+                for name, value in labels.items()):
+            raise ValueError(f'Invalid labels for {self.name}: {labels}')
+        values = ':'.join(str(labels[name]) for name in self.labels)
+        return f'{METRICS_PREFIX}:{self.name}:{suffix}:{values}'
+
+    def get_label_sets(self) -> list:
+        """
+        Lists every combination of the declared label values.
+        """
+        return [
+            dict(zip(self.labels, values))
+            for values in itertools.product(*self.labels.values())
+        ]
+
+    def render(self, extra_labels=None) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.kind}']
+        return lines + self.render_samples(extra_labels or {})
+
+    def render_samples(self, extra_labels: dict) -> list:
+        """
+        Renders the samples, with `extra_labels` added to their labels.
+        """
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    A value that only goes up, e.g. how many bookings were made.
+    """
+
+    kind = 'counter'
+
+    def inc(self, amount: int = 1, **labels):
+        increment(self.get_key('total', labels), amount)
+
+    def render_samples(self, extra_labels: dict) -> list:
+        label_sets = self.get_label_sets()
+        keys = [self.get_key('total', labels) for labels in label_sets]
+        values = caches[METRICS_CACHE].get_many(keys)
+        return [
+            f'{self.name}{format_labels({**labels, **extra_labels})} '
+            f'{values.get(key, 0)}'
+            for labels, key in zip(label_sets, keys)
+        ]
+
+
+class CallbackCounter(Metric):
+    """
+    A counter kept by the process itself and read through a function when
+    rendered, e.g. how many calendar clients were built. Its samples are
+    always labeled with the process, since each process counts on its own.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, callback):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def render_samples(self, extra_labels: dict) -> list:
+        labels = {**extra_labels, **get_process_identity()}
+        return [f'{self.name}{format_labels(labels)} {self.callback()}']
+
+
+class Histogram(Metric):
+    """
+    The distribution of a value, e.g. how long calendar requests take, as
+    counts per bucket plus the sum and the count of all the observations.
+
+    Each observation costs three cache increments: its bucket, the sum and
+    the count. Buckets are stored separately and added up when rendered.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels=None,
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        index = bisect.bisect_left(self.buckets, value)
+        bucket = self.buckets[index] if index < len(self.buckets) else 'inf'
+        increment(self.get_key(f'bucket:{bucket}', labels))
+        increment(self.get_key('sum', labels), round(value * SUM_SCALE))
+        increment(self.get_key('count', labels))
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observes how long the enclosed block takes, in seconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render_samples(self, extra_labels: dict) -> list:
+        bounds = self.buckets + ('inf',)
+        label_sets = self.get_label_sets()
+        keys = {
+            (index, suffix): self.get_key(suffix, labels)
+            for index, labels in enumerate(label_sets)
+            for suffix in [f'bucket:{bound}' for bound in bounds]
+            + ['sum', 'count']
+        }
+        values = caches[METRICS_CACHE].get_many(keys.values())
+
+        def get(index, suffix):
+            return values.get(keys[index, suffix], 0)
+
+        lines = []
+        for index, labels in enumerate(label_sets):
+            sample_labels = {**labels, **extra_labels}
+            cumulative = 0
+            for bound in bounds:
+                cumulative += get(index, f'bucket:{bound}')
+                le = '+Inf' if bound == 'inf' else bound
+                lines.append(
+                    f'{self.name}_bucket'
+                    f'{format_labels({**sample_labels, "le": le})} '
+                    f'{cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(sample_labels)} '
+                         f'{get(index, "sum") / SUM_SCALE}')
+            lines.append(f'{self.name}_count{format_labels(sample_labels)} '
+                         f'{get(index, "count")}')
+        return lines
+
+
+CALENDAR_OPERATIONS = ('insert', 'patch', 'delete', 'batch')
+
+BOOKINGS = Counter(
+    'bookings_total', 'Bookings submitted through the booking views.',
+    labels={'action': ('create', 'update', 'delete'),
+            'outcome': ('success', 'rejected', 'error')})
+BOOKING_CONFLICTS = Counter(
+    'booking_conflicts_total',
+    'Bookings rejected because the time was already taken.',
+    labels={'reason': ('conflict', 'no_staff', 'constraint')})
+SCHEDULE_FORM_CLEAN_SECONDS = Histogram(
+    'schedule_form_clean_seconds',
+    'Time spent validating the booking form.')
+CALENDAR_REQUESTS = Counter(
+    'calendar_requests_total', 'Requests sent to the calendar API.',
+    labels={'operation': CALENDAR_OPERATIONS, 'outcome': ('ok', 'error')})
+CALENDAR_REQUEST_SECONDS = Histogram(
+    'calendar_request_seconds', 'Latency of the calendar API requests.',
+    labels={'operation': CALENDAR_OPERATIONS})
+
+
+def render_metrics() -> str:
+    """
+    Renders every registered metric in the Prometheus text format, labeled
+    with the current process when the metrics cache is private to it.
+    """
+    process_labels = get_process_labels()
+    lines = []
+    for metric in registry:
+        lines += metric.render(process_labels)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,94 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.template.backends.django import DjangoTemplates, Template
+
+# The timings of the current request, or None when they are not recorded.
+_timings = ContextVar('timings', default=None)
+
+
+def start_timing():
+    """
+    Starts recording timings for the current request.
+
+    Returns:
+        tuple: The token to pass to `stop_timing` and the dictionary that
+            collects the timings, mapping each name to its total duration in
+            seconds and how many times it was measured.
+    """
+    timings = {}
+    return _timings.set(timings), timings
+
+
+def stop_timing(token):
+    """
+    Stops recording timings, see `start_timing`.
+    """
+    _timings.reset(token)
+
+
+def record(name: str, duration: float):
+    """
+    Adds a measure to the timings of the current request, if any.
+
+    Args:
+        name (str): What was measured, e.g. `db`.
+        duration (float): How long it took, in seconds.
+    """
+    timings = _timings.get()
+    if timings is None:
+        return
+
+    total, count = timings.get(name, (0.0, 0))
+    timings[name] = (total + duration, count + 1)
+
+
+@contextmanager
+def timed(name: str):
+    """
+    Measures the enclosed block, see `record`. Costs a context variable
+    lookup when no request is being timed.
+    """
+    if _timings.get() is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper that measures every query, see
+    `connection.execute_wrapper`.
+    """
+    with timed('db'):
+        return execute(sql, params, many, context)
+
+
+class TimedTemplate(Template):
+    """
+    Django template that measures its rendering, see `TimedDjangoTemplates`.
+    """
+
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, with the rendering of each template
+    measured. Nested templates (`include`, `extends`) count as part of the
+    template that loads them.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
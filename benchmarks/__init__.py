@@ -0,0 +1,20 @@
+"""
+Micro-benchmarks of the hot paths of the project.
+
+Each module is run on its own from the project root, e.g.::
+
+    python -m benchmarks.bench_renderers
+    python -m benchmarks.bench_hot_paths
+"""
+import os
+
+
+def setup_django():
+    """
+    Configures Django with the project settings, so that benchmarks can
+    use the models and serializers outside `manage.py`.
+    """
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+    django.setup()
@@ -0,0 +1,205 @@
+"""
+Times the hot paths of the project against a throwaway test database
+filled by the `seed_data` command, with the calendar replaced by
+`LocalCalendarBackend`, and writes the results as JSON so that runs can be
+compared across commits.
+
+Usage::
+
+    python -m benchmarks.bench_hot_paths [--schedules 5000] [--repeat 30]
+        [--output results.json] [--compare previous.json]
+"""
+import argparse
+import io
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from benchmarks import setup_django
+
+setup_django()
+
+import django  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    CaptureQueriesContext, setup_test_environment,
+    teardown_test_environment
+)
+from django.utils import timezone  # noqa: E402
+from appointments.forms.scheduling_forms import ScheduleForm  # noqa: E402
+from appointments.models import (  # noqa: E402
+    BarberService, CustomUser, Scheduling
+)
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def measure(function, repeat: int, warmup: int = 3) -> dict:
+    """
+    Runs a case a few times to warm the caches up, then times each run.
+
+    Returns:
+        dict: The best, median and 95th percentile durations, in
+            milliseconds, and the queries of the last run.
+    """
+    for _ in range(warmup):
+        function()
+
+    durations = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            function()
+            durations.append((time.perf_counter() - start) * 1000)
+
+    durations.sort()
+    return {
+        'min_ms': round(durations[0], 3),
+        'median_ms': round(statistics.median(durations), 3),
+        'p95_ms': round(durations[int(0.95 * (len(durations) - 1))], 3),
+        'queries': len(queries),
+        'runs': repeat,
+    }
+
+
+def iter_free_slots(service):
+    """
+    Yields future starts that no active booking of the service overlaps,
+    to book one per run.
+    """
+    day = timezone.localdate() + timedelta(days=400)
+    while True:
+        start = timezone.make_aware(
+            datetime.combine(day, Scheduling.OPENING_TIME))
+        closing = timezone.make_aware(
+            datetime.combine(day, Scheduling.CLOSING_TIME))
+        while start <= closing:
+            yield start
+            start += timedelta(minutes=service.duration)
+        day += timedelta(days=1)
+
+
+def get_cases(staff_client, client_user_client, service, slots):
+    busy = Scheduling.objects.filter(
+        service=service, status='active',
+        date_time__gt=timezone.now() + timedelta(days=1)).first()
+
+    def book():
+        response = client_user_client.post('/schedule/create', {
+            'service': service.pk, 'notes': '',
+            'date_time': timezone.localtime(next(slots)).strftime(
+                '%Y-%m-%dT%H:%M'),
+        })
+        assert response.status_code == 302, response.status_code
+
+    def check(date_time):
+        return lambda: ScheduleForm(data={
+            'service': service.pk, 'notes': '',
+            'date_time': timezone.localtime(date_time).strftime(
+                '%Y-%m-%dT%H:%M'),
+        }).is_valid()
+
+    def get(client, url):
+        def request():
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+        return request
+
+    cases = {
+        'booking_create': book,
+        'conflict_check_free': check(next(slots)),
+        'schedule_list': get(client_user_client, '/schedules/'),
+        'dashboard': get(staff_client, '/dashboard/'),
+        'api_services': get(staff_client, '/api/services/'),
+        'api_schedules': get(staff_client, '/api/schedules/'),
+        'api_schedules_cursor': get(
+            staff_client, '/api/schedules/?cursor=&page_size=30'),
+    }
+    if busy is not None:
+        cases['conflict_check_busy'] = check(busy.date_time)
+    return cases
+
+
+def compare(results: dict, path: str):
+    previous = json.loads(Path(path).read_text())['results']
+    print(f'\nCompared with {path}:')
+    for name, result in results.items():
+        if name in previous:
+            ratio = result['median_ms'] / previous[name]['median_ms']
+            print(f'{name:<25} {ratio:8.2f} x')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--schedules', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Where to write the JSON results.')
+    parser.add_argument('--compare', help='Previous results to compare.')
+    args = parser.parse_args()
+
+    setup_test_environment(debug=False)
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        with override_settings(CALENDAR_BACKEND=(
+                'appointments.services.google_calendar_service.'
+                'LocalCalendarBackend')):
+            call_command(
+                'seed_data', clients=args.clients, schedules=args.schedules,
+                seed=args.seed, stdout=io.StringIO())
+
+            staff_client = Client()
+            staff_client.force_login(
+                CustomUser.objects.filter(user_type='employee').first())
+            client_user_client = Client()
+            client_user_client.force_login(
+                CustomUser.objects.filter(user_type='client').first())
+            service = BarberService.objects.order_by('pk').first()
+
+            results = {}
+            cases = get_cases(staff_client, client_user_client, service,
+                              iter_free_slots(service))
+            for name, function in cases.items():
+                results[name] = measure(function, args.repeat)
+                print(f'{name:<25} {results[name]["median_ms"]:10.2f} ms '
+                      f'{results[name]["queries"]:4d} queries')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    commit = get_commit()
+    report = {
+        'commit': commit,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'parameters': vars(args),
+        'results': results,
+    }
+    output = Path(args.output or RESULTS_DIR / f'{commit}.json')
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f'\nResults written to {output}')
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
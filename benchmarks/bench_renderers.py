@@ -0,0 +1,101 @@
+"""
+Compares DRF's `JSONRenderer` with `FastJSONRenderer` when rendering 10k
+schedules, built in memory so that no database is needed.
+
+Usage::
+
+    python -m benchmarks.bench_renderers [--rows 10000] [--repeat 5]
+"""
+import argparse
+import timeit
+from datetime import timedelta
+from decimal import Decimal
+from benchmarks import setup_django
+
+setup_django()
+
+from django.utils import timezone  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+from appointments.models import BarberService, Scheduling  # noqa: E402
+from appointments.renderers import FastJSONRenderer, orjson  # noqa: E402
+from appointments.serializers import (  # noqa: E402
+    ScheduleSerializer, ServiceSerializer
+)
+
+
+def build_schedules(rows: int) -> list:
+    """
+    Builds unsaved schedules, all of the same service, spread over the
+    following days.
+    """
+    service = BarberService(
+        pk=1, service_name='Corte', price=Decimal('30.00'), duration=30,
+        updated_at=timezone.now())
+    start = timezone.now()
+    return [
+        Scheduling(
+            pk=pk, client_id=1, client_name='Cliente', service=service,
+            date_time=start + timedelta(minutes=30 * pk),
+            end_time=start + timedelta(minutes=30 * pk + 30),
+            status='active', notes='Sem máquina', updated_at=start)
+        for pk in range(1, rows + 1)
+    ]
+
+
+def build_payload(rows: int) -> list:
+    """
+    Builds a payload with raw `Decimal` and aware `datetime` values, as
+    returned by `.values()`, that both renderers must encode.
+    """
+    moment = timezone.now()
+    return [
+        {'id': pk, 'price': Decimal('30.00'), 'date_time': moment,
+         'status': 'active'}
+        for pk in range(1, rows + 1)
+    ]
+
+
+def measure(label: str, function, repeat: int):
+    best = min(timeit.repeat(function, number=1, repeat=repeat))
+    print(f'{label:<55} {best * 1000:10.1f} ms')
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    schedules = build_schedules(args.rows)
+    data = ScheduleSerializer(schedules, many=True).data
+    payload = build_payload(args.rows)
+    services = ServiceSerializer(
+        [schedules[0].service] * args.rows, many=True).data
+
+    print(f'{args.rows} rows, best of {args.repeat}, orjson '
+          f'{"installed" if orjson else "not installed"}\n')
+
+    cases = [
+        ('serialize schedules', lambda: ScheduleSerializer(
+            schedules, many=True).data, None),
+        ('render schedules', lambda renderer: renderer.render(data), data),
+        ('render raw Decimal/datetime values',
+         lambda renderer: renderer.render(payload), payload),
+        ('render services', lambda renderer: renderer.render(services),
+         services),
+    ]
+    for label, function, source in cases:
+        if source is None:
+            measure(label, function, args.repeat)
+            continue
+
+        before = measure(f'{label} (JSONRenderer)',
+                         lambda: function(JSONRenderer()), args.repeat)
+        after = measure(f'{label} (FastJSONRenderer)',
+                        lambda: function(FastJSONRenderer()), args.repeat)
+        print(f'{"speedup":<55} {before / after:10.1f} x\n')
+
+
+if __name__ == '__main__':
+    main()
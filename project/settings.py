@@ -47,12 +47,24 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 30,
+    # orjson is used when installed, see appointments/renderers.py.
+    'DEFAULT_RENDERER_CLASSES': [
+        'appointments.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'appointments.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 
 AUTH_USER_MODEL = 'appointments.CustomUser'
 
 MIDDLEWARE = [
+    # First, so that it measures the other middleware too.
+    'appointments.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -66,7 +78,8 @@ ROOT_URLCONF = 'project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, measuring rendering for REQUEST_TIMING.
+        'BACKEND': 'appointments.utils.timing.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -94,6 +107,44 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The local-memory cache is private to each process. Set REDIS_URL when
+# running several processes or nodes, so that they share invalidations.
+# Without it, the service catalog is only cached for a few seconds, see
+# appointments/services/barber_services.py.
+# The metrics counters get their own alias, see appointments/utils/metrics.py,
+# so that they are never culled to make room for the occupancy bitmaps and
+# the other entries of the default cache. On Redis they are stored without
+# expiry, which the volatile-* and noeviction policies never evict.
+
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'metrics': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'appointments',
+        },
+        'metrics': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'appointments-metrics',
+            # The metrics hold a few hundred keys at most: never cull them.
+            'OPTIONS': {'MAX_ENTRIES': 100_000},
+        },
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -148,3 +199,34 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 
 LOGIN_URL = '/authentication/'
+
+# Backend used by the calendar outbox worker (python manage.py sync_calendar).
+# Use 'appointments.services.google_calendar_service.LocalCalendarBackend' to
+# keep events in memory during development and tests.
+CALENDAR_BACKEND = os.getenv(
+    'CALENDAR_BACKEND',
+    'appointments.services.google_calendar_service.GoogleCalendarBackend')
+
+# Request timing: adds a Server-Timing header to every response and logs the
+# time spent on the database, outbound HTTP and templates per request.
+REQUEST_TIMING = os.getenv('REQUEST_TIMING', '').lower() in ('1', 'true')
+
+# Bearer token required by the /metrics endpoint, when set.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'appointments.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -15,6 +15,7 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from appointments.pages.barber_views import ServiceViewSet
+from appointments.pages.metrics_views import metrics_view
 from appointments.pages.scheduling_views import ScheduleViewSet
 from appointments.views import custom_403_view, custom_404_view
 from rest_framework.routers import DefaultRouter
@@ -38,6 +39,7 @@ urlpatterns = [
     path('', include('appointments.urls')),
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
+    path('metrics', metrics_view, name='metrics'),
     path('contact/', lambda request: render(request,
          'contact_us.html'), name='contact'),
 